@@ -0,0 +1,298 @@
+import logging
+import os
+import re
+import hashlib
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+# Disables SSL warnings
+import requests.packages.urllib3
+
+requests.packages.urllib3.disable_warnings()
+
+HTTP_STATUS_OK = 200
+HTTP_STATUS_PARTIAL_CONTENT = 206
+HTTP_STATUS_RANGE_NOT_SATISFIABLE = 416
+
+# Default chunk size, in bytes, used when streaming files to disk
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# File written to the async results directory by UFrame once the job has finished
+ASYNC_STATUS_FILE = 'status.txt'
+
+_href_regex = re.compile(r'href="([^"?#]+)"', re.IGNORECASE)
+
+
+class AsyncDownloader(object):
+
+    def __init__(self, timeout=120, api_username=None, api_token=None, max_workers=4,
+                 chunk_size=DEFAULT_CHUNK_SIZE, max_retries=3, session=None):
+        """Parallel, resumable downloader for the NetCDF files written by UFrame to the
+        async results file server once an asynchronous request has completed.
+
+        kwargs:
+            timeout: request timeout, in seconds
+            api_username: API username from the UI user settings
+            api_token: API password from the UI user settings
+            max_workers: maximum number of files downloaded concurrently
+            chunk_size: number of bytes read from the socket and written to disk at a time
+            max_retries: number of times an interrupted download is resumed before giving up
+            session: optional requests.Session to use for all requests
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._timeout = timeout
+        self._api_username = api_username
+        self._api_token = api_token
+        self._max_workers = max_workers
+        self._chunk_size = chunk_size
+        self._max_retries = max_retries
+        self._session = session or requests.Session()
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    @max_workers.setter
+    def max_workers(self, workers):
+        if type(workers) != int or workers < 1:
+            self._logger.warning('max_workers must be a positive integer')
+            return
+
+        self._max_workers = workers
+
+    @property
+    def chunk_size(self):
+        return self._chunk_size
+
+    @chunk_size.setter
+    def chunk_size(self, num_bytes):
+        if type(num_bytes) != int or num_bytes < 1:
+            self._logger.warning('chunk_size must be a positive integer')
+            return
+
+        self._chunk_size = num_bytes
+
+    def is_complete(self, async_url):
+        """Return True if the UFrame job writing to the async_url results directory has
+        finished, as indicated by the presence of the status.txt file"""
+
+        status_url = '{:s}/{:s}'.format(async_url.rstrip('/'), ASYNC_STATUS_FILE)
+
+        r = self._get(status_url)
+        if r is None or r.status_code != HTTP_STATUS_OK:
+            return False
+
+        return r.text.lower().find('complete') > -1
+
+    def list_files(self, async_url, pattern=r'\.nc$'):
+        """Return the list of file urls contained in the async_url results directory whose
+        names match the regex pattern (Default is all NetCDF files)"""
+
+        self._logger.debug('Listing async results: {:s}'.format(async_url))
+
+        async_url = async_url.rstrip('/')
+        r = self._get('{:s}/'.format(async_url))
+        if r is None:
+            return []
+
+        if r.status_code != HTTP_STATUS_OK:
+            self._logger.error('Failed to list async results {:s} ({:s})'.format(async_url, r.reason))
+            return []
+
+        file_regex = re.compile(pattern)
+
+        urls = []
+        for href in _href_regex.findall(r.text):
+            name = href.rstrip('/').split('/')[-1]
+            if href.endswith('/') or not file_regex.search(name):
+                continue
+
+            url = '{:s}/{:s}'.format(async_url, name)
+            if url not in urls:
+                urls.append(url)
+
+        return urls
+
+    def download(self, urls, outputdir, checksums=None):
+        """Download all urls to outputdir using up to max_workers concurrent downloads.
+
+        Arguments:
+            urls: list of file urls
+            outputdir: existing directory to which all files are written
+
+        Optional kwargs:
+            checksums: dict mapping file names to expected md5 hex digests
+
+        Returns a list containing one result dict per url, in the same order as urls
+        """
+
+        if not os.path.isdir(outputdir):
+            self._logger.error('Invalid outputdir specified: {:s}'.format(outputdir))
+            return []
+
+        checksums = checksums or {}
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = [executor.submit(self.download_file,
+                                       url,
+                                       outputdir,
+                                       checksums.get(url.split('/')[-1])) for url in urls]
+
+            return [f.result() for f in futures]
+
+    def download_file(self, url, outputdir, md5=None):
+        """Stream the file at url to outputdir in chunk_size pieces.  The file is written
+        to a .part file which is resumed with an HTTP Range request if the transfer is
+        interrupted and renamed once the size, and md5 if specified, have been verified.
+        Files are only hashed if md5 is specified.
+
+        Returns a dict containing the url, path, size, md5 (None unless md5 was specified) and
+        status of the download
+        """
+
+        name = url.rstrip('/').split('/')[-1]
+        result = {'url': url,
+                  'path': os.path.join(outputdir, name),
+                  'size': None,
+                  'md5': None,
+                  'status': 'failed'}
+
+        part_path = '{:s}.part'.format(result['path'])
+
+        # Nothing to do if the file has already been downloaded and verified
+        if os.path.isfile(result['path']):
+            result['size'] = os.path.getsize(result['path'])
+            if md5:
+                result['md5'] = _file_md5(result['path'], self._chunk_size)
+            if md5 and result['md5'] != md5:
+                self._logger.warning('Checksum mismatch for existing file {:s}'.format(result['path']))
+                os.remove(result['path'])
+            else:
+                self._logger.debug('File already downloaded: {:s}'.format(result['path']))
+                result['status'] = 'exists'
+                return result
+
+        expected_size = None
+        for attempt in range(self._max_retries + 1):
+
+            if attempt:
+                self._logger.info('Resuming download ({:d}/{:d}): {:s}'.format(attempt, self._max_retries, url))
+
+            size = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+
+            try:
+                expected_size = self._stream_to_file(url, part_path, size)
+            except (requests.exceptions.RequestException, IOError) as e:
+                self._logger.warning('{:} - {:s}'.format(e, url))
+                continue
+
+            if expected_size is None:
+                # Request failed outright.  Retrying will not help
+                return result
+
+            if os.path.getsize(part_path) >= expected_size:
+                break
+        else:
+            self._logger.error('Download failed after {:d} retries: {:s}'.format(self._max_retries, url))
+            return result
+
+        result['size'] = os.path.getsize(part_path)
+        if result['size'] != expected_size:
+            self._logger.error('Size mismatch for {:s}: {:d} != {:d}'.format(url, result['size'], expected_size))
+            os.remove(part_path)
+            return result
+
+        if md5:
+            result['md5'] = _file_md5(part_path, self._chunk_size)
+        if md5 and result['md5'] != md5:
+            self._logger.error('Checksum mismatch for {:s}: {:s} != {:s}'.format(url, result['md5'], md5))
+            os.remove(part_path)
+            return result
+
+        os.rename(part_path, result['path'])
+        result['status'] = 'downloaded'
+
+        self._logger.debug('Downloaded {:s} ({:d} bytes)'.format(result['path'], result['size']))
+
+        return result
+
+    def _stream_to_file(self, url, path, offset):
+        """Stream url to path, starting at byte offset.  Returns the expected total size
+        of the file or None if the request failed"""
+
+        headers = {}
+        if offset:
+            headers['Range'] = 'bytes={:d}-'.format(offset)
+
+        r = self._get(url, headers=headers, stream=True)
+        if r is None:
+            raise IOError('No response')
+
+        try:
+            if r.status_code == HTTP_STATUS_RANGE_NOT_SATISFIABLE and offset:
+                # The .part file is already complete (or larger than the remote file)
+                total = r.headers.get('Content-Range', '').split('/')[-1]
+                return int(total) if total.isdigit() else offset
+
+            if r.status_code == HTTP_STATUS_PARTIAL_CONTENT:
+                total = r.headers.get('Content-Range', '').split('/')[-1]
+                expected_size = int(total) if total.isdigit() else None
+                mode = 'ab'
+            elif r.status_code == HTTP_STATUS_OK:
+                # Server ignored the Range header, so start from scratch
+                if offset:
+                    self._logger.debug('Range request not honored, restarting download: {:s}'.format(url))
+                length = r.headers.get('Content-Length')
+                expected_size = int(length) if length and length.isdigit() else None
+                mode = 'wb'
+            else:
+                self._logger.error('Request failed {:s} ({:s})'.format(url, r.reason))
+                return None
+
+            with open(path, mode) as fid:
+                for chunk in r.iter_content(chunk_size=self._chunk_size):
+                    if chunk:
+                        fid.write(chunk)
+        finally:
+            r.close()
+
+        # No size reported by the server: trust whatever was written
+        if expected_size is None:
+            expected_size = os.path.getsize(path)
+
+        return expected_size
+
+    def _get(self, url, headers=None, stream=False):
+
+        auth = None
+        if self._api_username and self._api_token:
+            auth = (self._api_username, self._api_token)
+
+        try:
+            self._logger.debug('Sending GET request: {:s}'.format(url))
+            return self._session.get(url,
+                                     auth=auth,
+                                     headers=headers,
+                                     stream=stream,
+                                     timeout=self._timeout,
+                                     verify=False)
+        except (requests.exceptions.ReadTimeout, requests.exceptions.MissingSchema,
+                requests.exceptions.ConnectionError) as e:
+            self._logger.error('{:} - {:s}'.format(e, url))
+            return None
+
+    def __repr__(self):
+        return '<AsyncDownloader(max_workers={:d}, chunk_size={:d})>'.format(self._max_workers, self._chunk_size)
+
+
+def _file_md5(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Return the md5 hex digest of the file at path, read in chunk_size pieces"""
+
+    md5 = hashlib.md5()
+    with open(path, 'rb') as fid:
+        for chunk in iter(lambda: fid.read(chunk_size), b''):
+            md5.update(chunk)
+
+    return md5.hexdigest()
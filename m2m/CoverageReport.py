@@ -0,0 +1,296 @@
+import logging
+import os
+import json
+import time
+import hashlib
+import tempfile
+from collections import OrderedDict
+from m2m.Inventory import Inventory
+from m2m.batch import bulk_fetch
+from m2m.deployments import deployment_records
+from m2m.timeutils import ms_to_uframe_ts
+
+
+class CoverageReport(object):
+
+    def __init__(self, client, cache_dir=None, max_age=86400):
+        """Deployment and data coverage report for any number of instruments, up to the whole
+        observatory.  Stream times are taken from the client inventory, deployments are fetched
+        with one request per subsite and the overlap of every deployment with every stream of an
+        instrument is computed in a single sweep-line pass over the sorted deployment and stream
+        times, so no per-instrument stream requests or per-pair timestamp parsing are needed.
+
+        Reports are cached by inventory version, instruments, deployment status and telemetry
+        type, in memory and, if cache_dir is specified, on disk.  A cached report is used until
+        the inventory changes or the report is older than max_age seconds.
+
+        Parameters:
+            client: UFrameClient or DaemonClient instance
+
+        kwargs:
+            cache_dir: directory containing the cached report files, which is created if it does
+                not exist
+            max_age: number of seconds a cached report is used
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._client = client
+        self._cache_dir = cache_dir
+        self._max_age = max_age
+        self._cache = {}
+
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    @property
+    def client(self):
+        return self._client
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    def report(self, ref_des='', status='all', telemetry=None, max_workers=4, refresh=False):
+        """Return the coverage report dict for the instruments matching the fully or
+        partially-qualified reference designator (Default is all instruments), containing the
+        inventory_version, the created time, the summary counts and the coverage records, one for
+        each deployment of each stream.  See instrument_coverage for the record fields.
+
+        Arguments:
+            ref_des: fully or partially-qualified reference designator
+            status: deployment status (all, active or inactive)
+            telemetry: if specified, only streams whose method contains telemetry are included
+            max_workers: maximum number of concurrent deployment requests
+            refresh: set to True to ignore any cached report
+        """
+
+        inventory = self._inventory()
+        instruments = inventory.search_instruments(ref_des)
+
+        key = hashlib.sha1(json.dumps([self._client.base_url,
+                                       inventory.version,
+                                       instruments,
+                                       status,
+                                       telemetry]).encode('utf-8')).hexdigest()
+
+        if not refresh:
+            cached = self._cached_report(key)
+            if cached:
+                self._logger.debug('Using cached coverage report {:s}'.format(key))
+                return cached
+
+        now = int(time.time() * 1000)
+
+        records = []
+        for instrument, deployments in self._fetch_deployments(instruments, max_workers):
+            deployments = [r for r in deployments if status == 'all' or r.active == (status == 'active')]
+            if not deployments:
+                continue
+            streams = [r for r in inventory.instrument_streams(instrument)
+                       if not telemetry or r.method.find(telemetry) > -1]
+            records.extend(instrument_coverage(instrument, deployments, streams, now))
+
+        report = {'uframe': self._client.base_url,
+                  'inventory_version': inventory.version,
+                  'created': ms_to_uframe_ts(now),
+                  'status': status,
+                  'telemetry': telemetry,
+                  'summary': summarize_coverage(records),
+                  'coverage': records}
+
+        self._cache_report(key, report)
+
+        return report
+
+    def _inventory(self):
+        """Return the client Inventory or, for a DaemonClient, an Inventory built from the table
+        of contents"""
+
+        inventory = getattr(self._client, 'inventory', None)
+        if inventory is not None:
+            return inventory
+
+        inventory = Inventory()
+        toc = self._client.toc or {'instruments': []}
+        for instrument in toc['instruments']:
+            inventory.add_instrument(instrument)
+
+        return inventory
+
+    def _fetch_deployments(self, instruments, max_workers):
+        """Yield the (ref_des, DeploymentRecords) tuple of each instrument that has deployments.  The
+        deployments of all instruments on a subsite are fetched with a single request"""
+
+        subsites = OrderedDict()
+        for instrument in instruments:
+            subsites.setdefault(instrument.split('-')[0], []).append(instrument)
+
+        # Query single instruments directly rather than their whole subsite
+        queries = [i[0] if len(i) == 1 else s for s, i in subsites.items()]
+
+        for query, deployments in bulk_fetch(self._client, 'deployments', queries, max_workers=max_workers):
+            if deployments is None:
+                self._logger.warning('Failed to fetch {:s} deployments'.format(query))
+                continue
+
+            instrument_deployments = OrderedDict([(i, []) for i in subsites.get(query, [query])])
+            for r in deployment_records(deployments):
+                if r.reference_designator in instrument_deployments:
+                    instrument_deployments[r.reference_designator].append(r)
+
+            for ref_des, ref_des_deployments in instrument_deployments.items():
+                if ref_des_deployments:
+                    yield ref_des, ref_des_deployments
+
+    def _cached_report(self, key):
+
+        cached = self._cache.get(key)
+        if not cached and self._cache_dir:
+            cache_file = self._cache_file(key)
+            if os.path.isfile(cache_file):
+                try:
+                    with open(cache_file, 'r') as fid:
+                        cached = (os.path.getmtime(cache_file), json.load(fid, object_pairs_hook=OrderedDict))
+                except (IOError, ValueError) as e:
+                    self._logger.warning('Invalid cached report {:s} ({:})'.format(cache_file, e))
+
+        if not cached or time.time() - cached[0] > self._max_age:
+            return None
+
+        self._cache[key] = cached
+
+        return cached[1]
+
+    def _cache_report(self, key, report):
+
+        self._cache[key] = (time.time(), report)
+        if not self._cache_dir:
+            return
+
+        (fd, tmp_path) = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fid:
+                json.dump(report, fid)
+            os.rename(tmp_path, self._cache_file(key))
+        except (IOError, OSError) as e:
+            self._logger.warning('Unable to cache coverage report ({:})'.format(e))
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+    def _cache_file(self, key):
+        return os.path.join(self._cache_dir, 'coverage-{:s}.json'.format(key))
+
+    def __repr__(self):
+        return '<CoverageReport(client={:}, cache_dir={:})>'.format(self._client, self._cache_dir)
+
+
+def instrument_coverage(ref_des, deployments, streams, now):
+    """Return the list of coverage records, one for each deployment of each stream, for the
+    fully-qualified reference designator.  Each record contains the deployment and stream times,
+    whether the deployment is active, the number of milliseconds of the deployment covered by
+    the stream, the coverage_percent, the deployment_has_particles flag, which is set if the
+    stream and deployment times intersect (including a stream with a single particle, which covers
+    no milliseconds), and the missing_start and missing_end flags, which are set if the stream
+    begins after the deployment began or ends before the deployment ended (or now, if it is
+    active).
+
+    Arguments:
+        ref_des: fully-qualified reference designator
+        deployments: list of DeploymentRecords
+        streams: list of StreamRecords
+        now: current time, in milliseconds since 1970-01-01
+    """
+
+    # Deployment windows.  Active deployments end now.  Deployments that start in the future
+    # have an empty window
+    windows = []
+    for d in deployments:
+        if not d.start_time:
+            continue
+        d1 = min(d.stop_time, now) if d.stop_time else now
+        windows.append((d, d.start_time, max(d.start_time, d1), d.active))
+
+    overlaps = sweep_overlaps([(w[1], w[2]) for w in windows], [(s.begin_time, s.end_time) for s in streams])
+
+    records = []
+    for i, (d, d0, d1, active) in enumerate(windows):
+        for j, s in enumerate(streams):
+            overlap = overlaps.get((i, j), 0)
+
+            record = OrderedDict()
+            record['reference_designator'] = ref_des
+            record['stream'] = s.stream
+            record['telemetry'] = s.method
+            record['deployment_number'] = d.deployment_number
+            record['active'] = active
+            record['deployment_start_time'] = ms_to_uframe_ts(d0)
+            record['deployment_end_time'] = ms_to_uframe_ts(d.stop_time) if d.stop_time else None
+            record['stream_start_time'] = s.beginTime
+            record['stream_end_time'] = s.endTime
+            record['stream_particle_count'] = s.count
+            record['covered_ms'] = overlap
+            record['coverage_percent'] = round(100.0 * overlap / (d1 - d0), 2) if d1 > d0 else 0.0
+            # Closed intervals, so a stream with a single particle in the deployment has particles
+            record['deployment_has_particles'] = (s.end_time >= d.start_time and
+                                                  (not d.stop_time or s.begin_time <= d.stop_time))
+            record['missing_start'] = s.begin_time > d0
+            record['missing_end'] = s.end_time < d1
+
+            records.append(record)
+
+    return records
+
+
+def sweep_overlaps(windows, intervals):
+    """Return the dict mapping each (window index, interval index) pair to the length of the
+    overlap of the window and interval, for all pairs that overlap.  windows and intervals are
+    lists of (begin, end) tuples.  The begin and end points of all windows and intervals are
+    swept once in time order, keeping the sets of open windows and intervals, so the cost is
+    proportional to the number of points plus the number of overlapping pairs.  Empty or reversed
+    windows and intervals (end <= begin) overlap nothing and are skipped"""
+
+    windows = [(i, t0, t1) for i, (t0, t1) in enumerate(windows) if t1 > t0]
+    intervals = [(j, t0, t1) for j, (t0, t1) in enumerate(intervals) if t1 > t0]
+
+    # Ends sort before begins at the same time, so touching intervals do not overlap
+    points = [(t1, 0, 0, i) for i, t0, t1 in windows] + \
+             [(t1, 0, 1, j) for j, t0, t1 in intervals] + \
+             [(t0, 1, 0, i) for i, t0, t1 in windows] + \
+             [(t0, 1, 1, j) for j, t0, t1 in intervals]
+    points.sort()
+
+    open_sets = (set(), set())
+    opened = {}
+    overlaps = {}
+    for t, is_begin, kind, index in points:
+        if is_begin:
+            # The overlap begins when the later of the window and interval begins
+            for other in open_sets[1 - kind]:
+                pair = (index, other) if kind == 0 else (other, index)
+                opened[pair] = t
+            open_sets[kind].add(index)
+            continue
+
+        open_sets[kind].discard(index)
+        for other in open_sets[1 - kind]:
+            pair = (index, other) if kind == 0 else (other, index)
+            overlaps[pair] = t - opened.pop(pair)
+
+    return dict([(pair, overlap) for pair, overlap in overlaps.items() if overlap > 0])
+
+
+def summarize_coverage(records):
+    """Return the dict of counts and the mean coverage_percent of the coverage records"""
+
+    instruments = set([r['reference_designator'] for r in records])
+    deployments = set([(r['reference_designator'], r['deployment_number']) for r in records])
+
+    return {'instruments': len(instruments),
+            'deployments': len(deployments),
+            'deployment_streams': len(records),
+            'without_particles': len([r for r in records if not r['deployment_has_particles']]),
+            'missing_start': len([r for r in records if r['missing_start']]),
+            'missing_end': len([r for r in records if r['missing_end']]),
+            'mean_coverage_percent': round(sum([r['coverage_percent'] for r in records]) / len(records), 2)
+            if records else 0.0}
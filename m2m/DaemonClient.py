@@ -0,0 +1,117 @@
+import logging
+import json
+import socket
+from m2m.MetadataDaemon import DEFAULT_SOCKET, DAEMON_METHODS, DAEMON_PROPERTIES, is_daemon_running
+
+
+class DaemonClient(object):
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=120):
+        """Proxy for the UFrameClient held by a running MetadataDaemon.  Supports the methods in
+        DAEMON_METHODS, the properties in DAEMON_PROPERTIES and the last request properties, so it
+        may be used in place of a UFrameClient for lookups.  Raises socket.error if the daemon is
+        not running.
+
+        Parameters:
+            socket_path: path of the daemon Unix socket
+            timeout: response timeout, in seconds
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._socket_path = socket_path
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(socket_path)
+        self._rfile = self._sock.makefile('rb')
+
+        # properties for last request
+        self._request_url = None
+        self._status_code = None
+        self._reason = None
+
+    @property
+    def socket_path(self):
+        return self._socket_path
+
+    @property
+    def last_request_url(self):
+        return self._request_url
+
+    @property
+    def last_status_code(self):
+        return self._status_code
+
+    @property
+    def last_reason(self):
+        return self._reason
+
+    def call(self, method, *args, **kwargs):
+        """Send the method call to the daemon and return the result.  Returns None if the daemon
+        reported an error"""
+
+        request = json.dumps({'method': method, 'args': args, 'kwargs': kwargs})
+        self._sock.sendall('{:s}\n'.format(request).encode('utf-8'))
+
+        line = self._rfile.readline()
+        if not line:
+            self._logger.error('Daemon closed the connection ({:s})'.format(self._socket_path))
+            return None
+
+        response = json.loads(line.decode('utf-8'))
+        if 'error' in response:
+            self._logger.error('{:s}: {:s}'.format(method, response['error']))
+            return None
+
+        last = response.get('last', {})
+        self._request_url = last.get('request_url')
+        self._status_code = last.get('status_code')
+        self._reason = last.get('reason')
+
+        return response['result']
+
+    def close(self):
+
+        self._rfile.close()
+        self._sock.close()
+
+    def __getattr__(self, name):
+
+        if name in DAEMON_PROPERTIES:
+            return self.call(name)
+        if name in DAEMON_METHODS:
+            return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+        raise AttributeError('{:s} is not available through the daemon'.format(name))
+
+    def __repr__(self):
+        return '<DaemonClient(socket_path={:s})>'.format(self._socket_path)
+
+
+def connect_client(base_url, m2m=True, timeout=120, api_username=None, api_token=None, stream_toc=True,
+                   socket_path=DEFAULT_SOCKET):
+    """Return a DaemonClient if a MetadataDaemon serving base_url is running on socket_path.
+    Otherwise, return a new UFrameClient created with the remaining arguments"""
+
+    logger = logging.getLogger(__name__)
+
+    if is_daemon_running(socket_path):
+        try:
+            client = DaemonClient(socket_path, timeout=timeout)
+            if client.base_url == base_url.strip('/') and client.is_m2m == m2m:
+                logger.debug('Using daemon on {:s}'.format(socket_path))
+                return client
+            logger.debug('Daemon on {:s} serves a different UFrame instance'.format(socket_path))
+            client.close()
+        except (socket.error, ValueError) as e:
+            logger.warning('Unable to use daemon on {:s} ({:})'.format(socket_path, e))
+
+    # Only import the client, and requests, when the daemon is not available
+    from m2m.UFrameClient import UFrameClient
+
+    return UFrameClient(base_url,
+                        m2m=m2m,
+                        timeout=timeout,
+                        api_username=api_username,
+                        api_token=api_token,
+                        stream_toc=stream_toc)
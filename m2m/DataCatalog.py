@@ -0,0 +1,277 @@
+import logging
+import os
+import re
+import sqlite3
+import time
+from m2m.timeutils import iso_to_ms, ms_to_iso, to_ms, merge_intervals, interval_gaps
+from m2m.StreamSync import key_from_url
+
+# Default number of milliseconds between covered intervals that is not reported as a gap
+DEFAULT_TOLERANCE = 1000
+
+_window_regex = re.compile(r'[?&]beginDT=([^&]+)&endDT=([^&]+)')
+
+# UFrame NetCDF file names:
+# deployment0001_CE02SHSM-RID27-03-CTDBPC000-telemetered-ctdbp_cdef_dcl_instrument_20170101T000000.012000-20170331T235959.924000.nc
+_nc_regex = re.compile(
+    r'^deployment(\d+)_(\w+-\w+-\w+-\w+)-(\w+?)-(\w+)_(\d{8}T\d{6}(?:\.\d+)?)-(\d{8}T\d{6}(?:\.\d+)?)\.nc$')
+
+_schema = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    path TEXT PRIMARY KEY,
+    ref_des TEXT NOT NULL,
+    method TEXT NOT NULL,
+    stream TEXT NOT NULL,
+    deployment INTEGER,
+    begin_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL,
+    size INTEGER,
+    md5 TEXT,
+    registered INTEGER
+);
+CREATE INDEX IF NOT EXISTS deliveries_stream_time ON deliveries (ref_des, method, stream, begin_time, end_time);
+CREATE INDEX IF NOT EXISTS deliveries_time ON deliveries (begin_time, end_time);
+CREATE TABLE IF NOT EXISTS windows (
+    ref_des TEXT NOT NULL,
+    method TEXT NOT NULL,
+    stream TEXT NOT NULL,
+    begin_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL,
+    registered INTEGER,
+    UNIQUE (ref_des, method, stream, begin_time, end_time)
+);
+CREATE TABLE IF NOT EXISTS tolerances (
+    ref_des TEXT NOT NULL,
+    method TEXT NOT NULL,
+    stream TEXT NOT NULL,
+    tolerance INTEGER NOT NULL,
+    PRIMARY KEY (ref_des, method, stream)
+);
+"""
+
+
+def parse_nc_filename(path):
+    """Parse the reference designator, method, stream, deployment number and time coverage
+    from a UFrame NetCDF file name.  Returns a dict or None if the file name does not follow
+    the UFrame naming convention"""
+
+    match = _nc_regex.match(os.path.basename(path))
+    if not match:
+        return None
+
+    return {'deployment': int(match.group(1)),
+            'ref_des': match.group(2),
+            'method': match.group(3),
+            'stream': match.group(4),
+            'begin_time': iso_to_ms(match.group(5)),
+            'end_time': iso_to_ms(match.group(6))}
+
+
+class DataCatalog(object):
+
+    def __init__(self, db_path):
+        """SQLite catalog of the UFrame NetCDF files downloaded to local disk, indexed by
+        reference designator, method, stream and time coverage, and of the time windows that
+        were requested.  The coverage of a stream is the union of the file time ranges and the
+        requested windows.  All times are stored as integer milliseconds since 1970-01-01.
+
+        Parameters:
+            db_path: path to the SQLite database file, which is created if it does not exist
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._db_path = db_path
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript(_schema)
+
+    @property
+    def db_path(self):
+        return self._db_path
+
+    def register_file(self, path, ref_des=None, method=None, stream=None, begin_time=None, end_time=None,
+                      md5=None):
+        """Add the NetCDF file at path to the catalog.  The reference designator, method,
+        stream and time coverage are parsed from the UFrame file name unless specified.
+        begin_time and end_time may be ISO-8601 timestamps or integer milliseconds.
+
+        Returns True if the file was registered"""
+
+        path = os.path.realpath(path)
+        if not os.path.isfile(path):
+            self._logger.error('Invalid file specified: {:s}'.format(path))
+            return False
+
+        meta = parse_nc_filename(path) or {'deployment': None}
+        meta['ref_des'] = ref_des or meta.get('ref_des')
+        meta['method'] = method or meta.get('method')
+        meta['stream'] = stream or meta.get('stream')
+        if begin_time is not None:
+            meta['begin_time'] = to_ms(begin_time)
+        if end_time is not None:
+            meta['end_time'] = to_ms(end_time)
+
+        for k in ['ref_des', 'method', 'stream', 'begin_time', 'end_time']:
+            if meta.get(k) is None:
+                self._logger.warning('Cannot determine {:s} for {:s}'.format(k, path))
+                return False
+
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO deliveries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             (path,
+                              meta['ref_des'],
+                              meta['method'],
+                              meta['stream'],
+                              meta['deployment'],
+                              meta['begin_time'],
+                              meta['end_time'],
+                              os.path.getsize(path),
+                              md5,
+                              int(time.time())))
+
+        return True
+
+    def register_directory(self, path):
+        """Register all UFrame NetCDF files found under the path directory.  Returns the
+        number of files registered"""
+
+        count = 0
+        for root, dirs, files in os.walk(path):
+            for f in files:
+                if not f.endswith('.nc') or not _nc_regex.match(f):
+                    continue
+                if self.register_file(os.path.join(root, f)):
+                    count += 1
+
+        return count
+
+    def register_downloads(self, results):
+        """Register the files successfully downloaded by AsyncDownloader.download or
+        UFrameClient.download_async_results.  Returns the number of files registered"""
+
+        count = 0
+        for result in results or []:
+            if result['status'] == 'failed':
+                continue
+            if self.register_file(result['path'], md5=result['md5']):
+                count += 1
+
+        return count
+
+    def register_window(self, ref_des, method, stream, begin_time, end_time):
+        """Record the begin_time - end_time window of ref_des-method-stream as requested, so the
+        whole window is covered even though the particle times in the files delivered for it do
+        not reach its ends.  begin_time and end_time may be ISO-8601 timestamps or integer
+        milliseconds"""
+
+        with self._db:
+            self._db.execute('INSERT OR IGNORE INTO windows VALUES (?, ?, ?, ?, ?, ?)',
+                             (ref_des, method, stream, to_ms(begin_time), to_ms(end_time), int(time.time())))
+
+    def register_request(self, url):
+        """Record the time window of the UFrame data request url as requested.  Returns True if
+        the window was registered"""
+
+        key = key_from_url(url)
+        match = _window_regex.search(url)
+        if not key or not match:
+            self._logger.warning('Not a data request url: {:s}'.format(url))
+            return False
+
+        try:
+            self.register_window(key[0], key[1], key[2], match.group(1), match.group(2))
+        except ValueError as e:
+            self._logger.warning('Invalid request window ({:}): {:s}'.format(e, url))
+            return False
+
+        return True
+
+    def set_tolerance(self, ref_des, method, stream, tolerance):
+        """Set the number of milliseconds between covered intervals of ref_des-method-stream that
+        are not reported as gaps, i.e.: the sample interval of the stream"""
+
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO tolerances VALUES (?, ?, ?, ?)',
+                             (ref_des, method, stream, int(tolerance)))
+
+    def tolerance(self, ref_des, method, stream):
+        """Return the gap tolerance of ref_des-method-stream, in milliseconds (Default is
+        DEFAULT_TOLERANCE)"""
+
+        row = self._db.execute('SELECT tolerance FROM tolerances WHERE ref_des = ? AND method = ? AND stream = ?',
+                               (ref_des, method, stream)).fetchone()
+
+        return row[0] if row else DEFAULT_TOLERANCE
+
+    def prune(self):
+        """Remove catalog entries for files that no longer exist on disk.  Returns the
+        number of entries removed"""
+
+        paths = [r[0] for r in self._db.execute('SELECT path FROM deliveries') if not os.path.isfile(r[0])]
+        with self._db:
+            self._db.executemany('DELETE FROM deliveries WHERE path = ?', [(p,) for p in paths])
+
+        return len(paths)
+
+    def files(self, ref_des, method=None, stream=None, begin_time=None, end_time=None):
+        """Return the list of catalog entries for the reference designator, optionally
+        restricted to method, stream and files overlapping begin_time - end_time"""
+
+        sql = 'SELECT path, ref_des, method, stream, deployment, begin_time, end_time, size, md5 FROM deliveries ' \
+              'WHERE ref_des = ?'
+        values = [ref_des]
+        if method:
+            sql += ' AND method = ?'
+            values.append(method)
+        if stream:
+            sql += ' AND stream = ?'
+            values.append(stream)
+        if end_time is not None:
+            sql += ' AND begin_time < ?'
+            values.append(to_ms(end_time))
+        if begin_time is not None:
+            sql += ' AND end_time > ?'
+            values.append(to_ms(begin_time))
+        sql += ' ORDER BY begin_time'
+
+        cols = ['path', 'ref_des', 'method', 'stream', 'deployment', 'begin_time', 'end_time', 'size', 'md5']
+
+        return [dict(zip(cols, row)) for row in self._db.execute(sql, values)]
+
+    def coverage(self, ref_des, method, stream):
+        """Return the sorted list of disjoint (begin_time, end_time) intervals, in
+        milliseconds, covered by the files on disk and the requested windows of
+        ref_des-method-stream.  Only overlapping or touching intervals are merged"""
+
+        sql = 'SELECT begin_time, end_time FROM {:s} WHERE ref_des = ? AND method = ? AND stream = ?'
+        values = (ref_des, method, stream)
+
+        return merge_intervals(self._db.execute(sql.format('deliveries'), values).fetchall() +
+                               self._db.execute(sql.format('windows'), values).fetchall())
+
+    def gaps(self, ref_des, method, stream, begin_time, end_time, tolerance=None):
+        """Return the list of (begin_time, end_time) intervals, in milliseconds, between
+        begin_time and end_time that are not covered by files on disk or requested windows.
+        begin_time and end_time may be ISO-8601 timestamps or integer milliseconds.  Gaps no
+        longer than tolerance milliseconds (Default is the stream tolerance, see set_tolerance)
+        are ignored"""
+
+        if tolerance is None:
+            tolerance = self.tolerance(ref_des, method, stream)
+
+        return interval_gaps(self.coverage(ref_des, method, stream),
+                             to_ms(begin_time),
+                             to_ms(end_time),
+                             tolerance=tolerance)
+
+    def gap_timestamps(self, ref_des, method, stream, begin_time, end_time, tolerance=None):
+        """Same as gaps, but the intervals are returned as ISO-8601 request timestamps"""
+
+        return [(ms_to_iso(t0), ms_to_iso(t1)) for t0, t1 in
+                self.gaps(ref_des, method, stream, begin_time, end_time, tolerance=tolerance)]
+
+    def close(self):
+        self._db.close()
+
+    def __repr__(self):
+        return '<DataCatalog(db_path={:s})>'.format(self._db_path)
@@ -0,0 +1,267 @@
+import logging
+import hashlib
+from array import array
+from m2m.records import StreamRecord, stream_records
+
+
+class Inventory(object):
+
+    def __init__(self):
+        """Compact index of the instruments and streams in the UFrame table of contents.  Each
+        instrument-stream pair is stored as a StreamRecord whose reference designator, method
+        and stream strings are interned, so each distinct string is stored once, and whose
+        begin and end times are integer milliseconds.  Instruments are assigned integer ids in
+        the order they are added.  The parameters_by_stream pdIds are stored as integer arrays.
+        The instrument and stream lists and the rebuilt table of contents are built on demand and
+        cached until the inventory changes"""
+
+        self._logger = logging.getLogger(__name__)
+
+        self._strings = {}
+        self._instrument_ids = {}
+        self._instrument_names = []
+        # Stream records for each instrument, indexed by instrument id
+        self._instrument_records = []
+        self._parameters_by_stream = {}
+        self._parameter_definitions = []
+
+        self._instruments = None
+        self._streams = None
+        self._version = None
+        self._toc = None
+
+    def intern(self, s):
+        """Return the single stored copy of string s"""
+
+        return self._strings.setdefault(s, s)
+
+    @property
+    def instruments(self):
+        """Sorted list of reference designators"""
+
+        if self._instruments is None:
+            self._instruments = sorted([self._instrument_names[i] for i, records in
+                                        enumerate(self._instrument_records) if records])
+        return self._instruments
+
+    @property
+    def streams(self):
+        """Sorted list of unique stream names"""
+
+        if self._streams is None:
+            self._streams = sorted(set([r.stream for records in self._instrument_records for r in records]))
+        return self._streams
+
+    @property
+    def version(self):
+        """Digest of all stream records, which changes whenever an instrument stream is added,
+        removed or changes.  Used to key results computed from the inventory"""
+
+        if self._version is None:
+            h = hashlib.sha1()
+            for ref_des in self.instruments:
+                for r in sorted(self.instrument_streams(ref_des), key=lambda r: r.key):
+                    h.update('{:s}|{:s}|{:s}|{:}|{:d}|{:d}\n'.format(r.reference_designator,
+                                                                   r.method,
+                                                                   r.stream,
+                                                                   r.count,
+                                                                   r.begin_time,
+                                                                   r.end_time).encode('utf-8'))
+            self._version = h.hexdigest()
+        return self._version
+
+    @property
+    def parameters_by_stream(self):
+        """dict mapping each stream to the list of integer pdIds of the parameters it contains"""
+        return self._parameters_by_stream
+
+    @property
+    def parameter_definitions(self):
+        return self._parameter_definitions
+
+    def __len__(self):
+        """Number of instrument-stream pairs"""
+        return sum([len(records) for records in self._instrument_records])
+
+    def __contains__(self, ref_des):
+        return bool(self.instrument_streams(ref_des))
+
+    def instrument_id(self, ref_des):
+        """Return the integer id of the fully-qualified reference designator, or None if the
+        instrument is not in the inventory"""
+
+        return self._instrument_ids.get(ref_des)
+
+    def add_instrument(self, instrument):
+        """Add the streams in the table of contents instrument entry to the inventory.  Streams
+        with unparseable times are skipped.  Returns the list of stream records added"""
+
+        ref_des = self.intern(instrument['reference_designator'])
+
+        records = stream_records(ref_des, instrument['streams'], intern=self.intern)
+
+        self.set_instrument_streams(ref_des, records)
+
+        return records
+
+    def set_instrument_streams(self, ref_des, records):
+        """Replace the stream records of the fully-qualified reference designator.  An empty list
+        removes the instrument from the inventory"""
+
+        instrument_id = self._instrument_ids.get(ref_des)
+        if instrument_id is None:
+            if not records:
+                return
+            instrument_id = len(self._instrument_names)
+            self._instrument_ids[ref_des] = instrument_id
+            self._instrument_names.append(ref_des)
+            self._instrument_records.append([])
+
+        self._instrument_records[instrument_id] = list(records)
+
+        self._instruments = None
+        self._streams = None
+        self._version = None
+        self._toc = None
+
+    def set_parameters(self, parameters_by_stream, parameter_definitions):
+        """Store the table of contents parameters_by_stream, with the PD prefix removed from each
+        pdId, and parameter_definitions"""
+
+        self._parameters_by_stream = dict([(self.intern(stream), array('i', [_pd_number(pd) for pd in pd_ids]))
+                                           for stream, pd_ids in parameters_by_stream.items()])
+        self._parameter_definitions = parameter_definitions
+        self._toc = None
+
+    def update(self, other):
+        """Diff the inventory against the other, more recent, inventory by instrument and stream and
+        apply the differences, leaving unchanged instruments untouched.  Returns the list of change
+        dicts, each containing the event type (instrument_added, instrument_removed, stream_added,
+        stream_removed or stream_changed), the reference_designator and, for stream events, the
+        method, stream and the old and/or new stream metadata"""
+
+        changes = []
+
+        for ref_des in self.instruments:
+            if ref_des not in other:
+                changes.append({'event': 'instrument_removed', 'reference_designator': ref_des})
+                changes.extend([_stream_change('stream_removed', r, None) for r in self.instrument_streams(ref_des)])
+                self.set_instrument_streams(ref_des, [])
+
+        for ref_des in other.instruments:
+            old_records = dict([(r.key, r) for r in self.instrument_streams(ref_des)])
+            new_records = other.instrument_streams(ref_des)
+
+            instrument_changes = []
+            if not old_records:
+                instrument_changes.append({'event': 'instrument_added', 'reference_designator': ref_des})
+
+            for record in new_records:
+                old = old_records.pop(record.key, None)
+                if old is None:
+                    instrument_changes.append(_stream_change('stream_added', None, record))
+                elif old != record:
+                    instrument_changes.append(_stream_change('stream_changed', old, record))
+
+            instrument_changes.extend([_stream_change('stream_removed', r, None) for r in old_records.values()])
+
+            if not instrument_changes:
+                continue
+
+            changes.extend(instrument_changes)
+            self.set_instrument_streams(self.intern(ref_des),
+                                        [StreamRecord(self.intern(r.reference_designator),
+                                                      self.intern(r.method),
+                                                      self.intern(r.stream),
+                                                      r.count,
+                                                      r.begin_time,
+                                                      r.end_time) for r in new_records])
+
+        self._parameters_by_stream = other.parameters_by_stream
+        self._parameter_definitions = other.parameter_definitions
+        self._toc = None
+
+        return changes
+
+    def instrument_streams(self, ref_des):
+        """Return the list of stream records for the fully-qualified reference designator"""
+
+        instrument_id = self._instrument_ids.get(ref_des)
+        if instrument_id is None:
+            return []
+
+        return self._instrument_records[instrument_id]
+
+    def records(self):
+        """Iterate over all stream records"""
+
+        for records in self._instrument_records:
+            for record in records:
+                yield record
+
+    def search_instruments(self, ref_des):
+        """Return the sorted list of reference designators containing the fully or
+        partially-qualified ref_des string"""
+
+        return [i for i in self.instruments if i.find(ref_des) > -1]
+
+    def stream_to_instruments(self, stream):
+        """Return the list of instrument/stream dicts for the streams whose name contains the
+        full or partial stream name"""
+
+        return [{'instrument': r.reference_designator, 'stream': r.stream} for r in self.records()
+                if r.stream.find(stream) > -1]
+
+    def to_toc(self):
+        """Rebuild the table of contents dict from the inventory.  The dict is cached until the
+        inventory changes and is shared by all callers, so it must not be modified.
+
+        Only the fields stored in the inventory are rebuilt.  Instrument entries contain the
+        reference_designator, the platform_code, mooring_code and instrument_code derived from
+        it, and the streams.  Stream entries contain the sensor, method, stream, count, beginTime
+        and endTime.  All other fields of the UFrame instrument and stream entries are dropped
+        when the inventory is built.  parameters_by_stream and parameter_definitions are returned
+        as stored"""
+
+        if self._toc is not None:
+            return self._toc
+
+        instruments = []
+        for ref_des in self.instruments:
+            r_tokens = ref_des.split('-')
+            instruments.append({'reference_designator': ref_des,
+                                'platform_code': r_tokens[0],
+                                'mooring_code': r_tokens[1],
+                                'instrument_code': '-'.join(r_tokens[2:]),
+                                'streams': [r.to_dict() for r in self.instrument_streams(ref_des)]})
+
+        self._toc = {'instruments': instruments,
+                     'parameters_by_stream': dict([(stream, ['PD{:d}'.format(pd) for pd in pd_ids])
+                                                   for stream, pd_ids in self._parameters_by_stream.items()]),
+                     'parameter_definitions': self._parameter_definitions}
+
+        return self._toc
+
+    def __repr__(self):
+        return '<Inventory(instruments={:d}, streams={:d})>'.format(len(self.instruments), len(self.streams))
+
+
+def _stream_change(event, old, new):
+
+    record = new or old
+    change = {'event': event,
+              'reference_designator': record.reference_designator,
+              'method': record.method,
+              'stream': record.stream}
+    if old:
+        change['old'] = {'beginTime': old.beginTime, 'endTime': old.endTime, 'count': old.count}
+    if new:
+        change['new'] = {'beginTime': new.beginTime, 'endTime': new.endTime, 'count': new.count}
+
+    return change
+
+
+def _pd_number(pd_id):
+    """Convert a PD7 style pdId to the integer 7"""
+
+    return int(str(pd_id).lstrip('PD'))
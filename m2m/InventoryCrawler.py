@@ -0,0 +1,298 @@
+import logging
+import os
+import json
+import glob
+import tempfile
+import datetime
+import multiprocessing
+from m2m.UFrameClient import UFrameClient
+from m2m.deployments import deployment_ref_des
+
+# Snapshot file format version.  Incremented whenever the snapshot layout changes
+SNAPSHOT_VERSION = 1
+
+# Client created by _init_worker in each crawler process
+_worker_client = None
+
+
+class InventoryCrawler(object):
+
+    def __init__(self, base_url, work_dir, m2m=True, timeout=120, api_username=None, api_token=None,
+                 processes=4, max_workers=4):
+        """Harvests the full UFrame metadata inventory: the subsites, nodes and sensors registered in
+        the sensor inventory, the streams and parameters of each sensor and the deployment events of
+        each subsite in the sensor or deployment inventory.  The work is sharded by subsite across a
+        pool of processes, each with its own client and connection pool, and each process fetches
+        the metadata of up to max_workers sensors concurrently.
+
+        Each completed shard is written to its own file in work_dir/shards, so an interrupted crawl
+        resumes with the shards that have not been written.  merge() combines the shards into a
+        single versioned snapshot file.
+
+        Parameters:
+            base_url: UFrame API base url
+            work_dir: directory containing the shard files, which is created if it does not exist
+
+        kwargs:
+            m2m, timeout, api_username, api_token: see UFrameClient
+            processes: number of crawler processes
+            max_workers: number of concurrent metadata requests sent by each process
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._base_url = base_url
+        self._work_dir = work_dir
+        self._shard_dir = os.path.join(work_dir, 'shards')
+        self._processes = processes
+        self._max_workers = max_workers
+
+        self._client_kwargs = {'m2m': m2m,
+                               'timeout': timeout,
+                               'api_username': api_username,
+                               'api_token': api_token}
+
+    @property
+    def base_url(self):
+        return self._base_url
+
+    @property
+    def work_dir(self):
+        return self._work_dir
+
+    @property
+    def shard_dir(self):
+        return self._shard_dir
+
+    def shard_path(self, subsite):
+        """Return the path of the shard file for the subsite"""
+
+        return os.path.join(self._shard_dir, '{:s}.json'.format(subsite))
+
+    def list_shards(self):
+        """Return the sorted list of subsites whose shard has been written"""
+
+        return sorted([os.path.basename(f)[:-5] for f in glob.glob(os.path.join(self._shard_dir, '*.json'))])
+
+    def crawl(self, subsites=None, force=False):
+        """Crawl each subsite in the sensor and deployment inventories, skipping the subsites whose
+        shard has already been written unless force is True.  Returns a dict containing the lists
+        of crawled, skipped and failed subsites, or None if the subsites could not be fetched.
+
+        Arguments:
+            subsites: if specified, only the subsites containing one of these strings are crawled
+            force: set to True to crawl subsites whose shard has already been written
+        """
+
+        client = UFrameClient(self._base_url, inventory=False, **self._client_kwargs)
+        if not client.base_url:
+            return None
+
+        sensor_subsites = client.fetch_subsites()
+        if sensor_subsites is None:
+            self._logger.error('Failed to fetch sensor inventory subsites')
+            return None
+
+        deployment_subsites = client.fetch_deployment_subsites()
+        if deployment_subsites is None:
+            self._logger.error('Failed to fetch deployment inventory subsites')
+            return None
+
+        all_subsites = sorted(set(sensor_subsites + deployment_subsites))
+        if subsites:
+            all_subsites = [s for s in all_subsites if [t for t in subsites if s.find(t) > -1]]
+
+        if not os.path.isdir(self._shard_dir):
+            os.makedirs(self._shard_dir)
+
+        status = {'crawled': [], 'skipped': [], 'failed': []}
+
+        tasks = []
+        for subsite in all_subsites:
+            if not force and os.path.isfile(self.shard_path(subsite)):
+                status['skipped'].append(subsite)
+                continue
+            tasks.append({'subsite': subsite,
+                          'sensor_inventory': subsite in sensor_subsites,
+                          'deployment_inventory': subsite in deployment_subsites,
+                          'shard_path': self.shard_path(subsite),
+                          'max_workers': self._max_workers})
+
+        self._logger.info('Crawling {:d} subsites ({:d} already crawled)'.format(len(tasks),
+                                                                                len(status['skipped'])))
+        if not tasks:
+            return status
+
+        pool = multiprocessing.Pool(processes=min(self._processes, len(tasks)),
+                                    initializer=_init_worker,
+                                    initargs=(self._base_url, self._client_kwargs))
+        try:
+            for subsite, crawled in pool.imap_unordered(_crawl_shard, tasks):
+                if crawled:
+                    self._logger.info('Crawled {:s}'.format(subsite))
+                    status['crawled'].append(subsite)
+                else:
+                    status['failed'].append(subsite)
+        finally:
+            # Stop the remaining shards if the crawl was interrupted
+            pool.terminate()
+            pool.join()
+
+        status['crawled'].sort()
+        status['failed'].sort()
+
+        return status
+
+    def merge(self, snapshot_file):
+        """Merge all shard files into a single snapshot file containing the sorted list of
+        instruments, each with its streams, parameters and deployments.  Returns the snapshot
+        dict, or None if the snapshot could not be written"""
+
+        sensor_subsites = []
+        deployment_subsites = []
+        instruments = []
+        for subsite in self.list_shards():
+            try:
+                with open(self.shard_path(subsite), 'r') as fid:
+                    shard = json.load(fid)
+            except (IOError, ValueError) as e:
+                self._logger.error('Error reading shard {:s} ({:})'.format(self.shard_path(subsite), e))
+                return None
+
+            if shard['sensor_inventory']:
+                sensor_subsites.append(subsite)
+            if shard['deployment_inventory']:
+                deployment_subsites.append(subsite)
+            instruments.extend(shard['instruments'])
+
+        snapshot = {'version': SNAPSHOT_VERSION,
+                    'base_url': self._base_url,
+                    'created': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                    'subsites': sensor_subsites,
+                    'deployment_subsites': deployment_subsites,
+                    'instruments': sorted(instruments, key=lambda i: i['reference_designator'])}
+
+        if not _write_json(snapshot, snapshot_file):
+            self._logger.error('Error writing snapshot {:s}'.format(snapshot_file))
+            return None
+
+        self._logger.info('Merged {:d} instruments: {:s}'.format(len(instruments), snapshot_file))
+
+        return snapshot
+
+    def __repr__(self):
+        return '<InventoryCrawler(base_url={:s}, work_dir={:s})>'.format(self._base_url, self._work_dir)
+
+
+def load_snapshot(snapshot_file):
+    """Load and return the snapshot dict written by InventoryCrawler.merge, or None if the file
+    cannot be read or was written by an unsupported snapshot version"""
+
+    logger = logging.getLogger(__name__)
+
+    try:
+        with open(snapshot_file, 'r') as fid:
+            snapshot = json.load(fid)
+    except (IOError, ValueError) as e:
+        logger.error('Error reading snapshot {:s} ({:})'.format(snapshot_file, e))
+        return None
+
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        logger.error('Unsupported snapshot version {:} ({:s})'.format(snapshot.get('version'), snapshot_file))
+        return None
+
+    return snapshot
+
+
+def _init_worker(base_url, client_kwargs):
+    """Create the client, and its connection pool, used by all shards crawled in this process"""
+
+    global _worker_client
+
+    _worker_client = UFrameClient(base_url, inventory=False, **client_kwargs)
+
+
+def _crawl_shard(task):
+    """Crawl the subsite and write the shard file.  Returns a (subsite, crawled) tuple, where
+    crawled is False if any request failed, in which case the shard is not written"""
+
+    logger = logging.getLogger(__name__)
+
+    client = _worker_client
+    subsite = task['subsite']
+    if not client or not client.base_url:
+        return subsite, False
+
+    # Walk the sensor inventory nodes and sensors
+    sensors = []
+    if task['sensor_inventory']:
+        nodes = client.fetch_nodes(subsite)
+        if nodes is None:
+            logger.error('{:s}: Failed to fetch nodes'.format(subsite))
+            return subsite, False
+
+        for node in nodes:
+            node_sensors = client.fetch_sensors(subsite, node)
+            if node_sensors is None:
+                logger.error('{:s}-{:s}: Failed to fetch sensors'.format(subsite, node))
+                return subsite, False
+            sensors = sensors + ['{:s}-{:s}-{:s}'.format(subsite, node, sensor) for sensor in node_sensors]
+
+    # All deployments of the subsite are returned by a single request
+    deployments = client.fetch_instrument_deployments(subsite)
+    if deployments is None:
+        logger.error('{:s}: Failed to fetch deployments'.format(subsite))
+        return subsite, False
+
+    instruments = {}
+    for ref_des, metadata in client.fetch_bulk('metadata', sensors, max_workers=task['max_workers']):
+        if metadata is None:
+            logger.error('{:s}: Failed to fetch metadata'.format(ref_des))
+            return subsite, False
+        instruments[ref_des] = _instrument(ref_des,
+                                           streams=metadata.get('times', []),
+                                           parameters=metadata.get('parameters', []))
+
+    # Instruments that are only registered in the deployment inventory have no metadata
+    for d in deployments:
+        ref_des = deployment_ref_des(d)
+        if ref_des not in instruments:
+            instruments[ref_des] = _instrument(ref_des)
+        instruments[ref_des]['deployments'].append(d)
+
+    shard = {'subsite': subsite,
+             'sensor_inventory': task['sensor_inventory'],
+             'deployment_inventory': task['deployment_inventory'],
+             'crawled': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+             'instruments': [instruments[k] for k in sorted(instruments.keys())]}
+
+    if not _write_json(shard, task['shard_path']):
+        logger.error('{:s}: Error writing shard {:s}'.format(subsite, task['shard_path']))
+        return subsite, False
+
+    return subsite, True
+
+
+def _instrument(ref_des, streams=None, parameters=None):
+
+    return {'reference_designator': ref_des,
+            'streams': streams or [],
+            'parameters': parameters or [],
+            'deployments': []}
+
+
+def _write_json(obj, path):
+    """Write obj to a temporary file which replaces path, so that an interrupted write never
+    leaves a truncated file behind"""
+
+    (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(os.path.realpath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fid:
+            json.dump(obj, fid, sort_keys=True)
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+    return True
@@ -0,0 +1,424 @@
+import logging
+import re
+import json
+import sqlite3
+import hashlib
+import datetime
+from m2m.Inventory import Inventory
+from m2m.timeutils import iso_to_ms
+from m2m.deployments import deployment_ref_des
+
+# Snapshot database schema version.  Incremented whenever the schema changes
+SCHEMA_VERSION = 1
+
+_schema = """
+CREATE TABLE IF NOT EXISTS info (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS instruments (
+    ref_des TEXT PRIMARY KEY,
+    subsite TEXT NOT NULL,
+    node TEXT NOT NULL,
+    sensor TEXT NOT NULL,
+    sensor_inventory INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS instruments_node ON instruments (subsite, node);
+CREATE TABLE IF NOT EXISTS streams (
+    ref_des TEXT NOT NULL,
+    method TEXT NOT NULL,
+    stream TEXT NOT NULL,
+    begin_time INTEGER,
+    end_time INTEGER,
+    count INTEGER,
+    record TEXT NOT NULL,
+    PRIMARY KEY (ref_des, method, stream)
+);
+CREATE INDEX IF NOT EXISTS streams_stream ON streams (stream, method);
+CREATE INDEX IF NOT EXISTS streams_method ON streams (method);
+CREATE INDEX IF NOT EXISTS streams_time ON streams (begin_time, end_time);
+CREATE TABLE IF NOT EXISTS parameters (
+    ref_des TEXT NOT NULL,
+    stream TEXT NOT NULL,
+    pd_id TEXT NOT NULL,
+    particle_key TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS parameters_ref_des ON parameters (ref_des, stream);
+CREATE INDEX IF NOT EXISTS parameters_pd_id ON parameters (pd_id);
+CREATE INDEX IF NOT EXISTS parameters_particle_key ON parameters (particle_key);
+CREATE TABLE IF NOT EXISTS parameters_by_stream (
+    stream TEXT NOT NULL,
+    pd_id TEXT NOT NULL,
+    PRIMARY KEY (stream, pd_id)
+);
+CREATE INDEX IF NOT EXISTS parameters_by_stream_pd_id ON parameters_by_stream (pd_id);
+CREATE TABLE IF NOT EXISTS parameter_definitions (
+    pd_id TEXT PRIMARY KEY,
+    particle_key TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS parameter_definitions_particle_key ON parameter_definitions (particle_key);
+CREATE TABLE IF NOT EXISTS deployments (
+    ref_des TEXT NOT NULL,
+    deployment_number INTEGER,
+    event_start_time INTEGER,
+    event_stop_time INTEGER,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deployments_ref_des ON deployments (ref_des, deployment_number);
+CREATE INDEX IF NOT EXISTS deployments_time ON deployments (event_start_time, event_stop_time);
+CREATE TABLE IF NOT EXISTS digests (
+    ref_des TEXT PRIMARY KEY,
+    streams TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    deployments TEXT NOT NULL
+);
+"""
+
+# Queries returning the records hashed into the streams, parameters and deployments digests of an
+# instrument, in a stable order
+_digest_queries = ('SELECT record FROM streams WHERE ref_des = ? ORDER BY method, stream',
+                   'SELECT record FROM parameters WHERE ref_des = ? ORDER BY stream, pd_id, record',
+                   'SELECT record FROM deployments WHERE ref_des = ? ORDER BY deployment_number, event_start_time, '
+                   'record')
+
+# Instrument end points answered from the snapshot, relative to /sensor/inv/<subsite>/<node>/<sensor>
+_instrument_regex = re.compile(r'^sensor/inv/(\w+)/(\w+)/(\w+-\w+)(?:/(metadata(?:/times|/parameters)?))?$')
+
+
+class InventorySnapshot(object):
+
+    def __init__(self, db_path):
+        """SQLite snapshot of the UFrame inventory: the table of contents streams, parameters by
+        stream and parameter definitions, and the stream times, parameters and deployment events
+        of each instrument.  Each record is stored as the JSON response received from UFrame,
+        along with indexed reference designator, method, stream, pdId and time columns (integer
+        milliseconds since 1970-01-01), so the snapshot may be queried with SQL joins or used by
+        UFrameClient(..., snapshot=db_path) to answer metadata requests offline.  A digest of the
+        streams, parameters and deployments of each instrument is kept up to date as they are
+        written, so that snapshots may be compared without reading unchanged instruments (see
+        m2m.snapshots.diff_snapshots).
+
+        Parameters:
+            db_path: path to the SQLite database file, which is created if it does not exist
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._db_path = db_path
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript(_schema)
+
+    @property
+    def db_path(self):
+        return self._db_path
+
+    @property
+    def info(self):
+        """dict containing the snapshot version, base_url and created timestamp"""
+        return dict(self._db.execute('SELECT key, value FROM info').fetchall())
+
+    def set_info(self, base_url):
+        """Stamp the snapshot with the schema version, UFrame base url and the current time"""
+
+        info = {'version': str(SCHEMA_VERSION),
+                'base_url': base_url,
+                'created': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')}
+
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO info VALUES (?, ?)', info.items())
+
+    def write_toc(self, toc):
+        """Write the instruments, streams, parameters by stream and parameter definitions of the
+        table of contents dict (see UFrameClient.toc).  Returns the number of instruments written"""
+
+        for instrument in toc['instruments']:
+            self.write_instrument_streams(instrument['reference_designator'], instrument['streams'])
+
+        with self._db:
+            self._db.executemany('INSERT OR IGNORE INTO parameters_by_stream VALUES (?, ?)',
+                                 [(stream, pd_id) for stream, pd_ids in toc.get('parameters_by_stream', {}).items()
+                                  for pd_id in pd_ids])
+            self._db.executemany('INSERT OR REPLACE INTO parameter_definitions VALUES (?, ?, ?)',
+                                 [(p['pdId'], p.get('particle_key'), json.dumps(p))
+                                  for p in toc.get('parameter_definitions', [])])
+
+        return len(toc['instruments'])
+
+    def write_instrument_streams(self, ref_des, streams):
+        """Replace the streams of the fully-qualified reference designator with the stream dicts
+        returned by UFrameClient.fetch_instrument_streams"""
+
+        rows = []
+        for s in streams:
+            try:
+                rows.append((ref_des, s['method'], s['stream'], iso_to_ms(s['beginTime']), iso_to_ms(s['endTime']),
+                             s.get('count'), json.dumps(s, sort_keys=True)))
+            except (KeyError, ValueError) as e:
+                self._logger.warning('{:s}-{:s}: Invalid stream ({:})'.format(ref_des, s.get('stream'), e))
+
+        with self._db:
+            self._add_instrument(ref_des)
+            self._db.execute('DELETE FROM streams WHERE ref_des = ?', (ref_des,))
+            self._db.executemany('INSERT OR REPLACE INTO streams VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self._update_digests([ref_des])
+
+    def write_instrument_parameters(self, ref_des, parameters):
+        """Replace the parameters of the fully-qualified reference designator with the parameter
+        dicts returned by UFrameClient.fetch_instrument_parameters.  Streams and parameters that
+        are missing from parameters_by_stream and parameter_definitions are added to them"""
+
+        rows = [(ref_des, p['stream'], p['pdId'], p.get('particleKey', p.get('particle_key')), json.dumps(p, sort_keys=True))
+                for p in parameters]
+
+        with self._db:
+            self._add_instrument(ref_des)
+            self._db.execute('DELETE FROM parameters WHERE ref_des = ?', (ref_des,))
+            self._db.executemany('INSERT INTO parameters VALUES (?, ?, ?, ?, ?)', rows)
+            self._db.executemany('INSERT OR IGNORE INTO parameters_by_stream VALUES (?, ?)',
+                                 [(r[1], r[2]) for r in rows])
+            self._db.executemany('INSERT OR IGNORE INTO parameter_definitions VALUES (?, ?, ?)',
+                                 [(r[2], r[3], json.dumps({'pdId': r[2], 'particle_key': r[3]})) for r in rows])
+            self._update_digests([ref_des])
+
+    def write_deployments(self, deployments, ref_des=None):
+        """Replace the deployment events of the fully or partially-qualified reference designator
+        with the deployment events returned by UFrameClient.fetch_instrument_deployments.  If
+        ref_des is not specified, the events are added to the existing events"""
+
+        rows = [(deployment_ref_des(d),
+                 d.get('deploymentNumber'),
+                 d.get('eventStartTime'),
+                 d.get('eventStopTime'),
+                 json.dumps(d, sort_keys=True)) for d in deployments]
+
+        with self._db:
+            changed = set([row[0] for row in rows])
+            if ref_des is not None:
+                changed.update([r[0] for r in self._db.execute('SELECT DISTINCT ref_des FROM deployments '
+                                                               'WHERE ref_des LIKE ? ESCAPE \'\\\'',
+                                                               (_like(ref_des),))])
+                self._db.execute('DELETE FROM deployments WHERE ref_des LIKE ? ESCAPE \'\\\'', (_like(ref_des),))
+            for row in rows:
+                self._add_instrument(row[0], sensor_inventory=False)
+            self._db.executemany('INSERT INTO deployments VALUES (?, ?, ?, ?, ?)', rows)
+            self._update_digests(changed)
+
+    def write_crawl(self, snapshot):
+        """Write the instruments of the snapshot dict created by InventoryCrawler.merge.  Returns
+        the number of instruments written"""
+
+        for instrument in snapshot['instruments']:
+            ref_des = instrument['reference_designator']
+            if instrument['streams'] or instrument['parameters']:
+                self.write_instrument_streams(ref_des, instrument['streams'])
+                self.write_instrument_parameters(ref_des, instrument['parameters'])
+            self.write_deployments(instrument['deployments'], ref_des=ref_des)
+
+        return len(snapshot['instruments'])
+
+    def inventory(self, ref_des_list=None):
+        """Return the Inventory of the instruments and streams in the snapshot or, if specified,
+        of only the fully-qualified reference designators in ref_des_list"""
+
+        inventory = Inventory()
+
+        if ref_des_list is None:
+            rows = self._db.execute('SELECT ref_des, record FROM streams ORDER BY ref_des, rowid')
+        else:
+            rows = [(ref_des, r[0]) for ref_des in ref_des_list for r in
+                    self._db.execute('SELECT record FROM streams WHERE ref_des = ? ORDER BY rowid', (ref_des,))]
+
+        instruments = {}
+        for ref_des, record in rows:
+            instruments.setdefault(ref_des, []).append(json.loads(record))
+        for ref_des in sorted(instruments.keys()):
+            inventory.add_instrument({'reference_designator': ref_des, 'streams': instruments[ref_des]})
+
+        parameters_by_stream = {}
+        for stream, pd_id in self._db.execute('SELECT stream, pd_id FROM parameters_by_stream'):
+            parameters_by_stream.setdefault(stream, []).append(pd_id)
+        definitions = [json.loads(r[0]) for r in self._db.execute('SELECT record FROM parameter_definitions')]
+
+        inventory.set_parameters(parameters_by_stream, definitions)
+
+        return inventory
+
+    def digests(self):
+        """Return the dict mapping each instrument in the snapshot to its (streams, parameters,
+        deployments) digest tuple.  Digests missing from snapshots written before digests were
+        kept are computed and stored"""
+
+        missing = [r[0] for r in self._db.execute('SELECT i.ref_des FROM instruments i '
+                                                  'LEFT JOIN digests d ON d.ref_des = i.ref_des '
+                                                  'WHERE d.ref_des IS NULL')]
+        if missing:
+            with self._db:
+                self._update_digests(missing)
+
+        return dict([(r[0], tuple(r[1:])) for r in
+                     self._db.execute('SELECT ref_des, streams, parameters, deployments FROM digests')])
+
+    def instruments(self):
+        """Return the sorted list of all instruments in the snapshot, including instruments that
+        only have deployment events"""
+
+        return [r[0] for r in self._db.execute('SELECT ref_des FROM instruments ORDER BY ref_des')]
+
+    def active_instruments(self, time_ms):
+        """Return the set of instruments with a deployment that had not ended at time_ms"""
+
+        rows = self._db.execute('SELECT DISTINCT ref_des FROM deployments '
+                                'WHERE event_stop_time IS NULL OR event_stop_time > ?', (time_ms,))
+
+        return set([r[0] for r in rows])
+
+    def subsites(self, sensor_inventory=True):
+        """Return the sorted list of subsites in the sensor inventory or, if sensor_inventory is
+        False, the subsites with deployment events"""
+
+        if sensor_inventory:
+            rows = self._db.execute('SELECT DISTINCT subsite FROM instruments WHERE sensor_inventory = 1 '
+                                    'ORDER BY subsite')
+        else:
+            rows = self._db.execute('SELECT DISTINCT i.subsite FROM instruments i '
+                                    'JOIN deployments d ON d.ref_des = i.ref_des ORDER BY i.subsite')
+
+        return [r[0] for r in rows]
+
+    def nodes(self, subsite):
+        """Return the sorted list of sensor inventory nodes on the subsite"""
+
+        rows = self._db.execute('SELECT DISTINCT node FROM instruments WHERE subsite = ? AND sensor_inventory = 1 '
+                                'ORDER BY node', (subsite,))
+
+        return [r[0] for r in rows]
+
+    def sensors(self, subsite, node):
+        """Return the sorted list of sensor inventory sensors on the subsite node"""
+
+        rows = self._db.execute('SELECT sensor FROM instruments WHERE subsite = ? AND node = ? '
+                                'AND sensor_inventory = 1 ORDER BY sensor', (subsite, node))
+
+        return [r[0] for r in rows]
+
+    def instrument_streams(self, ref_des):
+        """Return the list of stream dicts of the fully-qualified reference designator, or None if
+        the instrument is not in the snapshot"""
+
+        if not self._has_instrument(ref_des):
+            return None
+
+        return [json.loads(r[0]) for r in
+                self._db.execute('SELECT record FROM streams WHERE ref_des = ? ORDER BY rowid', (ref_des,))]
+
+    def instrument_parameters(self, ref_des):
+        """Return the list of parameter dicts of the fully-qualified reference designator, or None
+        if the instrument is not in the snapshot"""
+
+        if not self._has_instrument(ref_des):
+            return None
+
+        return [json.loads(r[0]) for r in
+                self._db.execute('SELECT record FROM parameters WHERE ref_des = ? ORDER BY rowid', (ref_des,))]
+
+    def instrument_deployments(self, ref_des):
+        """Return the list of deployment events of the fully or partially-qualified reference
+        designator"""
+
+        return [json.loads(r[0]) for r in
+                self._db.execute('SELECT record FROM deployments WHERE ref_des LIKE ? ESCAPE \'\\\' '
+                                 'ORDER BY rowid',
+                                 (_like(ref_des),))]
+
+    def query(self, sql, values=()):
+        """Run the SQL query and return the list of rows as dicts mapping column name to value"""
+
+        cursor = self._db.execute(sql, values)
+        cols = [c[0] for c in cursor.description or []]
+
+        return [dict(zip(cols, row)) for row in cursor]
+
+    def answer(self, end_point):
+        """Return the response UFrame would send for the metadata end_point (i.e.: sensor/inv/toc),
+        or None if the end_point cannot be answered from the snapshot"""
+
+        (path, sep, query) = end_point.strip('/').partition('?')
+
+        if path == 'sensor/inv':
+            return self.subsites()
+        if path == 'sensor/inv/toc':
+            return self.inventory().to_toc()
+        if path == 'events/deployment/inv':
+            return self.subsites(sensor_inventory=False)
+        if path == 'events/deployment/query':
+            refdes = [v for k, v in [q.partition('=')[::2] for q in query.split('&')] if k == 'refdes']
+            return self.instrument_deployments(refdes[0] if refdes else '')
+
+        tokens = path.split('/')
+        if tokens[:2] == ['sensor', 'inv'] and len(tokens) == 3:
+            return self.nodes(tokens[2])
+        if tokens[:2] == ['sensor', 'inv'] and len(tokens) == 4:
+            return self.sensors(tokens[2], tokens[3])
+
+        match = _instrument_regex.match(path)
+        if not match:
+            return None
+
+        ref_des = '-'.join(match.groups()[:3])
+        if match.group(4) == 'metadata/times':
+            return self.instrument_streams(ref_des)
+        if match.group(4) == 'metadata/parameters':
+            return self.instrument_parameters(ref_des)
+        if match.group(4) == 'metadata':
+            if not self._has_instrument(ref_des):
+                return None
+            return {'times': self.instrument_streams(ref_des), 'parameters': self.instrument_parameters(ref_des)}
+
+        return None
+
+    def close(self):
+        self._db.close()
+
+    def _add_instrument(self, ref_des, sensor_inventory=True):
+
+        r_tokens = ref_des.split('-')
+        if len(r_tokens) != 4:
+            return
+
+        self._db.execute('INSERT OR IGNORE INTO instruments VALUES (?, ?, ?, ?, ?)',
+                         (ref_des, r_tokens[0], r_tokens[1], '-'.join(r_tokens[2:]), int(sensor_inventory)))
+        if sensor_inventory:
+            self._db.execute('UPDATE instruments SET sensor_inventory = 1 WHERE ref_des = ?', (ref_des,))
+
+    def _update_digests(self, ref_des_list):
+        """Recompute the digests of the instruments in ref_des_list.  Must be called within a
+        transaction"""
+
+        rows = []
+        for ref_des in ref_des_list:
+            digest = []
+            for sql in _digest_queries:
+                h = hashlib.sha1()
+                for r in self._db.execute(sql, (ref_des,)):
+                    h.update(r[0].encode('utf-8'))
+                    h.update(b'\n')
+                digest.append(h.hexdigest())
+            rows.append(tuple([ref_des] + digest))
+
+        self._db.executemany('INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)', rows)
+
+    def _has_instrument(self, ref_des):
+
+        return self._db.execute('SELECT 1 FROM instruments WHERE ref_des = ? AND sensor_inventory = 1',
+                                (ref_des,)).fetchone() is not None
+
+    def __repr__(self):
+        return '<InventorySnapshot(db_path={:s})>'.format(self._db_path)
+
+
+def _like(ref_des):
+    """Return the LIKE pattern matching reference designators beginning with ref_des"""
+
+    return '{:s}%'.format(ref_des.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
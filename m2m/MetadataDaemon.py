@@ -0,0 +1,248 @@
+import logging
+import os
+import json
+import time
+import socket
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+# Default Unix socket path, overridden by the M2M_DAEMON_SOCKET environment variable
+DEFAULT_SOCKET = os.getenv('M2M_DAEMON_SOCKET', os.path.expanduser('~/.m2m_daemon.sock'))
+
+# Client methods that may be called through the daemon
+DAEMON_METHODS = ('search_instruments',
+                  'stream_to_instruments',
+                  'fetch_subsites',
+                  'fetch_deployment_subsites',
+                  'fetch_instrument_streams',
+                  'fetch_instrument_parameters',
+                  'fetch_instrument_metadata',
+                  'fetch_metadata_bundle',
+                  'fetch_instrument_deployments',
+                  'filter_deployments_by_status',
+                  'instrument_to_query',
+                  'deployment_to_query',
+                  'refresh_inventory')
+
+# Client properties that may be read through the daemon
+DAEMON_PROPERTIES = ('base_url',
+                     'm2m_base_url',
+                     'is_m2m',
+                     'timeout',
+                     'instruments',
+                     'streams',
+                     'toc')
+
+# Methods whose responses are cached until they expire or the inventory changes
+CACHED_METHODS = ('fetch_subsites',
+                  'fetch_deployment_subsites',
+                  'fetch_instrument_streams',
+                  'fetch_instrument_parameters',
+                  'fetch_instrument_metadata',
+                  'fetch_instrument_deployments')
+
+
+class MetadataDaemon(object):
+
+    def __init__(self, client, socket_path=DEFAULT_SOCKET, cache_ttl=600, refresh_interval=None):
+        """Long-lived local server that holds a warm UFrameClient, including its connection pool
+        and inventory, and answers lookups from scripts over a Unix socket, so that each script
+        does not need to connect to UFrame and download the table of contents before its first
+        lookup.  Use DaemonClient.connect_client to talk to a running daemon.
+
+        Requests and responses are single lines of JSON:
+
+            {"method": "search_instruments", "args": ["CE02"], "kwargs": {}}
+            {"result": [...], "last": {"request_url": ..., "status_code": ..., "reason": ...}}
+            {"error": "message"}
+
+        Only the methods in DAEMON_METHODS and the properties in DAEMON_PROPERTIES may be
+        called.  The responses of the CACHED_METHODS are cached for cache_ttl seconds.
+
+        Parameters:
+            client: UFrameClient instance
+            socket_path: path of the Unix socket
+            cache_ttl: number of seconds the responses of the CACHED_METHODS are kept
+            refresh_interval: if set, the inventory is refreshed every refresh_interval seconds
+                and the cached responses of the changed instruments are dropped
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._client = client
+        self._socket_path = socket_path
+        self._cache_ttl = cache_ttl
+        self._refresh_interval = refresh_interval
+
+        # The client stores the last request properties, so calls are serialized
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._server = None
+        self._stopped = threading.Event()
+
+    @property
+    def client(self):
+        return self._client
+
+    @property
+    def socket_path(self):
+        return self._socket_path
+
+    def call(self, method, args=None, kwargs=None):
+        """Call the whitelisted client method or read the client property and return the response
+        dict containing the result and the last request properties, or the error message"""
+
+        args = args or []
+        kwargs = kwargs or {}
+
+        if method in DAEMON_PROPERTIES:
+            with self._lock:
+                return self._result(getattr(self._client, method))
+
+        if method not in DAEMON_METHODS:
+            return {'error': 'Invalid method: {:}'.format(method)}
+
+        key = None
+        if method in CACHED_METHODS:
+            key = json.dumps([method, args, kwargs], sort_keys=True)
+            cached = self._cache.get(key)
+            if cached and time.time() - cached[0] < self._cache_ttl:
+                return cached[1]
+
+        with self._lock:
+            try:
+                response = self._result(getattr(self._client, method)(*args, **kwargs))
+            except TypeError as e:
+                return {'error': '{:s}: {:}'.format(method, e)}
+
+            if method == 'refresh_inventory':
+                self._invalidate(response['result'])
+
+        if key and response['last']['status_code'] == 200:
+            self._cache[key] = (time.time(), response)
+
+        return response
+
+    def refresh(self):
+        """Refresh the client inventory and drop the cached responses of the changed instruments.
+        Returns the list of changes"""
+
+        with self._lock:
+            changes = self._client.refresh_inventory()
+            self._invalidate(changes)
+
+        if changes:
+            self._logger.info('Inventory refreshed: {:d} changes'.format(len(changes)))
+
+        return changes
+
+    def serve_forever(self):
+        """Bind the Unix socket and serve requests until stop() is called"""
+
+        if os.path.exists(self._socket_path):
+            if is_daemon_running(self._socket_path):
+                self._logger.error('Daemon already running on {:s}'.format(self._socket_path))
+                return False
+            self._logger.debug('Removing stale socket {:s}'.format(self._socket_path))
+            os.remove(self._socket_path)
+
+        self._server = _UnixServer(self._socket_path, _RequestHandler)
+        self._server.metadata_daemon = self
+        os.chmod(self._socket_path, 0o600)
+
+        if self._refresh_interval:
+            refresher = threading.Thread(target=self._refresh_loop)
+            refresher.daemon = True
+            refresher.start()
+
+        self._logger.info('Serving {:s} on {:s}'.format(self._client.base_url, self._socket_path))
+
+        try:
+            self._server.serve_forever()
+        finally:
+            self._stopped.set()
+            self._server.server_close()
+            if os.path.exists(self._socket_path):
+                os.remove(self._socket_path)
+
+        return True
+
+    def stop(self):
+        """Stop serving requests.  Must be called from a different thread than serve_forever"""
+
+        if self._server:
+            self._server.shutdown()
+
+    def _refresh_loop(self):
+
+        while not self._stopped.wait(self._refresh_interval):
+            self.refresh()
+
+    def _invalidate(self, changes):
+        """Drop the cached responses of the instruments in changes"""
+
+        if not changes:
+            return
+
+        ref_des = set([c['reference_designator'] for c in changes])
+        for key in list(self._cache.keys()):
+            method, args, kwargs = json.loads(key)
+            if args and args[0] in ref_des:
+                self._cache.pop(key, None)
+
+    def _result(self, result):
+
+        return {'result': result,
+                'last': {'request_url': self._client.last_request_url,
+                         'status_code': self._client.last_status_code,
+                         'reason': self._client.last_reason}}
+
+    def __repr__(self):
+        return '<MetadataDaemon(socket_path={:s}, base_url={:})>'.format(self._socket_path, self._client.base_url)
+
+
+def is_daemon_running(socket_path=DEFAULT_SOCKET):
+    """Return True if a daemon is accepting connections on socket_path"""
+
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_path):
+        return False
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+
+        daemon = self.server.metadata_daemon
+        logger = logging.getLogger(__name__)
+
+        # One connection may send any number of requests
+        for line in iter(self.rfile.readline, b''):
+            try:
+                request = json.loads(line.decode('utf-8'))
+                response = daemon.call(request.get('method'), request.get('args'), request.get('kwargs'))
+            except ValueError as e:
+                response = {'error': 'Invalid request: {:}'.format(e)}
+            except Exception as e:
+                logger.exception('Request failed')
+                response = {'error': '{:}'.format(e)}
+
+            self.wfile.write('{:s}\n'.format(json.dumps(response, default=str)).encode('utf-8'))
+            self.wfile.flush()
@@ -0,0 +1,230 @@
+import logging
+import os
+import json
+import uuid
+import tempfile
+from m2m.timeutils import to_ms, merge_intervals, interval_gaps
+
+try:
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Name of the file, in each stream directory, containing the time windows already retrieved
+COVERAGE_FILE = 'coverage.json'
+
+SECONDS_PER_DAY = 86400
+
+
+class ParticleCache(object):
+
+    def __init__(self, root):
+        """Local cache of retrieved particle data, stored as Parquet files partitioned by
+        reference designator, method, stream and day:
+
+            root/ref_des/method/stream/date=YYYY-MM-DD/part-*.parquet
+
+        Each stream directory also contains a coverage file listing the time windows that have
+        been retrieved, so that only the missing windows are requested from UFrame.  Reads only
+        open the partitions for the requested days and only decode the requested columns.
+        Requires numpy and pyarrow.
+
+        Parameters:
+            root: cache root directory, which is created if it does not exist
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        if pa is None:
+            self._logger.error('ParticleCache requires numpy and pyarrow')
+            raise ImportError('ParticleCache requires numpy and pyarrow')
+
+        self._root = root
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    @property
+    def root(self):
+        return self._root
+
+    def coverage(self, ref_des, method, stream):
+        """Return the sorted list of disjoint (begin, end) windows, in milliseconds since
+        1970-01-01, retrieved for ref_des-method-stream"""
+
+        coverage_file = os.path.join(self._stream_dir(ref_des, method, stream), COVERAGE_FILE)
+        if not os.path.isfile(coverage_file):
+            return []
+
+        with open(coverage_file, 'r') as fid:
+            return merge_intervals([tuple(w) for w in json.load(fid)])
+
+    def gaps(self, ref_des, method, stream, begin_time, end_time):
+        """Return the list of (begin, end) windows, in milliseconds since 1970-01-01, between
+        begin_time and end_time that have not been retrieved.  begin_time and end_time may be
+        ISO-8601 timestamps or integer milliseconds"""
+
+        return interval_gaps(self.coverage(ref_des, method, stream), to_ms(begin_time), to_ms(end_time))
+
+    def write(self, ref_des, method, stream, particles, begin_time, end_time):
+        """Write the particles retrieved for ref_des-method-stream between begin_time and end_time
+        to the daily partitions and record the window as retrieved.
+
+        Arguments:
+            particles: ParticleColumns instance or dict mapping parameter names to columns.  Must
+                contain a time column in seconds since 1970-01-01
+            begin_time: ISO-8601 timestamp or milliseconds since 1970-01-01
+            end_time: ISO-8601 timestamp or milliseconds since 1970-01-01
+
+        Returns the number of particles written
+        """
+
+        columns = particles.to_dict() if hasattr(particles, 'to_dict') else particles
+        count = 0
+        if columns:
+            if 'time' not in columns:
+                self._logger.error('{:s}-{:s}-{:s}: particles contain no time column'.format(ref_des, method, stream))
+                return 0
+
+            table = _to_table(columns)
+            count = table.num_rows
+
+            # Split the particles into daily partitions
+            days = np.floor(np.asarray(columns['time'], dtype=np.float64) / SECONDS_PER_DAY).astype(np.int64)
+            stream_dir = self._stream_dir(ref_des, method, stream)
+            for day in np.unique(days):
+                partition_dir = os.path.join(stream_dir, 'date={:s}'.format(_day_to_date(day)))
+                if not os.path.isdir(partition_dir):
+                    os.makedirs(partition_dir)
+                indices = np.nonzero(days == day)[0]
+                pq.write_table(table.take(pa.array(indices)),
+                               os.path.join(partition_dir, 'part-{:s}.parquet'.format(uuid.uuid4().hex)))
+
+        self._add_coverage(ref_des, method, stream, to_ms(begin_time), to_ms(end_time))
+
+        self._logger.debug('{:s}-{:s}-{:s}: Cached {:d} particles'.format(ref_des, method, stream, count))
+
+        return count
+
+    def read(self, ref_des, method, stream, begin_time=None, end_time=None, columns=None):
+        """Read the cached particles for ref_des-method-stream, optionally restricted to the
+        begin_time - end_time window and to the named columns.  Only the daily partitions that
+        overlap the window are opened and only the requested columns are decoded.  Parts written
+        with different parameter subsets may be read together: requested columns missing from a
+        part are null (NaN) for its particles.
+
+        Returns a dict mapping each parameter name to a numpy array, sorted by time
+        """
+
+        stream_dir = self._stream_dir(ref_des, method, stream)
+        if not os.path.isdir(stream_dir):
+            return {}
+
+        t0 = to_ms(begin_time) / 1000. if begin_time is not None else None
+        t1 = to_ms(end_time) / 1000. if end_time is not None else None
+
+        date0 = _day_to_date(int(t0 // SECONDS_PER_DAY)) if t0 is not None else None
+        date1 = _day_to_date(int(t1 // SECONDS_PER_DAY)) if t1 is not None else None
+
+        if columns:
+            columns = ['time'] + [c for c in columns if c != 'time']
+
+        filters = []
+        if t0 is not None:
+            filters.append(('time', '>=', t0))
+        if t1 is not None:
+            filters.append(('time', '<', t1))
+
+        tables = []
+        for partition in sorted(os.listdir(stream_dir)):
+            if not partition.startswith('date='):
+                continue
+            date = partition[5:]
+            if (date0 and date < date0) or (date1 and date > date1):
+                continue
+
+            partition_dir = os.path.join(stream_dir, partition)
+            for part in sorted(os.listdir(partition_dir)):
+                if not part.endswith('.parquet'):
+                    continue
+                path = os.path.join(partition_dir, part)
+                part_columns = columns
+                if columns:
+                    # Only read the requested columns written to this part
+                    names = pq.read_schema(path).names
+                    part_columns = [c for c in columns if c in names]
+                tables.append(pq.read_table(path, columns=part_columns, filters=filters or None))
+
+        if not tables:
+            return {}
+
+        try:
+            table = pa.concat_tables(tables, promote_options='default')
+        except TypeError:
+            # pyarrow < 14
+            table = pa.concat_tables(tables, promote=True)
+        table = table.take(pc.sort_indices(table, sort_keys=[('time', 'ascending')]))
+
+        # Requested columns not written to any of the parts
+        for name in (columns or []):
+            if name not in table.column_names:
+                table = table.append_column(name, pa.nulls(table.num_rows, type=pa.float64()))
+
+        return dict([(name, table.column(name).to_numpy(zero_copy_only=False)) for name in table.column_names])
+
+    def clear(self, ref_des, method, stream):
+        """Remove all cached particles and coverage for ref_des-method-stream"""
+
+        stream_dir = self._stream_dir(ref_des, method, stream)
+        if not os.path.isdir(stream_dir):
+            return
+
+        for root, dirs, files in os.walk(stream_dir, topdown=False):
+            for f in files:
+                os.remove(os.path.join(root, f))
+            for d in dirs:
+                os.rmdir(os.path.join(root, d))
+        os.rmdir(stream_dir)
+
+    def _add_coverage(self, ref_des, method, stream, begin_ms, end_ms):
+
+        coverage = merge_intervals(self.coverage(ref_des, method, stream) + [(begin_ms, end_ms)])
+
+        stream_dir = self._stream_dir(ref_des, method, stream)
+        if not os.path.isdir(stream_dir):
+            os.makedirs(stream_dir)
+
+        (fd, tmp_path) = tempfile.mkstemp(dir=stream_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fid:
+            json.dump(coverage, fid)
+        os.rename(tmp_path, os.path.join(stream_dir, COVERAGE_FILE))
+
+    def _stream_dir(self, ref_des, method, stream):
+        return os.path.join(self._root, ref_des, method, stream)
+
+    def __repr__(self):
+        return '<ParticleCache(root={:s})>'.format(self._root)
+
+
+def _day_to_date(day):
+    """Convert days since 1970-01-01 to a YYYY-MM-DD partition date"""
+
+    return str(np.datetime64(int(day), 'D'))
+
+
+def _to_table(columns):
+    """Create a pyarrow Table from the dict of columns.  Object columns whose values can't be
+    converted to a single arrow type are stored as strings"""
+
+    names = sorted(columns.keys())
+    arrays = []
+    for name in names:
+        values = columns[name]
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()))
+
+    return pa.Table.from_arrays(arrays, names=names)
@@ -0,0 +1,145 @@
+import logging
+import numbers
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Seconds between the NTP epoch (1900-01-01) used by UFrame timestamps and the unix epoch (1970-01-01)
+NTP_EPOCH_OFFSET = 2208988800
+
+_nan = float('nan')
+
+
+def is_timestamp(name):
+    """Return True if the particle parameter name is an NTP timestamp"""
+
+    return name == 'time' or name.endswith('_timestamp')
+
+
+class ParticleColumns(object):
+
+    def __init__(self, parameters=None):
+        """Columnar buffers for UFrame JSON particles.  Particles are appended one at a time and
+        each parameter value is stored in a per-parameter buffer: a compact array of doubles for
+        numeric parameters and a list for everything else.  NTP timestamps (time and all
+        *_timestamp parameters) are converted to float64 seconds since 1970-01-01 as they are
+        appended.  Dict-valued parameters (i.e.: pk) are dropped unless requested in parameters.
+
+        kwargs:
+            parameters: list of parameter names to keep (Default is all parameters)
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._parameters = set(parameters) if parameters else None
+        self._columns = {}
+        self._ignored = set()
+        self._timestamps = set()
+        self._count = 0
+
+    @property
+    def parameters(self):
+        """Sorted list of parameter names"""
+        return sorted(self._columns.keys())
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def append(self, particle):
+        """Append the values in the particle dict to the column buffers"""
+
+        for name, value in particle.items():
+
+            if name in self._ignored:
+                continue
+
+            buf = self._columns.get(name)
+            if buf is None:
+                if value is None:
+                    # Type can't be determined yet
+                    continue
+                buf = self._new_column(name, value)
+                if buf is None:
+                    continue
+
+            if type(buf) == array:
+                if isinstance(value, numbers.Real) and not isinstance(value, bool):
+                    if name in self._timestamps:
+                        value -= NTP_EPOCH_OFFSET
+                    buf.append(value)
+                else:
+                    buf.append(_nan)
+            else:
+                buf.append(value)
+
+        self._count += 1
+
+        # Pad columns missing from this particle
+        for name, buf in self._columns.items():
+            if len(buf) < self._count:
+                buf.append(_nan if type(buf) == array else None)
+
+    def extend(self, particles):
+        """Append all particles in the particles iterable"""
+
+        for particle in particles:
+            self.append(particle)
+
+        return self
+
+    def column(self, name):
+        """Return the values of the named parameter as a numpy array, if numpy is installed, or
+        as an array.array/list otherwise.  Numeric numpy arrays share memory with the buffer, so no
+        more particles may be appended while they are referenced"""
+
+        buf = self._columns[name]
+        if np is not None:
+            if type(buf) == array:
+                return np.frombuffer(buf, dtype=np.float64)
+            return np.array(buf, dtype=object)
+
+        return buf
+
+    def arrays(self):
+        """Return a dict mapping each numeric parameter name to its compact array of doubles.
+        Non-numeric parameters are not included"""
+
+        return dict([(name, buf) for name, buf in self._columns.items() if type(buf) == array])
+
+    def to_dict(self):
+        """Return a dict mapping each parameter name to its column"""
+
+        return dict([(name, self.column(name)) for name in self._columns])
+
+    def _new_column(self, name, value):
+
+        if self._parameters is not None and name not in self._parameters:
+            self._ignored.add(name)
+            return None
+
+        if isinstance(value, dict) and self._parameters is None:
+            self._ignored.add(name)
+            return None
+
+        if isinstance(value, numbers.Real) and not isinstance(value, bool):
+            buf = array('d', [_nan] * self._count)
+            if is_timestamp(name):
+                self._timestamps.add(name)
+        else:
+            buf = [None] * self._count
+
+        self._columns[name] = buf
+
+        return buf
+
+    def __repr__(self):
+        return '<ParticleColumns(particles={:d}, parameters={:d})>'.format(self._count, len(self._columns))
@@ -0,0 +1,267 @@
+import logging
+import os
+import json
+import tempfile
+from m2m.timeutils import to_ms, merge_intervals, interval_gaps
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Per-stream metadata file containing the column names, particle count and retrieved windows
+META_FILE = 'meta.json'
+
+# All columns are stored as little-endian float64
+COLUMN_DTYPE = '<f8'
+
+
+class ParticleStore(object):
+
+    def __init__(self, root):
+        """Local store of retrieved particle data in which each numeric parameter of each stream
+        is kept as a fixed-width float64 binary column file, sorted by time:
+
+            root/ref_des/method/stream/time.f8
+            root/ref_des/method/stream/<parameter>.f8
+            root/ref_des/method/stream/meta.json
+
+        Columns are opened with numpy.memmap, so a time-range read binary searches the time
+        column and returns zero-copy views of the requested columns without decoding anything.
+        The metadata file is the commit point of every write: appended particles beyond its count
+        are ignored and merges write a new generation of column files (<parameter>.<generation>.f8)
+        that only replaces the previous generation once the metadata file is replaced, so an
+        interrupted write never leaves columns of mismatched lengths.
+        Non-numeric and multi-dimensional parameters are not stored.  Implements the same
+        coverage, gaps, write and read methods as ParticleCache, so it may be passed as the cache
+        to UFrameClient.fetch_stream_particles.  Requires numpy.
+
+        Parameters:
+            root: store root directory, which is created if it does not exist
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        if np is None:
+            self._logger.error('ParticleStore requires numpy')
+            raise ImportError('ParticleStore requires numpy')
+
+        self._root = root
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    @property
+    def root(self):
+        return self._root
+
+    def coverage(self, ref_des, method, stream):
+        """Return the sorted list of disjoint (begin, end) windows, in milliseconds since
+        1970-01-01, retrieved for ref_des-method-stream"""
+
+        return merge_intervals([tuple(w) for w in self._read_meta(ref_des, method, stream)['coverage']])
+
+    def gaps(self, ref_des, method, stream, begin_time, end_time):
+        """Return the list of (begin, end) windows, in milliseconds since 1970-01-01, between
+        begin_time and end_time that have not been retrieved.  begin_time and end_time may be
+        ISO-8601 timestamps or integer milliseconds"""
+
+        return interval_gaps(self.coverage(ref_des, method, stream), to_ms(begin_time), to_ms(end_time))
+
+    def count(self, ref_des, method, stream):
+        """Return the number of particles stored for ref_des-method-stream"""
+
+        return self._read_meta(ref_des, method, stream)['count']
+
+    def write(self, ref_des, method, stream, particles, begin_time, end_time):
+        """Add the particles retrieved for ref_des-method-stream between begin_time and end_time
+        to the store and record the window as retrieved.  Particles later than all stored
+        particles are appended to the column files.  Otherwise the columns are merged and
+        rewritten in time order.
+
+        Arguments:
+            particles: ParticleColumns instance or dict mapping parameter names to columns.  Must
+                contain a time column in seconds since 1970-01-01
+            begin_time: ISO-8601 timestamp or milliseconds since 1970-01-01
+            end_time: ISO-8601 timestamp or milliseconds since 1970-01-01
+
+        Returns the number of particles written
+        """
+
+        stream_dir = self._stream_dir(ref_des, method, stream)
+        if not os.path.isdir(stream_dir):
+            os.makedirs(stream_dir)
+
+        meta = self._read_meta(ref_des, method, stream)
+        meta['coverage'] = merge_intervals([tuple(w) for w in meta['coverage']] +
+                                           [(to_ms(begin_time), to_ms(end_time))])
+
+        columns = particles.to_dict() if hasattr(particles, 'to_dict') else particles
+        if not columns:
+            self._write_meta(ref_des, method, stream, meta)
+            return 0
+
+        if 'time' not in columns:
+            self._logger.error('{:s}-{:s}-{:s}: particles contain no time column'.format(ref_des, method, stream))
+            return 0
+
+        new_columns = {}
+        for name, values in columns.items():
+            try:
+                new_columns[name] = np.asarray(values, dtype=COLUMN_DTYPE)
+            except (TypeError, ValueError):
+                self._logger.debug('{:s}-{:s}-{:s}: Skipping non-numeric parameter {:s}'.format(
+                    ref_des, method, stream, name))
+
+        if 'time' not in new_columns or new_columns['time'].ndim != 1:
+            self._logger.error('{:s}-{:s}-{:s}: time is not a 1-D numeric column'.format(ref_des, method, stream))
+            return 0
+
+        times = new_columns['time']
+        count = len(times)
+
+        # Column files are flat, so only store 1-D columns with one value per particle
+        for name in list(new_columns.keys()):
+            if new_columns[name].shape != times.shape:
+                self._logger.warning('{:s}-{:s}-{:s}: Skipping parameter {:s} with shape {:}'.format(
+                    ref_des, method, stream, name, new_columns[name].shape))
+                del new_columns[name]
+
+        names = sorted(set(meta['columns']) | set(new_columns.keys()))
+
+        order = np.argsort(times, kind='mergesort')
+        old_meta = dict(meta)
+        if meta['count'] and times.size and times[order[0]] <= self._last_time(ref_des, method, stream, meta):
+            meta['count'] = self._merge(ref_des, method, stream, meta, names, new_columns)
+        else:
+            self._append(ref_des, method, stream, meta, names, new_columns, order)
+            meta['count'] += count
+
+        meta['columns'] = names
+        self._write_meta(ref_des, method, stream, meta)
+
+        # Remove the column files replaced by a merge
+        if meta.get('generation', 0) != old_meta.get('generation', 0):
+            for name in old_meta['columns']:
+                path = self._column_path(ref_des, method, stream, name, old_meta.get('generation', 0))
+                if os.path.isfile(path):
+                    os.remove(path)
+
+        self._logger.debug('{:s}-{:s}-{:s}: Stored {:d} particles'.format(ref_des, method, stream, count))
+
+        return count
+
+    def read(self, ref_des, method, stream, begin_time=None, end_time=None, columns=None):
+        """Return the particles stored for ref_des-method-stream, optionally restricted to the
+        begin_time - end_time window and to the named columns.  The window is located by binary
+        searching the time column.
+
+        Returns a dict mapping each parameter name to a read-only numpy.memmap view
+        """
+
+        meta = self._read_meta(ref_des, method, stream)
+        if not meta['count']:
+            return {}
+
+        times = self._open_column(ref_des, method, stream, 'time', meta)
+
+        i0 = 0
+        i1 = meta['count']
+        if begin_time is not None:
+            i0 = int(np.searchsorted(times, to_ms(begin_time) / 1000., side='left'))
+        if end_time is not None:
+            i1 = int(np.searchsorted(times, to_ms(end_time) / 1000., side='left'))
+
+        names = meta['columns']
+        if columns:
+            names = ['time'] + [c for c in columns if c != 'time' and c in meta['columns']]
+
+        return dict([(name, self._open_column(ref_des, method, stream, name, meta)[i0:i1])
+                     for name in names])
+
+    def _append(self, ref_des, method, stream, meta, names, new_columns, order):
+
+        count = len(order)
+        for name in names:
+            path = self._column_path(ref_des, method, stream, name, meta.get('generation', 0))
+            if name in new_columns:
+                values = new_columns[name][order]
+            else:
+                values = np.full(count, np.nan, dtype=COLUMN_DTYPE)
+
+            # Drop anything written after the last successful write
+            existing = meta['count'] if name in meta['columns'] else 0
+            if name not in meta['columns'] and meta['count']:
+                # New parameter: backfill the existing particles
+                values = np.concatenate([np.full(meta['count'], np.nan, dtype=COLUMN_DTYPE), values])
+
+            with open(path, 'ab') as fid:
+                fid.truncate(existing * np.dtype(COLUMN_DTYPE).itemsize)
+                fid.write(values.astype(COLUMN_DTYPE).tobytes())
+
+    def _merge(self, ref_des, method, stream, meta, names, new_columns):
+        """Write the merged columns as the next generation of column files and set the meta
+        generation.  The new files are not read until the meta file is written.  Stored particles
+        with the same time as a new particle (i.e.: retrieved again by windows sharing a boundary)
+        are replaced by the new particle.  Returns the merged particle count"""
+
+        old_times = np.array(self._open_column(ref_des, method, stream, 'time', meta))
+        keep = ~np.isin(old_times, new_columns['time'])
+        times = np.concatenate([old_times[keep], new_columns['time']])
+        order = np.argsort(times, kind='mergesort')
+
+        generation = meta.get('generation', 0) + 1
+        count = len(new_columns['time'])
+        for name in names:
+            if name in meta['columns']:
+                old = np.array(self._open_column(ref_des, method, stream, name, meta))
+            else:
+                old = np.full(meta['count'], np.nan, dtype=COLUMN_DTYPE)
+            new = new_columns.get(name)
+            if new is None:
+                new = np.full(count, np.nan, dtype=COLUMN_DTYPE)
+
+            # Overwrites any file left by an interrupted merge
+            with open(self._column_path(ref_des, method, stream, name, generation), 'wb') as fid:
+                fid.write(np.concatenate([old[keep], new])[order].astype(COLUMN_DTYPE).tobytes())
+
+        meta['generation'] = generation
+
+        return len(times)
+
+    def _last_time(self, ref_des, method, stream, meta):
+        return self._open_column(ref_des, method, stream, 'time', meta)[-1]
+
+    def _open_column(self, ref_des, method, stream, name, meta):
+        return np.memmap(self._column_path(ref_des, method, stream, name, meta.get('generation', 0)),
+                         dtype=COLUMN_DTYPE,
+                         mode='r',
+                         shape=(meta['count'],))
+
+    def _read_meta(self, ref_des, method, stream):
+
+        meta_file = os.path.join(self._stream_dir(ref_des, method, stream), META_FILE)
+        if not os.path.isfile(meta_file):
+            return {'columns': [], 'count': 0, 'coverage': [], 'generation': 0}
+
+        with open(meta_file, 'r') as fid:
+            return json.load(fid)
+
+    def _write_meta(self, ref_des, method, stream, meta):
+
+        stream_dir = self._stream_dir(ref_des, method, stream)
+        (fd, tmp_path) = tempfile.mkstemp(dir=stream_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fid:
+            json.dump(meta, fid)
+        os.rename(tmp_path, os.path.join(stream_dir, META_FILE))
+
+    def _column_path(self, ref_des, method, stream, name, generation=0):
+        if generation:
+            return os.path.join(self._stream_dir(ref_des, method, stream), '{:s}.{:d}.f8'.format(name, generation))
+
+        return os.path.join(self._stream_dir(ref_des, method, stream), '{:s}.f8'.format(name))
+
+    def _stream_dir(self, ref_des, method, stream):
+        return os.path.join(self._root, ref_des, method, stream)
+
+    def __repr__(self):
+        return '<ParticleStore(root={:s})>'.format(self._root)
@@ -0,0 +1,317 @@
+import logging
+import os
+import json
+import hashlib
+import tempfile
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from m2m.UFrameClient import HTTP_STATUS_OK, HTTP_STATUS_NOT_FOUND, stream_pd_ids
+from m2m.timeutils import to_ms, ms_to_iso, ms_to_uframe_ts
+
+# Maximum number of particles UFrame returns for a decimated request
+MAX_PREVIEW_LIMIT = 10000
+
+_nan = float('nan')
+
+
+class PreviewEngine(object):
+
+    def __init__(self, client, cache_dir=None, limit=1000, max_workers=8, user='anonymous', exec_dpa=False):
+        """Quick-look previews of instrument streams built from decimated application/json
+        requests.  Each preview contains at most limit particles spread over the requested time
+        window, so a multi-year overview of a stream is a single small request instead of a full
+        NetCDF job.  Requests for many streams are sent concurrently and the particles are decoded
+        into compact arrays of doubles, one per numeric parameter, with the time in seconds since
+        1970-01-01.
+
+        Previews are cached by stream, time window, limit and parameters, in memory and, if
+        cache_dir is specified, on disk, so repeated dashboard renders send no requests.
+
+        Parameters:
+            client: UFrameClient instance
+
+        kwargs:
+            cache_dir: directory containing the cached previews, which is created if it does not
+                exist
+            limit: maximum number of particles in each preview (1 - 10000)
+            max_workers: maximum number of concurrent requests
+            user: user name for the requests
+            exec_dpa: set to True to execute the data product algorithms.  Previews of derived
+                parameters need this, but the requests are slower
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        if limit < 1 or limit > MAX_PREVIEW_LIMIT:
+            self._logger.warning('Invalid preview limit {:d}: using {:d}'.format(limit, MAX_PREVIEW_LIMIT))
+            limit = MAX_PREVIEW_LIMIT
+
+        self._client = client
+        self._cache_dir = cache_dir
+        self._limit = limit
+        self._max_workers = max_workers
+        self._user = user
+        self._exec_dpa = exec_dpa
+        self._cache = {}
+
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    @property
+    def client(self):
+        return self._client
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def preview(self, ref_des, method, stream, begin_ts=None, end_ts=None, parameters=None):
+        """Return the preview of a single stream.  See previews"""
+
+        for key, preview in self.previews([(ref_des, method, stream)],
+                                          begin_ts=begin_ts,
+                                          end_ts=end_ts,
+                                          parameters=parameters):
+            return preview
+
+    def preview_instruments(self, ref_des, stream=None, telemetry=None, begin_ts=None, end_ts=None, parameters=None,
+                            ordered=False):
+        """Generator yielding the previews of the streams produced by the instruments matching the
+        fully or partially-qualified reference designator, optionally restricted to the streams
+        whose name contains stream and whose method contains telemetry.  See previews"""
+
+        streams = []
+        for instrument in self._client.search_instruments(ref_des):
+            for r in self._client.inventory.instrument_streams(instrument):
+                if stream and r.stream.find(stream) == -1:
+                    continue
+                if telemetry and r.method.find(telemetry) == -1:
+                    continue
+                streams.append(r)
+
+        for key, preview in self.previews(streams,
+                                          begin_ts=begin_ts,
+                                          end_ts=end_ts,
+                                          parameters=parameters,
+                                          ordered=ordered):
+            yield preview
+
+    def previews(self, streams, begin_ts=None, end_ts=None, parameters=None, ordered=False):
+        """Generator yielding a ((ref_des, method, stream), preview) tuple for each stream, as soon
+        as it is read from the cache or fetched.  Uncached previews are fetched concurrently and
+        yielded as they arrive unless ordered is True.  The preview is None if the request failed.
+
+        Each preview is a dict containing the reference_designator, method, stream, begin_time,
+        end_time, limit, count (number of particles) and columns, which maps each numeric
+        parameter name to an array of doubles.  Streams without particles in the window have an
+        empty preview.
+
+        Arguments:
+            streams: list of StreamRecords or (ref_des, method, stream) tuples
+
+        kwargs:
+            begin_ts: ISO-8601 window start time (Default is the stream beginTime)
+            end_ts: ISO-8601 window end time (Default is the stream endTime)
+            parameters: list of parameter names to preview (Default is all numeric parameters)
+        """
+
+        tasks = []
+        for s in streams:
+            task = self._task(s, begin_ts, end_ts, parameters)
+            if task:
+                tasks.append(task)
+
+        pd_ids = self._parameter_pd_ids([t for t in tasks if t['key'] not in self._cache], parameters)
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = [executor.submit(self._fetch, task, pd_ids) for task in tasks]
+            future_tasks = dict(zip(futures, tasks))
+            try:
+                for future in (futures if ordered else as_completed(futures)):
+                    task = future_tasks[future]
+                    yield task['stream'], future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def clear(self):
+        """Drop all cached previews"""
+
+        self._cache = {}
+        if not self._cache_dir:
+            return
+
+        for f in os.listdir(self._cache_dir):
+            if f.startswith('preview-') and f.endswith('.json'):
+                os.remove(os.path.join(self._cache_dir, f))
+
+    def _task(self, s, begin_ts, end_ts, parameters):
+        """Return the request window and cache key of the stream s, or None if the window is
+        invalid"""
+
+        if hasattr(s, 'key'):
+            stream = s.key
+            stream_begin, stream_end = s.begin_time, s.end_time
+        else:
+            stream = tuple(s)
+            stream_begin, stream_end = None, None
+            if not (begin_ts and end_ts):
+                record = [r for r in self._client.inventory.instrument_streams(stream[0]) if r.key == stream]
+                if not record:
+                    self._logger.warning('{:s}-{:s}-{:s}: Stream not found'.format(*stream))
+                    return None
+                stream_begin, stream_end = record[0].begin_time, record[0].end_time
+
+        try:
+            t0 = to_ms(begin_ts) if begin_ts else stream_begin
+            # Include the particles in the last second of the stream
+            t1 = to_ms(end_ts) if end_ts else stream_end + 1000
+        except ValueError as e:
+            self._logger.error('Invalid preview window ({:})'.format(e))
+            return None
+
+        if t0 >= t1:
+            self._logger.warning('{:s}-{:s}-{:s}: Invalid preview window'.format(*stream))
+            return None
+
+        key = hashlib.sha1(json.dumps([self._client.base_url,
+                                       stream,
+                                       t0,
+                                       t1,
+                                       self._limit,
+                                       self._exec_dpa,
+                                       sorted(parameters or [])]).encode('utf-8')).hexdigest()
+
+        return {'stream': stream, 'begin_time': t0, 'end_time': t1, 'key': key}
+
+    def _parameter_pd_ids(self, tasks, parameters):
+        """Return the dict mapping each (ref_des, stream) to the pdIds of the requested parameters,
+        so that only those parameters are requested.  The parameters of each instrument are
+        fetched with a single metadata bundle request"""
+
+        if not parameters or not tasks:
+            return {}
+
+        instruments = sorted(set([t['stream'][0] for t in tasks]))
+
+        pd_ids = {}
+        for ref_des, bundle in self._client.fetch_metadata_bundles(instruments, max_workers=self._max_workers):
+            for p in (bundle or {}).get('parameters', []):
+                pd_ids.setdefault((ref_des, p.get('stream')), []).append(p)
+
+        return dict([(k, stream_pd_ids(parameters, v)) for k, v in pd_ids.items()])
+
+    def _fetch(self, task, pd_ids):
+        """Return the cached or fetched preview of the task.  Called from the worker threads"""
+
+        cached = self._cached_preview(task['key'])
+        if cached is not None:
+            return cached
+
+        (ref_des, method, stream) = task['stream']
+
+        parameters = None
+        if pd_ids:
+            parameters = pd_ids.get((ref_des, stream))
+            if not parameters:
+                self._logger.info('{:s}-{:s}: Stream contains none of the requested parameters'.format(ref_des, stream))
+                return None
+
+        url = self._client.build_stream_query(ref_des,
+                                              method,
+                                              stream,
+                                              self._user,
+                                              ms_to_iso(task['begin_time']),
+                                              ms_to_iso(task['end_time']),
+                                              exec_dpa=self._exec_dpa,
+                                              application_type='json',
+                                              provenance=False,
+                                              limit=self._limit,
+                                              parameters=parameters)
+
+        (status_code, reason, particles) = self._client.get_particles(url)
+        if status_code == HTTP_STATUS_NOT_FOUND:
+            # No particles in the window
+            columns = {}
+        elif status_code != HTTP_STATUS_OK or particles is None:
+            self._logger.error('{:s}-{:s}-{:s}: Preview request failed ({:})'.format(ref_des, method, stream, reason))
+            return None
+        else:
+            columns = particles.arrays()
+
+        preview = OrderedDict()
+        preview['reference_designator'] = ref_des
+        preview['method'] = method
+        preview['stream'] = stream
+        preview['begin_time'] = ms_to_uframe_ts(task['begin_time'])
+        preview['end_time'] = ms_to_uframe_ts(task['end_time'])
+        preview['limit'] = self._limit
+        preview['count'] = len(columns.get('time', []))
+        preview['columns'] = columns
+
+        self._cache_preview(task['key'], preview)
+
+        return preview
+
+    def _cached_preview(self, key):
+
+        preview = self._cache.get(key)
+        if preview is not None or not self._cache_dir:
+            return preview
+
+        cache_file = self._cache_file(key)
+        if not os.path.isfile(cache_file):
+            return None
+
+        try:
+            with open(cache_file, 'r') as fid:
+                preview = json.load(fid, object_pairs_hook=OrderedDict)
+        except (IOError, ValueError) as e:
+            self._logger.warning('Invalid cached preview {:s} ({:})'.format(cache_file, e))
+            return None
+
+        preview['columns'] = dict([(name, array('d', [_nan if v is None else v for v in values]))
+                                   for name, values in preview['columns'].items()])
+        self._cache[key] = preview
+
+        return preview
+
+    def _cache_preview(self, key, preview):
+
+        self._cache[key] = preview
+        if not self._cache_dir:
+            return
+
+        (fd, tmp_path) = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fid:
+                json.dump(preview_to_dict(preview), fid)
+            os.rename(tmp_path, self._cache_file(key))
+        except (IOError, OSError) as e:
+            self._logger.warning('Unable to cache preview ({:})'.format(e))
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+    def _cache_file(self, key):
+        return os.path.join(self._cache_dir, 'preview-{:s}.json'.format(key))
+
+    def __repr__(self):
+        return '<PreviewEngine(client={:}, limit={:d}, cache_dir={:})>'.format(self._client,
+                                                                             self._limit,
+                                                                             self._cache_dir)
+
+
+def preview_to_dict(preview):
+    """Return a copy of the preview whose columns are lists, which may be serialized as JSON.
+    NaN values are written as null"""
+
+    d = OrderedDict([(k, v) for k, v in preview.items() if k != 'columns'])
+    d['columns'] = dict([(name, [None if v != v else v for v in values])
+                         for name, values in preview['columns'].items()])
+
+    return d
@@ -0,0 +1,282 @@
+import logging
+import json
+import time
+import socket
+import os
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+REQUEST_STATES = [QUEUED,
+                  IN_FLIGHT,
+                  DONE,
+                  FAILED]
+
+_schema = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    url TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    status_code INTEGER,
+    reason TEXT,
+    response TEXT,
+    enqueued REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS requests_state ON requests (state, lease_expires);
+"""
+
+
+def request_key(url):
+    """Return the idempotency key for the request url"""
+
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def is_transient(status_code):
+    """Return True if a request that failed with status_code may succeed if it is sent again: the
+    request was not answered (status_code is None), was rate limited (429) or failed with a server
+    error (5xx)"""
+
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+class RequestQueue(object):
+
+    def __init__(self, db_path, lease_seconds=600, max_attempts=3):
+        """Durable, crash-safe queue of UFrame request urls backed by a SQLite database in
+        write-ahead logging (WAL) mode.  Each url is stored once, keyed by its idempotency key,
+        and moves through the queued, in_flight, done and failed states.  Workers lease queued
+        requests for lease_seconds.  Requests leased by a worker that died are leased again once
+        the lease expires, or marked as failed if they have been attempted max_attempts times, so
+        an interrupted batch is resumed by simply processing the queue again, skipping all
+        completed requests.  A worker may only finish requests it still holds the lease on.
+
+        Parameters:
+            db_path: path to the SQLite queue database, which is created if it does not exist
+
+        kwargs:
+            lease_seconds: number of seconds a worker owns a leased request
+            max_attempts: number of times a request is attempted before it is marked as failed
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._db_path = db_path
+        self._lease_seconds = lease_seconds
+        self._max_attempts = max_attempts
+        self._local = threading.local()
+
+        db = self._db()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(_schema)
+
+    @property
+    def db_path(self):
+        return self._db_path
+
+    def enqueue(self, urls):
+        """Add the urls to the queue.  Urls that have already been enqueued, regardless of their
+        state, are ignored.  Returns the number of urls added"""
+
+        now = time.time()
+        db = self._db()
+        before = db.total_changes
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany('INSERT OR IGNORE INTO requests (key, url, state, enqueued, updated) '
+                           'VALUES (?, ?, ?, ?, ?)',
+                           [(request_key(u), u, QUEUED, now, now) for u in urls])
+            db.execute('COMMIT')
+        except sqlite3.Error:
+            db.execute('ROLLBACK')
+            raise
+        added = db.total_changes - before
+
+        self._logger.debug('Enqueued {:d} of {:d} requests'.format(added, len(urls)))
+
+        return added
+
+    def lease(self, worker):
+        """Lease the next queued request, or in_flight request whose lease has expired, to
+        worker.  Expired requests that have been attempted max_attempts times are marked as failed
+        instead.  Returns a (key, url) tuple or None if there is nothing left to do"""
+
+        now = time.time()
+        db = self._db()
+
+        # BEGIN IMMEDIATE takes the write lock, so no two workers can lease the same request
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            expired = db.execute('UPDATE requests SET state = ?, worker = NULL, lease_expires = NULL, reason = ?, '
+                                 'updated = ? WHERE state = ? AND lease_expires < ? AND attempts >= ?',
+                                 (FAILED, 'Lease expired', now, IN_FLIGHT, now, self._max_attempts)).rowcount
+            if expired:
+                self._logger.warning('{:d} expired requests reached the maximum number of attempts'.format(expired))
+
+            row = db.execute('SELECT key, url, attempts FROM requests '
+                             'WHERE state = ? OR (state = ? AND lease_expires < ?) '
+                             'ORDER BY id LIMIT 1',
+                             (QUEUED, IN_FLIGHT, now)).fetchone()
+            if not row:
+                db.execute('COMMIT')
+                return None
+
+            db.execute('UPDATE requests SET state = ?, worker = ?, lease_expires = ?, attempts = ?, updated = ? '
+                       'WHERE key = ?',
+                       (IN_FLIGHT, worker, now + self._lease_seconds, row[2] + 1, now, row[0]))
+            db.execute('COMMIT')
+        except sqlite3.Error:
+            db.execute('ROLLBACK')
+            raise
+
+        return row[0], row[1]
+
+    def complete(self, key, worker, status_code, reason, response):
+        """Mark the request leased to worker as done and store the response.  Returns False if
+        worker no longer holds the lease"""
+
+        return self._finish(key, worker, DONE, status_code, reason, response)
+
+    def fail(self, key, worker, status_code, reason, response=None, retry=True):
+        """Return the request leased to worker to the queue, or mark it as failed if retry is
+        False or it has been attempted max_attempts times.  Returns False if worker no longer
+        holds the lease"""
+
+        row = self._db().execute('SELECT attempts FROM requests WHERE key = ?', (key,)).fetchone()
+        if retry and row and row[0] < self._max_attempts:
+            state = QUEUED
+        else:
+            state = FAILED
+
+        return self._finish(key, worker, state, status_code, reason, response)
+
+    def recover(self):
+        """Return all in_flight requests to the queue without waiting for their leases to expire.
+        Only call this method when no other process is working the queue, i.e.: when restarting a
+        single process after a crash.  Returns the number of requests recovered"""
+
+        cursor = self._db().execute('UPDATE requests SET state = ?, worker = NULL, lease_expires = NULL, updated = ? '
+                                    'WHERE state = ?',
+                                    (QUEUED, time.time(), IN_FLIGHT))
+
+        return cursor.rowcount
+
+    def requeue_failed(self):
+        """Return all failed requests to the queue and reset their attempt counts.  Returns the
+        number of requests requeued"""
+
+        cursor = self._db().execute('UPDATE requests SET state = ?, attempts = 0, updated = ? WHERE state = ?',
+                                    (QUEUED, time.time(), FAILED))
+
+        return cursor.rowcount
+
+    def counts(self):
+        """Return a dict mapping each request state to the number of requests in that state"""
+
+        counts = dict([(s, 0) for s in REQUEST_STATES])
+        for state, count in self._db().execute('SELECT state, COUNT(*) FROM requests GROUP BY state'):
+            counts[state] = count
+
+        return counts
+
+    def requests(self, state=None):
+        """Return the list of requests, optionally restricted to those in state, in the order
+        they were enqueued"""
+
+        cols = ['key', 'url', 'state', 'attempts', 'status_code', 'reason', 'response']
+        sql = 'SELECT {:s} FROM requests'.format(', '.join(cols))
+        values = []
+        if state:
+            sql += ' WHERE state = ?'
+            values.append(state)
+        sql += ' ORDER BY id'
+
+        requests = []
+        for row in self._db().execute(sql, values):
+            request = dict(zip(cols, row))
+            if request['response'] is not None:
+                request['response'] = json.loads(request['response'])
+            requests.append(request)
+
+        return requests
+
+    def process(self, client, workers=4):
+        """Send all outstanding requests in the queue with client, using workers concurrent
+        workers, each of which leases one request at a time.  Returns the request state counts
+        once the queue has been drained
+
+        Arguments:
+            client: UFrameClient instance used to send the requests
+        """
+
+        worker_prefix = '{:s}:{:d}'.format(socket.gethostname(), os.getpid())
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._work, client, '{:s}:{:d}'.format(worker_prefix, i))
+                       for i in range(workers)]
+            for f in futures:
+                f.result()
+
+        return self.counts()
+
+    def _work(self, client, worker):
+
+        count = 0
+        while True:
+            leased = self.lease(worker)
+            if not leased:
+                break
+
+            (key, url) = leased
+            (status_code, reason, response) = client.get(url)
+            if status_code == 200:
+                self.complete(key, worker, status_code, reason, response)
+            else:
+                # Only retry requests that may succeed if sent again
+                self.fail(key, worker, status_code, reason, response, retry=is_transient(status_code))
+
+            count += 1
+
+        self._logger.debug('Worker {:s} processed {:d} requests'.format(worker, count))
+
+        return count
+
+    def _finish(self, key, worker, state, status_code, reason, response):
+
+        # The request may have been leased to another worker after the lease of worker expired
+        cursor = self._db().execute('UPDATE requests SET state = ?, worker = NULL, lease_expires = NULL, '
+                                    'status_code = ?, reason = ?, response = ?, updated = ? '
+                                    'WHERE key = ? AND state = ? AND worker = ?',
+                                    (state, status_code, reason, json.dumps(response), time.time(), key, IN_FLIGHT,
+                                     worker))
+        if not cursor.rowcount:
+            self._logger.warning('Worker {:s} no longer holds the lease on request {:s}'.format(worker, key))
+            return False
+
+        return True
+
+    def _db(self):
+        """Return the SQLite connection for the calling thread"""
+
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            # isolation_level=None leaves transaction control to the explicit BEGIN statements
+            db = sqlite3.connect(self._db_path, timeout=60, isolation_level=None)
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+
+        return db
+
+    def __repr__(self):
+        return '<RequestQueue(db_path={:s})>'.format(self._db_path)
@@ -0,0 +1,179 @@
+import logging
+import os
+import re
+import json
+import tempfile
+import datetime
+from m2m.timeutils import iso_to_ms, ms_to_iso
+
+_url_regex = re.compile(r'/sensor/inv/(\w+)/(\w+)/(\w+-\w+)/(\w+)/(\w+)\?')
+
+
+def key_from_url(url):
+    """Return the (ref_des, method, stream) key for the UFrame data request url or None
+    if the url is not a data request"""
+
+    match = _url_regex.search(url)
+    if not match:
+        return None
+
+    return '-'.join(match.groups()[:3]), match.group(4), match.group(5)
+
+
+class StreamSync(object):
+
+    def __init__(self, state_file):
+        """Keeps track of the end time of the data last requested for each reference designator,
+        method and stream (the high-water mark) in a JSON state file, so that subsequent calls
+        to UFrameClient.instrument_to_query(..., sync=StreamSync) only create requests for
+        streams that have grown, covering only the new time window.
+
+        Marks are staged when the request urls are created and are only written to the state
+        file once commit() is called, typically after the requests have been sent.
+
+        Parameters:
+            state_file: path to the JSON state file, which is created if it does not exist
+        """
+
+        self._logger = logging.getLogger(__name__)
+
+        self._state_file = state_file
+        self._marks = {}
+        self._pending = {}
+
+        self.load()
+
+    @property
+    def state_file(self):
+        return self._state_file
+
+    @property
+    def marks(self):
+        """dict mapping (ref_des, method, stream) to the committed high-water mark, in
+        milliseconds since 1970-01-01"""
+        return self._marks
+
+    @property
+    def pending(self):
+        """dict mapping (ref_des, method, stream) to the staged high-water mark, in
+        milliseconds since 1970-01-01"""
+        return self._pending
+
+    def load(self):
+        """Load the high-water marks from the state file"""
+
+        self._marks = {}
+        self._pending = {}
+
+        if not os.path.isfile(self._state_file):
+            self._logger.debug('No sync state file found: {:s}'.format(self._state_file))
+            return
+
+        try:
+            with open(self._state_file, 'r') as fid:
+                state = json.load(fid)
+        except (IOError, ValueError) as e:
+            self._logger.error('Error reading sync state file {:s} ({:})'.format(self._state_file, e))
+            return
+
+        for mark in state.get('marks', []):
+            self._marks[(mark['reference_designator'], mark['method'], mark['stream'])] = mark['end_time']
+
+    def save(self):
+        """Write the committed high-water marks to the state file.  The file is written to a
+        temporary file which replaces the state file, so that an interrupted write never leaves
+        a truncated state file behind"""
+
+        marks = [{'reference_designator': k[0],
+                  'method': k[1],
+                  'stream': k[2],
+                  'end_time': v,
+                  'end_ts': ms_to_iso(v)} for k, v in sorted(self._marks.items())]
+
+        state = {'updated': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                 'marks': marks}
+
+        state_dir = os.path.dirname(os.path.realpath(self._state_file))
+        (fd, tmp_path) = tempfile.mkstemp(dir=state_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fid:
+                json.dump(state, fid, indent=4, sort_keys=True)
+            os.rename(tmp_path, self._state_file)
+        except (IOError, OSError) as e:
+            self._logger.error('Error writing sync state file {:s} ({:})'.format(self._state_file, e))
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+        return True
+
+    def new_data_begin(self, ref_des, method, stream, end_time, begin_ts, end_ts=None):
+        """Return the request start timestamp for the data in ref_des-method-stream that arrived
+        after the high-water mark, or None if the stream has not grown or the window between the
+        high-water mark and end_ts is empty.  The earlier of the stream end_time and end_ts is
+        staged as the new high-water mark, so data after a requested end time is requested by a
+        later sync.
+
+        Arguments:
+            ref_des: fully-qualified reference designator
+            method: stream delivery method
+            stream: stream name
+            end_time: ISO-8601 stream endTime reported by UFrameClient.fetch_instrument_streams
+            begin_ts: ISO-8601 start timestamp that would be requested without syncing
+
+        kwargs:
+            end_ts: ISO-8601 end timestamp of the request (Default is the stream end_time)
+        """
+
+        key = (ref_des, method, stream)
+
+        end_ms = iso_to_ms(end_time)
+        request_end_ms = iso_to_ms(end_ts) if end_ts else None
+        if request_end_ms is not None:
+            end_ms = min(end_ms, request_end_ms)
+
+        mark = self._marks.get(key)
+        if mark is not None and end_ms <= mark:
+            self._logger.debug('{:s}-{:s}-{:s}: No new data since {:s}'.format(ref_des, method, stream,
+                                                                               ms_to_iso(mark)))
+            return None
+
+        if mark is not None and request_end_ms is not None and mark + 1 >= request_end_ms:
+            self._logger.debug('{:s}-{:s}-{:s}: Requested end time is not after {:s}'.format(ref_des, method, stream,
+                                                                                              ms_to_iso(mark)))
+            return None
+
+        self._pending[key] = end_ms
+
+        if mark is None or iso_to_ms(begin_ts) > mark:
+            return begin_ts
+
+        # Start 1 millisecond after the last particle already requested
+        return ms_to_iso(mark + 1)
+
+    def commit(self, urls=None):
+        """Promote the staged high-water marks to committed marks and write the state file.
+        If urls is specified, only the marks for the streams requested by urls are committed"""
+
+        if urls is None:
+            keys = list(self._pending.keys())
+        else:
+            keys = [k for k in [key_from_url(u) for u in urls] if k in self._pending]
+
+        for key in keys:
+            self._marks[key] = self._pending.pop(key)
+
+        return self.save()
+
+    def reset(self, ref_des=None):
+        """Remove the committed high-water marks for all streams produced by the fully or
+        partially-qualified reference designator (Default is all streams)"""
+
+        for key in list(self._marks.keys()):
+            if ref_des is None or key[0].find(ref_des) > -1:
+                del self._marks[key]
+
+        return self.save()
+
+    def __repr__(self):
+        return '<StreamSync(state_file={:s}, marks={:d})>'.format(self._state_file, len(self._marks))
@@ -1,10 +1,19 @@
 import logging
+import time
 import requests
 import re
 from dateutil import parser
 from dateutil.relativedelta import relativedelta as tdelta
-import datetime
 import pytz
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from m2m.AsyncDownloader import AsyncDownloader
+from m2m.ParticleColumns import ParticleColumns
+from m2m.Inventory import Inventory, _pd_number
+from m2m.InventorySnapshot import InventorySnapshot
+from m2m.jsonstream import iter_array_items, iter_object_items
+from m2m.timeutils import datetime_to_ms, ms_to_datetime, ms_to_iso, to_ms
+from m2m.deployments import deployment_records, deployment_windows
+from m2m.records import stream_records
 
 # Disables SSL warnings
 import requests.packages.urllib3
@@ -14,6 +23,16 @@ requests.packages.urllib3.disable_warnings()
 HTTP_STATUS_OK = 200
 HTTP_STATUS_NOT_FOUND = 404
 
+# Instrument request types and the corresponding sensor inventory metadata end points
+INSTRUMENT_REQUEST_TYPES = {'streams': 'metadata/times',
+                            'parameters': 'metadata/parameters',
+                            'metadata': 'metadata',
+                            'deployments': None}
+
+# Metadata bundle key containing the response of each instrument request type
+BUNDLE_KEYS = {'streams': 'times',
+               'parameters': 'parameters'}
+
 DEPLOYMENT_STATUS_TYPES = ['all',
     'active',
     'inactive']
@@ -29,7 +48,8 @@ _valid_relativedeltatypes = ('years',
 
 class UFrameClient(object):
 
-    def __init__(self, base_url, m2m=True, timeout=120, api_username=None, api_token=None):
+    def __init__(self, base_url, m2m=True, timeout=120, api_username=None, api_token=None, stream_toc=False,
+                 inventory=True, snapshot=None, metadata_max_age=3600):
         """Lightweight OOI UFrame client for making GET requests to the UFrame API via
         the machine to machine (m2m) API or directly to UFrame.
         
@@ -41,6 +61,15 @@ class UFrameClient(object):
             timeout: request timeout, in seconds
             api_username: API username from the UI user settings
             api_token: API password from the UI user settings
+            stream_toc: If true, the table of contents is parsed incrementally as it is downloaded, reducing the
+                peak memory used to build the inventory
+            inventory: If false, the table of contents is not fetched.  Instrument searches return no instruments,
+                but all requests for fully-qualified reference designators may still be sent
+            snapshot: path to an InventorySnapshot database (see save_snapshot).  If specified, the client works
+                offline: the inventory and all metadata requests are answered from the snapshot and no requests
+                are sent to UFrame.  base_url may be None, in which case the snapshot base_url is used
+            metadata_max_age: number of seconds a cached metadata bundle is used before it is fetched again.  None
+                keeps bundles until they are cleared (see fetch_metadata_bundles)
         """
         
         self._base_url = None
@@ -51,11 +80,20 @@ class UFrameClient(object):
         self._session = requests.Session()
         self._is_m2m = m2m
         #self._valid_uframe = True
-        self._instruments = []
         self._subsites = []
-        self._instrument_streams = []
-        self._streams = []
-        self._toc = None
+        self._inventory = Inventory()
+        self._stream_toc = stream_toc
+        self._fetch_inventory = inventory
+        # Metadata bundles (stream times and parameters) and the time each was cached, by reference designator
+        self._metadata = {}
+        self._metadata_times = {}
+        self._metadata_max_age = metadata_max_age
+        # (time parsed, StreamRecords) tuples, by reference designator.  Dropped with the metadata bundle
+        self._stream_records = {}
+        self._snapshot = None
+        if snapshot:
+            self._snapshot = InventorySnapshot(snapshot)
+            base_url = base_url or self._snapshot.info.get('base_url')
 
         self._logger = logging.getLogger(__name__)
 
@@ -67,7 +105,7 @@ class UFrameClient(object):
         self._response_headers = None
 
         # Set the base url
-        self._logger.debug('Creating M2mClient instance ({:s})'.format(base_url))
+        self._logger.debug('Creating M2mClient instance ({:})'.format(base_url))
         self.base_url = base_url
 
     @property
@@ -101,7 +139,8 @@ class UFrameClient(object):
             return
 
         # Create the instrument list
-        self._create_instrument_list()
+        if self._fetch_inventory:
+            self._create_instrument_list()
 
     @property
     def is_m2m(self):
@@ -121,6 +160,15 @@ class UFrameClient(object):
     def m2m_base_url(self):
         return self._m2m_base_url
 
+    @property
+    def snapshot(self):
+        """InventorySnapshot answering requests if the client is offline"""
+        return self._snapshot
+
+    @property
+    def is_offline(self):
+        return self._snapshot is not None
+
     @property
     def timeout(self):
         return self._timeout
@@ -151,15 +199,23 @@ class UFrameClient(object):
 
     @property
     def instruments(self):
-        return self._instruments
+        return self._inventory.instruments
         
     @property
     def streams(self):
-        return self._streams
+        return self._inventory.streams
+
+    @property
+    def inventory(self):
+        return self._inventory
 
     @property
     def toc(self):
-        return self._toc
+        """Table of contents rebuilt from the compact inventory and cached until the inventory
+        changes.  See Inventory.to_toc for the fields it contains"""
+        if not len(self._inventory):
+            return None
+        return self._inventory.to_toc()
 
     def fetch_table_of_contents(self):
 
@@ -168,11 +224,95 @@ class UFrameClient(object):
             self._logger.error('Failed to create instruments list')
             return
 
-        # Save the table of contents if we fetch it
-        self._toc = toc
+        # Index the table of contents.  The raw response is not kept
+        inventory = Inventory()
+        for instrument in toc['instruments']:
+            inventory.add_instrument(instrument)
+        inventory.set_parameters(toc.get('parameters_by_stream', {}), toc.get('parameter_definitions', []))
+        self._inventory = inventory
+        self._response = None
 
         return True
 
+    def stream_table_of_contents(self):
+        """Fetch the table of contents, parsing the response incrementally as it is read from the
+        socket.  The inventory is built directly from each instrument entry, so neither the response
+        text nor the full instruments array is ever held in memory"""
+
+        # The snapshot is already indexed
+        if self._snapshot:
+            return self.fetch_table_of_contents()
+
+        url = self.build_request(12576, 'sensor/inv/toc')
+
+        self._request_url = url
+        self._response = None
+        self._status_code = None
+        self._reason = None
+        self._response_headers = None
+
+        if not self._is_valid_url(url):
+            return
+
+        r = self._session_get(url, stream=True)
+        if r is None:
+            return
+
+        toc = {}
+        inventory = Inventory()
+        try:
+            self._status_code = r.status_code
+            self._reason = r.reason
+            self._response_headers = r.headers
+            if self._status_code != HTTP_STATUS_OK:
+                self._logger.error('Failed to create instruments list')
+                return
+
+            for key, value in iter_object_items(r.iter_content(chunk_size=65536), ['instruments']):
+                if key == 'instruments':
+                    inventory.add_instrument(value)
+                else:
+                    toc[key] = value
+        except ValueError as e:
+            self._logger.error('Invalid table of contents ({:}): {:s}'.format(e, url))
+            return
+        finally:
+            r.close()
+
+        inventory.set_parameters(toc.get('parameters_by_stream', {}), toc.get('parameter_definitions', []))
+        self._inventory = inventory
+
+        return True
+
+    def refresh_inventory(self):
+        """Fetch the table of contents and update only the instruments and streams that were
+        added, removed or changed (beginTime, endTime or count) since the inventory was last
+        built or refreshed.  Returns the list of change dicts (see Inventory.update) or None if
+        the table of contents could not be fetched"""
+
+        current = self._inventory
+
+        if self._stream_toc:
+            fetched = self.stream_table_of_contents()
+        else:
+            fetched = self.fetch_table_of_contents()
+
+        latest = self._inventory
+        self._inventory = current
+        if not fetched:
+            return None
+
+        changes = current.update(latest)
+
+        # Cached metadata bundles of changed instruments are stale
+        for ref_des in set([c['reference_designator'] for c in changes]):
+            self._drop_metadata(ref_des)
+        self._expire_metadata()
+
+        self._logger.debug('Inventory refreshed: {:d} changes'.format(len(changes)))
+
+        return changes
+
     def fetch_subsites(self):
         """Fetch all registered subsites from the /sensor/inv API endpoint"""
 
@@ -212,27 +352,60 @@ class UFrameClient(object):
         else:
             return None
 
-    def fetch_instrument_streams(self, ref_des):
-        """Fetch all streams produced by the fully-qualified reference designator"""
+    def fetch_nodes(self, subsite):
+        """Fetch all registered nodes on the subsite from the /sensor/inv API endpoint"""
 
-        self._logger.debug('Fetching {:s} streams'.format(ref_des))
+        self._logger.debug('Fetching {:s} nodes'.format(subsite))
 
-        r_tokens = ref_des.split('-')
-        if len(r_tokens) != 4:
-            self._logger.error('Incomplete reference designator specified {:s}'.format(ref_des))
+        port = 12576
+        end_point = '/sensor/inv/{:s}'.format(subsite)
+
+        request_url = self.build_request(port,
+                                         end_point)
+
+        # Send the request
+        self.send_request(request_url)
+
+        if self._status_code == HTTP_STATUS_OK:
+            return self._response
+        else:
             return None
 
+    def fetch_sensors(self, subsite, node):
+        """Fetch all registered sensors on the subsite node from the /sensor/inv API endpoint"""
+
+        self._logger.debug('Fetching {:s}-{:s} sensors'.format(subsite, node))
+
         port = 12576
-        end_point = '/sensor/inv/{:s}/{:s}/{:s}-{:s}/metadata/times'.format(r_tokens[0],
-                                                                            r_tokens[1],
-                                                                            r_tokens[2],
-                                                                            r_tokens[3])
+        end_point = '/sensor/inv/{:s}/{:s}'.format(subsite, node)
 
         request_url = self.build_request(port,
                                          end_point)
 
         # Send the request
         self.send_request(request_url)
+
+        if self._status_code == HTTP_STATUS_OK:
+            return self._response
+        else:
+            return None
+
+    def fetch_instrument_streams(self, ref_des):
+        """Fetch all streams produced by the fully-qualified reference designator.  Answered from
+        the cached metadata bundle, if any"""
+
+        cached = self._cached_metadata('streams', ref_des)
+        if cached is not None:
+            return self._cache_hit('streams', ref_des, cached)
+
+        self._logger.debug('Fetching {:s} streams'.format(ref_des))
+
+        request_url = self.build_instrument_request('streams', ref_des)
+        if not request_url:
+            return None
+
+        # Send the request
+        self.send_request(request_url)
         
         if self._status_code == HTTP_STATUS_OK:
             return self._response
@@ -241,20 +414,17 @@ class UFrameClient(object):
 
     def fetch_instrument_parameters(self, ref_des):
         """Fetch all parameters in the streams produced by the fully-qualified
-        reference designator"""
-
-        self._logger.debug('{:s} - Fetching instrument parameters'.format(ref_des))
+        reference designator.  Answered from the cached metadata bundle, if any"""
 
-        r_tokens = ref_des.split('-')
+        cached = self._cached_metadata('parameters', ref_des)
+        if cached is not None:
+            return self._cache_hit('parameters', ref_des, cached)
 
-        port = 12576
-        end_point = '/sensor/inv/{:s}/{:s}/{:s}-{:s}/metadata/parameters'.format(r_tokens[0],
-                                                                                 r_tokens[1],
-                                                                                 r_tokens[2],
-                                                                                 r_tokens[3])
+        self._logger.debug('{:s} - Fetching instrument parameters'.format(ref_des))
 
-        request_url = self.build_request(port,
-                                         end_point)
+        request_url = self.build_instrument_request('parameters', ref_des)
+        if not request_url:
+            return None
 
         # Send the request
         self.send_request(request_url)
@@ -270,19 +440,9 @@ class UFrameClient(object):
 
         self._logger.debug('{:s} - Fetching instrument metadata'.format(ref_des))
 
-        r_tokens = ref_des.split('-')
-        if len(r_tokens) != 4:
-            self._logger.error('Incomplete reference designator specified {:s}'.format(ref_des))
+        request_url = self.build_instrument_request('metadata', ref_des)
+        if not request_url:
             return None
-            
-        port = 12576
-        end_point = '/sensor/inv/{:s}/{:s}/{:s}-{:s}/metadata'.format(r_tokens[0],
-                                                                      r_tokens[1],
-                                                                      r_tokens[2],
-                                                                      r_tokens[3])
-
-        request_url = self.build_request(port,
-                                         end_point)
 
         # Send the request
         self.send_request(request_url)
@@ -292,16 +452,184 @@ class UFrameClient(object):
         else:
             return None
 
+    def fetch_metadata_bundle(self, ref_des):
+        """Fetch the streams and parameters produced by the fully-qualified reference designator
+        with a single metadata request and cache both, so that the following streams and
+        parameters requests for the instrument are answered without sending a request.  Returns
+        the bundle dict containing the times (streams) and parameters lists, or None if the request
+        failed.  See fetch_metadata_bundles"""
+
+        cached = self._cached_metadata('metadata', ref_des)
+        if cached is not None:
+            return self._cache_hit('metadata', ref_des, cached)
+
+        bundle = self.fetch_instrument_metadata(ref_des)
+        if bundle is None:
+            return None
+
+        return self._cache_metadata(ref_des, bundle)
+
+    def fetch_metadata_bundles(self, ref_des_list, max_workers=4, ordered=True):
+        """Generator fetching the metadata bundle of each fully-qualified reference designator in
+        ref_des_list with the bulk fetch path, sending one metadata request per instrument instead
+        of separate streams and parameters requests.  Yields a (ref_des, bundle) tuple for each
+        reference designator, where bundle is None if the request failed.  Bundles already cached
+        are not fetched again.  Cached bundles are kept until they are older than the client
+        metadata_max_age, clear_metadata_cache is called or refresh_inventory reports a change to
+        the instrument"""
+
+        for ref_des, bundle in self.fetch_bulk('metadata', ref_des_list, max_workers=max_workers, ordered=ordered):
+            if bundle is not None:
+                bundle = self._cache_metadata(ref_des, bundle)
+            yield ref_des, bundle
+
+    def clear_metadata_cache(self, ref_des=None):
+        """Drop the cached metadata bundle of the fully-qualified reference designator or, if not
+        specified, all cached metadata bundles"""
+
+        if ref_des:
+            self._drop_metadata(ref_des)
+        else:
+            self._metadata = {}
+            self._metadata_times = {}
+            self._stream_records = {}
+
+    def _drop_metadata(self, ref_des):
+
+        self._metadata.pop(ref_des, None)
+        self._metadata_times.pop(ref_des, None)
+        self._stream_records.pop(ref_des, None)
+
+    def _expire_metadata(self):
+        """Drop the cached metadata bundles older than metadata_max_age"""
+
+        if self._metadata_max_age is None:
+            return
+
+        expired = time.time() - self._metadata_max_age
+        for ref_des, cached_time in list(self._metadata_times.items()):
+            if cached_time < expired:
+                self._drop_metadata(ref_des)
+        for ref_des, (cached_time, records) in list(self._stream_records.items()):
+            if cached_time < expired:
+                self._stream_records.pop(ref_des, None)
+
+    def _cache_metadata(self, ref_des, bundle):
+
+        self._stream_records.pop(ref_des, None)
+        self._metadata[ref_des] = {'times': bundle.get('times') or [],
+                                   'parameters': bundle.get('parameters') or []}
+        self._metadata_times[ref_des] = time.time()
+
+        return self._cached_metadata('metadata', ref_des)
+
+    def _cached_metadata(self, kind, ref_des):
+        """Return a copy of the cached streams, parameters or metadata (kind) response of the
+        reference designator, or None if no bundle is cached.  Callers may modify the copy"""
+
+        bundle = self._metadata.get(ref_des)
+        if bundle is None or (kind != 'metadata' and kind not in BUNDLE_KEYS):
+            return None
+
+        if self._metadata_max_age is not None and \
+                time.time() - self._metadata_times.get(ref_des, 0) > self._metadata_max_age:
+            self._drop_metadata(ref_des)
+            return None
+
+        if kind == 'metadata':
+            return dict([(k, [dict(r) for r in bundle[k]]) for k in bundle])
+
+        return [dict(r) for r in bundle[BUNDLE_KEYS[kind]]]
+
+    def fetch_instrument_stream_records(self, ref_des):
+        """Fetch the streams produced by the fully-qualified reference designator and return them as
+        StreamRecords, with the beginTime and endTime of each stream parsed once to integer
+        milliseconds.  Streams with unparseable times are skipped.  Returns [] if the request failed.
+        See fetch_stream_records"""
+
+        for ref_des, records in self.fetch_stream_records([ref_des]):
+            return records
+
+    def fetch_stream_records(self, ref_des_list, max_workers=4, ordered=True):
+        """Generator fetching the streams produced by each fully-qualified reference designator in
+        ref_des_list with the bulk fetch path and converting them to StreamRecords.  Yields a
+        (ref_des, records) tuple for each reference designator, where records is [] if the request
+        failed.  The records of each instrument are parsed once and cached, whether the streams
+        were fetched or taken from the metadata bundle, so instruments with cached records are not
+        fetched again.  Cached records are dropped with the metadata bundle of the instrument: when
+        they are older than the client metadata_max_age, clear_metadata_cache is called, a new
+        bundle is cached or refresh_inventory reports a change to the instrument.  Cached records
+        are yielded first unless ordered is True"""
+
+        cached = {}
+        for ref_des in ref_des_list:
+            records = self._cached_stream_records(ref_des)
+            if records is not None:
+                cached[ref_des] = records
+
+        fetched = self.fetch_bulk('streams',
+                                  [ref_des for ref_des in ref_des_list if ref_des not in cached],
+                                  max_workers=max_workers,
+                                  ordered=ordered)
+
+        if not ordered:
+            for ref_des in ref_des_list:
+                if ref_des in cached:
+                    yield ref_des, list(cached[ref_des])
+            for ref_des, streams in fetched:
+                yield ref_des, self._parse_stream_records(ref_des, streams)
+            return
+
+        for ref_des in ref_des_list:
+            if ref_des in cached:
+                yield ref_des, list(cached[ref_des])
+                continue
+            (ref_des, streams) = next(fetched)
+            yield ref_des, self._parse_stream_records(ref_des, streams)
+
+    def _parse_stream_records(self, ref_des, streams):
+        """Return the cached StreamRecords of the reference designator or parse and cache the
+        records of the streams response.  Empty responses, which include failed requests, are
+        not cached"""
+
+        records = self._cached_stream_records(ref_des)
+        if records is None:
+            records = stream_records(ref_des, streams or [])
+            if records:
+                self._stream_records[ref_des] = (time.time(), records)
+
+        return list(records)
+
+    def _cached_stream_records(self, ref_des):
+
+        cached = self._stream_records.get(ref_des)
+        if cached is None:
+            return None
+
+        if self._metadata_max_age is not None and time.time() - cached[0] > self._metadata_max_age:
+            self._stream_records.pop(ref_des, None)
+            return None
+
+        return cached[1]
+
+    def _cache_hit(self, kind, ref_des, cached):
+        """Set the last request properties as if the streams, parameters or metadata (kind) request
+        had been sent and answered with the cached response"""
+
+        self._request_url = self.build_instrument_request(kind, ref_des)
+        self._response = cached
+        self._status_code = HTTP_STATUS_OK
+        self._reason = 'OK'
+        self._response_headers = None
+
+        return cached
+
     def fetch_instrument_deployments(self, ref_des):
         """Fetch all deployment events for the fully or partially qualified reference designator"""
 
         self._logger.debug('Fetching {:s} deployments'.format(ref_des))
 
-        port = 12587
-        end_point = '/events/deployment/query?refdes={:s}'.format(ref_des)
-
-        request_url = self.build_request(port,
-                                         end_point)
+        request_url = self.build_instrument_request('deployments', ref_des)
 
         # Send the request
         self.send_request(request_url)
@@ -310,6 +638,134 @@ class UFrameClient(object):
             return self._response
         else:
             return None
+
+    def fetch_deployment_records(self, ref_des, status='all'):
+        """Fetch the deployment events of the fully or partially qualified reference designator and
+        return them as DeploymentRecords, filtered by deployment status (all, active or inactive).
+        Returns None if the request failed"""
+
+        if status not in DEPLOYMENT_STATUS_TYPES:
+            self._logger.error('Invalid deployment status type specified {:s}'.format(status))
+            return None
+
+        deployments = self.fetch_instrument_deployments(ref_des)
+        if deployments is None:
+            return None
+
+        return deployment_records(deployments, status)
+
+    def fetch_bulk(self, kind, ref_des_list, max_workers=4, ordered=True):
+        """Fetch the streams, parameters, metadata or deployments (kind) of each reference
+        designator in ref_des_list, sending up to max_workers concurrent requests over the instance
+        session.  Yields a (ref_des, response) tuple for each reference designator, in the order of
+        ref_des_list, as soon as it and all preceding responses are available or, if ordered is
+        False, as soon as it is available.  As with the corresponding fetch_instrument_* method, the
+        response is [] for failed streams requests and None for all other failed requests.  The
+        last request properties are not updated.  Streams, parameters and metadata responses are
+        answered from the cached metadata bundle, if any (see fetch_metadata_bundles).  Requests
+        that have not been sent are cancelled if the generator is closed before all responses are
+        yielded"""
+
+        if kind not in INSTRUMENT_REQUEST_TYPES:
+            self._logger.error('Invalid bulk request type specified {:s}'.format(kind))
+            return
+
+        failed = [] if kind == 'streams' else None
+
+        def fetch(ref_des):
+            cached = self._cached_metadata(kind, ref_des)
+            if cached is not None:
+                return cached
+            url = self.build_instrument_request(kind, ref_des)
+            if not url:
+                return failed
+            (status_code, reason, response) = self.get(url)
+            if status_code != HTTP_STATUS_OK:
+                return failed
+            return response
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(fetch, ref_des) for ref_des in ref_des_list]
+            future_ref_des = dict(zip(futures, ref_des_list))
+            try:
+                for future in (futures if ordered else as_completed(futures)):
+                    yield future_ref_des[future], future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def iter_instrument_streams(self, ref_des, max_workers=4, ordered=True):
+        """Generator yielding each stream produced by the instruments matching the fully or
+        partially-qualified reference designator, with the instrument added as the
+        reference_designator, as soon as the streams of the instrument are fetched.  Streams are
+        yielded in instrument order unless ordered is False"""
+
+        for instrument, streams in self.fetch_bulk('streams',
+                                                   self.search_instruments(ref_des),
+                                                   max_workers=max_workers,
+                                                   ordered=ordered):
+            for stream in streams:
+                stream['reference_designator'] = instrument
+                yield stream
+
+    def iter_instrument_parameters(self, ref_des, max_workers=4, ordered=True):
+        """Generator yielding each parameter produced by the instruments matching the fully or
+        partially-qualified reference designator, with the instrument added as the
+        reference_designator, as soon as the parameters of the instrument are fetched.  Parameters
+        are yielded in instrument order unless ordered is False"""
+
+        for instrument, parameters in self.fetch_bulk('parameters',
+                                                      self.search_instruments(ref_des),
+                                                      max_workers=max_workers,
+                                                      ordered=ordered):
+            for parameter in parameters or []:
+                parameter['reference_designator'] = instrument
+                yield parameter
+
+    def iter_deployments(self, ref_des, status='all', max_workers=4, ordered=True):
+        """Generator yielding each deployment event, filtered by status (all, active or inactive),
+        of the instruments matching the fully or partially-qualified reference designator, as
+        soon as the deployments of the instrument are fetched.  Deployments are yielded in
+        instrument order unless ordered is False"""
+
+        if status not in DEPLOYMENT_STATUS_TYPES:
+            self._logger.error('Invalid deployment status type specified {:s}'.format(status))
+            return
+
+        for instrument, deployments in self.fetch_bulk('deployments',
+                                                       self.search_instruments(ref_des),
+                                                       max_workers=max_workers,
+                                                       ordered=ordered):
+            if not deployments:
+                continue
+
+            for deployment in self.filter_deployments_by_status(deployments, status):
+                yield deployment
+
+    def build_instrument_request(self, kind, ref_des):
+        """Build the request url for the streams, parameters, metadata or deployments (kind) of the
+        reference designator.  The reference designator must be fully-qualified, except for
+        deployments requests.  Returns None if the url cannot be built"""
+
+        if kind == 'deployments':
+            return self.build_request(12587, '/events/deployment/query?refdes={:s}'.format(ref_des))
+
+        if kind not in INSTRUMENT_REQUEST_TYPES:
+            self._logger.error('Invalid instrument request type specified {:s}'.format(kind))
+            return None
+
+        r_tokens = ref_des.split('-')
+        if len(r_tokens) != 4:
+            self._logger.error('Incomplete reference designator specified {:s}'.format(ref_des))
+            return None
+
+        end_point = '/sensor/inv/{:s}/{:s}/{:s}-{:s}/{:s}'.format(r_tokens[0],
+                                                               r_tokens[1],
+                                                               r_tokens[2],
+                                                               r_tokens[3],
+                                                               INSTRUMENT_REQUEST_TYPES[kind])
+
+        return self.build_request(12576, end_point)
             
     def filter_deployments_by_status(self, deployments, status='all'):
         
@@ -317,44 +773,104 @@ class UFrameClient(object):
             self._logger.error('Invalid deployment status type specified {:s}'.format(status))
             return
             
-        filtered_deployments = []
-        
         if status == 'all':
             return deployments
-            
-        now = datetime.datetime.utcnow().replace(tzinfo=pytz.UTC)    
-        if status == 'active':
-            for d in deployments:
-                if not d['eventStopTime']:
-                    filtered_deployments.append(d)
-                    continue
-                    
-                dt1 = datetime.datetime.utcfromtimestamp(d['eventStopTime']/1000).replace(tzinfo=pytz.UTC)
-                if dt1 >= now:
-                    filtered_deployments.append(d)
-        else:
-            for d in deployments:
-                if not d['eventStopTime']:
-                    continue
-                    
-                dt1 = datetime.datetime.utcfromtimestamp(d['eventStopTime']/1000).replace(tzinfo=pytz.UTC)
-                if dt1 < now:
-                    filtered_deployments.append(d)
-                    
-        return filtered_deployments
+
+        return [r.event for r in deployment_records(deployments, status)]
         
 
+    def save_snapshot(self, db_path, ref_des='', max_workers=4):
+        """Write the table of contents and the stream times, parameters and deployment events of
+        the instruments matching the fully or partially-qualified reference designator (Default is
+        all instruments) to the InventorySnapshot database at db_path.  Returns the number of
+        instruments whose metadata was written, or None if the snapshot could not be created"""
+
+        if self._snapshot:
+            self._logger.error('Client is offline')
+            return None
+
+        toc = self.toc
+        if not toc:
+            self._logger.error('No table of contents available')
+            return None
+
+        snapshot = InventorySnapshot(db_path)
+        snapshot.write_toc(toc)
+
+        instruments = self.search_instruments(ref_des)
+
+        count = 0
+        for instrument, metadata in self.fetch_metadata_bundles(instruments, max_workers=max_workers):
+            if metadata is None:
+                self._logger.warning('{:s}: No metadata saved'.format(instrument))
+                continue
+            snapshot.write_instrument_streams(instrument, metadata.get('times', []))
+            snapshot.write_instrument_parameters(instrument, metadata.get('parameters', []))
+            count += 1
+
+        for instrument, deployments in self.fetch_bulk('deployments', instruments, max_workers=max_workers):
+            if deployments is None:
+                self._logger.warning('{:s}: No deployments saved'.format(instrument))
+                continue
+            snapshot.write_deployments(deployments, ref_des=instrument)
+
+        snapshot.set_info(self._base_url)
+        snapshot.close()
+
+        return count
+
     def search_instruments(self, ref_des):
         """Search all instruments for the fully-qualified reference designators
         matching the fully or partially-qualified ref_des string"""
 
-        return [i for i in self._instruments if i.find(ref_des) > -1]
+        return self._inventory.search_instruments(ref_des)
         
     def stream_to_instruments(self, stream):
         """Return the list of instruments that produce the specified full or partial
         stream name"""
         
-        return [i for i in self._instrument_streams if i['stream'].find(stream) > -1]
+        return self._inventory.stream_to_instruments(stream)
+
+    def download_async_results(self, async_results, outputdir, pattern=r'\.nc$', max_workers=4, checksums=None):
+        """Download all files written to the async results directory of a completed UFrame
+        request to outputdir.  Files are downloaded in parallel, streamed to disk and resumed
+        if the transfer is interrupted.
+
+        Arguments:
+            async_results: async results directory url or the UFrame response to the data request
+            outputdir: existing directory to which all files are written
+
+        Optional kwargs:
+            pattern: regex used to select the files to download (Default is all NetCDF files)
+            max_workers: maximum number of concurrent downloads
+            checksums: dict mapping file names to expected md5 hex digests
+
+        Returns the list of download results or None if the request has not completed
+        """
+
+        async_url = async_results
+        if type(async_results) == dict:
+            async_urls = [u for u in async_results.get('allURLs', []) if u.find('async_results') > -1]
+            if not async_urls:
+                self._logger.error('No async results url found in request response')
+                return None
+            async_url = async_urls[0]
+
+        downloader = AsyncDownloader(timeout=self._timeout,
+                                     api_username=self._api_username,
+                                     api_token=self._api_token,
+                                     max_workers=max_workers)
+
+        if not downloader.is_complete(async_url):
+            self._logger.warning('Request has not completed: {:s}'.format(async_url))
+            return None
+
+        urls = downloader.list_files(async_url, pattern=pattern)
+        if not urls:
+            self._logger.warning('No files found: {:s}'.format(async_url))
+            return []
+
+        return downloader.download(urls, outputdir, checksums=checksums)
 
     def build_and_send_request(self, port, end_point):
         """Build and send the request url for the specified port and end_point"""
@@ -395,25 +911,15 @@ class UFrameClient(object):
         self._reason = None
         self._response_headers = None
 
-        if self.is_m2m and not url.startswith(self.m2m_base_url):
-            self._logger.error('URL does not point to the m2m base url ({:s})'.format(self.m2m_base_url))
-            return
-        elif not url.startswith(self.base_url):
-            self._logger.error('URL does not point to the base url ({:s})'.format(self.base_url))
+        if not self._is_valid_url(url):
             return
 
-        try:
-            self._logger.debug('Sending GET request: {:s}'.format(url))
-            if self._api_username and self._api_token:
-                r = self._session.get(url,
-                                      auth=(self._api_username,
-                                            self._api_token),
-                                      timeout=self._timeout,
-                                      verify=False)
-            else:
-                r = self._session.get(url, timeout=self._timeout, verify=False)
-        except (requests.exceptions.ReadTimeout, requests.exceptions.MissingSchema, requests.exceptions.ConnectionError) as e:
-            self._logger.error('{:} - {:s}'.format(e, url))
+        if self._snapshot:
+            (self._status_code, self._reason, self._response) = self._offline_get(url)
+            return self._response
+
+        r = self._session_get(url)
+        if r is None:
             return
 
         self._status_code = r.status_code
@@ -439,36 +945,241 @@ class UFrameClient(object):
         #else:
         #    return None
             
+    def fetch_particles(self, url, parameters=None, chunk_size=65536):
+        """Send the application/json data request url and decode the particle array in the
+        response incrementally, as it is read from the socket, into per-parameter columns.  The
+        full response body and list of particle dicts are never held in memory.  NTP timestamps
+        are converted to seconds since 1970-01-01.  The last request properties are updated, but
+        last_response is only set if the request failed.
+
+        Arguments:
+            url: data request url created with application_type='json'
+
+        Optional kwargs:
+            parameters: list of parameter names to keep (Default is all parameters)
+            chunk_size: number of bytes read from the socket at a time
+
+        Returns a ParticleColumns instance or None if the request failed
+        """
+
+        self._request_url = url
+        self._response = None
+        self._status_code = None
+        self._reason = None
+        self._response_headers = None
+
+        if not self._is_valid_url(url):
+            return None
+
+        r = self._session_get(url, stream=True)
+        if r is None:
+            return None
+
+        try:
+            self._status_code = r.status_code
+            self._reason = r.reason
+            self._response_headers = r.headers
+
+            if self._status_code != HTTP_STATUS_OK:
+                self._logger.error('Request failed {:s} ({:s})'.format(url, r.reason))
+                try:
+                    self._response = r.json()
+                except ValueError:
+                    self._response = r.text
+                return None
+
+            return self._decode_particles(r, url, parameters, chunk_size)
+        finally:
+            r.close()
+
+    def get_particles(self, url, parameters=None, chunk_size=65536):
+        """Send the application/json data request url and decode the particles, as fetch_particles
+        does, but without updating the last request properties, so that this method may be called
+        from multiple threads.  Returns a (status_code, reason, particles) tuple, where particles is
+        the ParticleColumns instance or None if the request failed.  Returns (None, error message,
+        None) if the request could not be sent.  See fetch_particles for the arguments"""
+
+        if not self._is_valid_url(url):
+            return None, 'Invalid request url', None
+
+        r = self._session_get(url, stream=True)
+        if r is None:
+            return None, 'Request failed', None
+
+        try:
+            if r.status_code == HTTP_STATUS_NOT_FOUND:
+                self._logger.warning('{:s}: {:s}'.format(r.reason, url))
+                return r.status_code, r.reason, None
+            elif r.status_code != HTTP_STATUS_OK:
+                self._logger.error('Request failed {:s} ({:s})'.format(url, r.reason))
+                return r.status_code, r.reason, None
+
+            return r.status_code, r.reason, self._decode_particles(r, url, parameters, chunk_size)
+        finally:
+            r.close()
+
+    def _decode_particles(self, r, url, parameters, chunk_size):
+        """Decode the particle array in the streamed response r into a ParticleColumns instance.
+        Returns None if the response is not a valid particle array"""
+
+        particles = ParticleColumns(parameters=parameters)
+        try:
+            particles.extend(iter_array_items(r.iter_content(chunk_size=chunk_size)))
+        except ValueError as e:
+            self._logger.error('Invalid particle array ({:}): {:s}'.format(e, url))
+            return None
+
+        self._logger.debug('Decoded {:d} particles: {:s}'.format(len(particles), url))
+
+        return particles
+
+    def fetch_stream_particles(self, ref_des, method, stream, user, begin_ts, end_ts, parameters=None, cache=None,
+                               exec_dpa=True, provenance=False, limit=-1):
+        """Fetch the particles produced by the fully-qualified reference designator, method and
+        stream between the begin_ts and end_ts ISO-8601 timestamps as application/json and return
+        them as a dict mapping each parameter name to a column.  If a cache is specified, only
+        the time windows that have not been retrieved before are requested, the new particles
+        are written to the cache and the result is read back from the cache.
+
+        Arguments:
+            ref_des: fully-qualified reference designator
+            method: stream delivery method
+            stream: stream name
+            user: user name for the query
+            begin_ts: ISO-8601 formatted datestring specifying the start time
+            end_ts: ISO-8601 formatted datestring specifying the end time
+
+        Optional kwargs:
+            parameters: list of parameter names to return (Default is all parameters)
+            cache: ParticleCache instance
+            exec_dpa: boolean value specifying whether to execute all data product algorithms
+            provenance: boolean value specifying whether provenance information should be included
+            limit: integer value ranging from -1 to 10000.  See instrument_to_query
+
+        Returns None if any request failed
+        """
+
+        if not cache:
+            url = self.build_stream_query(ref_des, method, stream, user, begin_ts, end_ts, exec_dpa=exec_dpa,
+                                          application_type='json', provenance=provenance, limit=limit)
+            particles = self.fetch_particles(url, parameters=parameters)
+            if particles is None:
+                return None
+            return particles.to_dict()
+
+        for t0, t1 in cache.gaps(ref_des, method, stream, begin_ts, end_ts):
+            url = self.build_stream_query(ref_des, method, stream, user, ms_to_iso(t0), ms_to_iso(t1),
+                                          exec_dpa=exec_dpa, application_type='json', provenance=provenance,
+                                          limit=limit)
+            particles = self.fetch_particles(url)
+            if particles is None:
+                if self._status_code != HTTP_STATUS_NOT_FOUND:
+                    return None
+                # No particles in this window
+                particles = {}
+            cache.write(ref_des, method, stream, particles, t0, t1)
+
+        return cache.read(ref_des, method, stream, begin_time=begin_ts, end_time=end_ts, columns=parameters)
+
+    def get(self, url):
+        """Send the GET request url and return a (status_code, reason, response) tuple, where
+        response is the decoded JSON response or the response text if the response is not valid
+        JSON.  Unlike send_request, the last request properties are not updated, so this method may
+        be called from multiple threads.  Returns (None, error message, None) if the request could
+        not be sent"""
+
+        if not self._is_valid_url(url):
+            return None, 'Invalid request url', None
+
+        if self._snapshot:
+            return self._offline_get(url)
+
+        r = self._session_get(url)
+        if r is None:
+            return None, 'Request failed', None
+
+        if r.status_code == HTTP_STATUS_NOT_FOUND:
+            self._logger.warning('{:s}: {:s}'.format(r.reason, url))
+        elif r.status_code != HTTP_STATUS_OK:
+            self._logger.error('Request failed {:s} ({:s})'.format(url, r.reason))
+
+        try:
+            return r.status_code, r.reason, r.json()
+        except ValueError as e:
+            self._logger.warning('{:} ({:s})'.format(e, url))
+            return r.status_code, r.reason, r.text
+
+    def _is_valid_url(self, url):
+        """Return True if url points to the m2m base url or the UFrame base url, depending on the
+        is_m2m property"""
+
+        if self.is_m2m and not url.startswith(self.m2m_base_url):
+            self._logger.error('URL does not point to the m2m base url ({:s})'.format(self.m2m_base_url))
+            return False
+        elif not url.startswith(self.base_url):
+            self._logger.error('URL does not point to the base url ({:s})'.format(self.base_url))
+            return False
+
+        return True
+
+    def _offline_get(self, url):
+        """Answer the metadata request url from the snapshot.  Returns the same (status_code, reason,
+        response) tuple as get, with a 404 status code if the snapshot cannot answer the request"""
+
+        if self._is_m2m:
+            end_point = url[len(self._m2m_base_url):]
+        else:
+            end_point = url[len(self._base_url):].lstrip(':')
+
+        # Drop the port
+        end_point = end_point.strip('/').partition('/')[2]
+
+        response = self._snapshot.answer(end_point)
+        if response is None:
+            self._logger.warning('Not available offline: {:s}'.format(url))
+            return HTTP_STATUS_NOT_FOUND, 'Not available offline', None
+
+        return HTTP_STATUS_OK, 'OK', response
+
+    def _session_get(self, url, stream=False):
+        """Send the GET request url using the instance session and credentials.  Returns the
+        requests.Response or None if the request could not be sent"""
+
+        if self._snapshot:
+            self._logger.error('Client is offline: {:s}'.format(url))
+            return None
+
+        try:
+            self._logger.debug('Sending GET request: {:s}'.format(url))
+            if self._api_username and self._api_token:
+                return self._session.get(url,
+                                         auth=(self._api_username,
+                                               self._api_token),
+                                         timeout=self._timeout,
+                                         stream=stream,
+                                         verify=False)
+            else:
+                return self._session.get(url, timeout=self._timeout, stream=stream, verify=False)
+        except (requests.exceptions.ReadTimeout, requests.exceptions.MissingSchema, requests.exceptions.ConnectionError) as e:
+            self._logger.error('{:} - {:s}'.format(e, url))
+            return None
+
     def _create_instrument_list(self):
 
-        self._instruments = []
-        self._streams = []
-        self._instrument_streams = []
+        self._inventory = Inventory()
+
+        if self._snapshot:
+            self._logger.debug('Loading inventory from snapshot {:s}'.format(self._snapshot.db_path))
+            self._inventory = self._snapshot.inventory()
+            return
 
         self._logger.debug('Fetching UFrame table of contents')
-        if not self._toc:
+        if self._stream_toc:
+            self.stream_table_of_contents()
+        else:
             self.fetch_table_of_contents()
-            # toc = self.build_and_send_request(12576, 'sensor/inv/toc')
-            # if self.last_status_code != HTTP_STATUS_OK:
-            #     self._logger.error('Failed to create instruments list')
-            #     return
-            # # Save the table of contents if we fetch it
-            # self._toc = toc
-
-        self._logger.debug('Creating instruments list')
 
-        # Create an array of dicts with the instrument name and the stream it produces
-        self._instrument_streams = [{'instrument' : i['reference_designator'], 'stream' : s['stream']} for i in self._toc['instruments'] for s in i['streams']]
-        
-        # Create the unique list of streams
-        streams = list(set([i['stream'] for i in self._instrument_streams]))
-        streams.sort()
-        self._streams = streams
-        
-        # Create the unique list of instruments
-        instruments = list(set([i['instrument'] for i in self._instrument_streams]))
-        instruments.sort()
-        self._instruments = instruments
+        self._logger.debug('Created inventory: {:}'.format(self._inventory))
 
 # 2017-02-14: kerfoot@marine.rutgers.edu - replaced below with the TOC call above
 #    def _create_instrument_list(self):
@@ -501,7 +1212,8 @@ class UFrameClient(object):
         
     def instrument_to_query(self, ref_des, user, stream=None, telemetry=None, time_delta_type=None,
                             time_delta_value=None, begin_ts=None, end_ts=None, time_check=True, exec_dpa=True,
-                            application_type='netcdf', provenance=True, limit=-1, annotations=False, email=None):
+                            application_type='netcdf', provenance=True, limit=-1, annotations=False, email=None,
+                            catalog=None, sync=None, parameters=None):
         """Return the list of request urls that conform to the UFrame API for the specified
         fully or paritally-qualified reference_designator.  Request urls are formatted
         for either the UFrame m2m API (default) or direct UFrame access, depending
@@ -527,163 +1239,319 @@ class UFrameClient(object):
                 (Default is True)
             limit: integer value ranging from -1 to 10000.  A value of -1 (default) results in a non-decimated dataset
             annotations: boolean value (True or False) specifying whether to include all dataset annotations
+            catalog: DataCatalog instance.  If specified, urls are only created for the time windows not already
+                covered by files or requested windows in the catalog
+            sync: StreamSync instance.  If specified, urls are only created for streams that have grown since the
+                last committed sync and only cover the new time window
+            parameters: list of parameter names (particle keys) or pdIds (i.e.: 'PD7' or 7).  If specified, only these
+                parameters are requested and urls are only created for the streams containing at least one of them.
+                The parameters are validated against the parameters of each stream
         """
 
-        urls = []
+        return list(self.iter_query_urls(ref_des,
+                                         user,
+                                         stream=stream,
+                                         telemetry=telemetry,
+                                         time_delta_type=time_delta_type,
+                                         time_delta_value=time_delta_value,
+                                         begin_ts=begin_ts,
+                                         end_ts=end_ts,
+                                         time_check=time_check,
+                                         exec_dpa=exec_dpa,
+                                         application_type=application_type,
+                                         provenance=provenance,
+                                         limit=limit,
+                                         annotations=annotations,
+                                         email=email,
+                                         catalog=catalog,
+                                         sync=sync,
+                                         parameters=parameters))
+
+    def deployment_to_query(self, ref_des, user, stream=None, telemetry=None, time_delta_type=None,
+                            time_delta_value=None, begin_ts=None, end_ts=None, time_check=True, exec_dpa=True,
+                            application_type='netcdf', provenance=True, limit=-1, annotations=False, email=None,
+                            catalog=None, sync=None, parameters=None):
+        """Return the list of request urls created by instrument_to_query, split into one request
+        per deployment.  Each request window is clipped to the deployment, so that no server time
+        is spent on the gaps between deployments, and windows that do not overlap a deployment are
+        skipped.  The deployments of each instrument are fetched with fetch_instrument_deployments.
+        If the deployments request of an instrument fails, a warning is logged and the requests of
+        the instrument are not split.  See instrument_to_query for the arguments"""
+
+        return list(self.iter_query_urls(ref_des,
+                                         user,
+                                         stream=stream,
+                                         telemetry=telemetry,
+                                         time_delta_type=time_delta_type,
+                                         time_delta_value=time_delta_value,
+                                         begin_ts=begin_ts,
+                                         end_ts=end_ts,
+                                         time_check=time_check,
+                                         exec_dpa=exec_dpa,
+                                         application_type=application_type,
+                                         provenance=provenance,
+                                         limit=limit,
+                                         annotations=annotations,
+                                         email=email,
+                                         catalog=catalog,
+                                         sync=sync,
+                                         parameters=parameters,
+                                         by_deployment=True))
+
+    def iter_query_urls(self, ref_des, user, stream=None, telemetry=None, time_delta_type=None,
+                        time_delta_value=None, begin_ts=None, end_ts=None, time_check=True, exec_dpa=True,
+                        application_type='netcdf', provenance=True, limit=-1, annotations=False, email=None,
+                        catalog=None, sync=None, parameters=None, by_deployment=False, max_workers=4, ordered=True):
+        """Generator yielding the request urls created by instrument_to_query, as soon as the streams
+        of each instrument are fetched.  The streams of up to max_workers instruments are fetched
+        concurrently and the urls are yielded in instrument order unless ordered is False.  If
+        parameters are specified, the streams and parameters of each instrument are fetched with a
+        single metadata bundle request.  If by_deployment is True, the urls are split at the
+        deployment boundaries as described in deployment_to_query, except for instruments for which
+        the deployments request failed.  See instrument_to_query for the arguments"""
 
         instruments = self.search_instruments(ref_des)
         if not instruments:
-            return urls
+            return
 
         if time_delta_type and time_delta_value:
             if time_delta_type not in _valid_relativedeltatypes:
                 self._logger.error('Invalid dateutil.relativedelta type: {:s}'.format(time_delta_type))
-                return urls
+                return
 
-        begin_dt = None
-        end_dt = None
+        begin_time = None
+        end_time = None
         if begin_ts:
             try:
-                begin_dt = parser.parse(begin_ts).replace(tzinfo=pytz.UTC)
+                begin_time = datetime_to_ms(parser.parse(begin_ts).replace(tzinfo=pytz.UTC))
             except ValueError as e:
                 self._logger.error('Invalid begin_dt: {:s} ({:s})'.format(begin_ts, e.message))
-                return urls
+                return
 
         if end_ts:
             try:
-                end_dt = parser.parse(end_ts).replace(tzinfo=pytz.UTC)
+                end_time = datetime_to_ms(parser.parse(end_ts).replace(tzinfo=pytz.UTC))
             except ValueError as e:
                 self._logger.error('Invalid end_dt: {:s} ({:s})'.format(end_ts, e.message))
-                return urls
+                return
+
+        # Deployment windows used to split the requests.  The requests of instruments for which
+        # the deployments request failed are not split
+        instrument_deployments = {}
+        if by_deployment:
+            for i, d in self.fetch_bulk('deployments', instruments, max_workers=max_workers):
+                if d is None:
+                    self._logger.warning(
+                        '{:s}: Deployments request failed.  Requests will not be split by deployment'.format(i))
+                    continue
+                instrument_deployments[i] = deployment_records(d)
 
-        for instrument in instruments:
+        # Get the streams produced by each instrument and, to validate the parameter subset, their
+        # parameters
+        if parameters:
+            instrument_metadata = self.fetch_metadata_bundles(instruments, max_workers=max_workers, ordered=ordered)
+        else:
+            instrument_metadata = self.fetch_stream_records(instruments, max_workers=max_workers, ordered=ordered)
+
+        for instrument, instrument_streams in instrument_metadata:
+
+            instrument_parameters = None
+            if parameters:
+                instrument_parameters = (instrument_streams or {}).get('parameters', [])
+                instrument_streams = self._parse_stream_records(instrument,
+                                                                (instrument_streams or {}).get('times', []))
+
+                missing = [str(p) for p in parameters if not stream_pd_ids([p], instrument_parameters)]
+                if instrument_streams and missing:
+                    self._logger.warning('{:s}: Parameters not found: {:s}'.format(instrument, ', '.join(missing)))
 
-            # Get the streams produced by this instrument
-            instrument_streams = self.fetch_instrument_streams(instrument)
             if not instrument_streams:
                 self._logger.info('No streams found for {:s}'.format(instrument))
                 continue
 
             if stream:
-                stream_names = [s['stream'] for s in instrument_streams]
+                stream_names = [s.stream for s in instrument_streams]
                 if stream not in stream_names:
                     self._logger.warning('Invalid stream: {:s}-{:s}'.format(instrument, stream))
                     continue
 
-                instrument_streams = [s for s in instrument_streams if s['stream'] == stream]
-#                i = stream_names.index(stream)
-#                instrument_streams = [instrument_streams[i]]
+                instrument_streams = [s for s in instrument_streams if s.stream == stream]
 
             if not instrument_streams:
                 self._logger.info('{:s}: No streams found'.format(instrument))
                 continue
 
-            # Break the reference designator up
-            r_tokens = instrument.split('-')
-
             for instrument_stream in instrument_streams:
 
-                if telemetry and not instrument_stream['method'].startswith(telemetry):
+                if telemetry and not instrument_stream.method.startswith(telemetry):
                     continue
 
-                # Figure out what we're doing for time
-                try:
-                    stream_dt0 = parser.parse(instrument_stream['beginTime'])
-                except ValueError:
-                    self._logger.error(
-                        '{:s}-{:s}: Invalid beginTime ({:s})'.format(
-                            instrument, instrument_stream['stream'], instrument_stream['beginTime']))
-                    continue
+                pd_ids = None
+                if parameters:
+                    pd_ids = stream_pd_ids(parameters,
+                                           [p for p in instrument_parameters
+                                            if p.get('stream') == instrument_stream.stream])
+                    if not pd_ids:
+                        self._logger.info('{:s}-{:s}: Stream contains none of the requested parameters'.format(
+                            instrument, instrument_stream.stream))
+                        continue
 
-                try:
-                    stream_dt1 = parser.parse(instrument_stream['endTime'])
-                    # Add 1 second to stream end time to account for milliseconds
-                    stream_dt1 = stream_dt1 + tdelta(seconds=1)
-                except ValueError:
-                    self._logger.error(
-                        '{:s}-{:s}: Invalid endTime ({:s})'.format(
-                            'instrument', instrument_stream['stream'], instrument_stream['endTime']))
-                    continue
+                # Figure out what we're doing for time.  The stream times were parsed to integer
+                # milliseconds when the stream records were created
+                stream_t0 = instrument_stream.begin_time
+                # Add 1 second to stream end time to account for milliseconds
+                stream_t1 = instrument_stream.end_time + 1000
 
                 if time_delta_type and time_delta_value:
-                    dt1 = stream_dt1
-                    dt0 = dt1 - tdelta(**dict({time_delta_type: time_delta_value}))
+                    t1 = stream_t1
+                    t0 = datetime_to_ms(ms_to_datetime(t1) - tdelta(**dict({time_delta_type: time_delta_value})))
                 else:
-                    if begin_dt:
-                        dt0 = begin_dt
-                    else:
-                        dt0 = stream_dt0
-
-                    if end_dt:
-                        dt1 = end_dt
-                    else:
-                        dt1 = stream_dt1
+                    t0 = stream_t0 if begin_time is None else begin_time
+                    t1 = stream_t1 if end_time is None else end_time
 
                 # Format the endDT and beginDT values for the query
                 try:
-                    ts1 = dt1.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-                except ValueError as e:
-                    self._logger.error('{:s}-{:s}: {:s}'.format(instrument, instrument_stream['stream'], e.message))
-                    continue
-
-                try:
-                    ts0 = dt0.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-                except ValueError as e:
-                    self._logger.error('{:s}-{:s}: {:s}'.format(instrument, instrument_stream['stream'], e.message))
+                    ts0 = ms_to_iso(t0)
+                    ts1 = ms_to_iso(t1)
+                except (ValueError, OverflowError) as e:
+                    self._logger.error('{:s}-{:s}: {:}'.format(instrument, instrument_stream.stream, e))
                     continue
 
                 # Make sure the specified or calculated start and end time are within
                 # the stream metadata times if time_check=True
                 if time_check:
-                    if dt1 > stream_dt1:
+                    if t1 > stream_t1:
                         self._logger.warning(
                             '{:s}-{:s} time check - End time exceeds stream endTime'.format(
-                                ref_des, instrument_stream['stream']))
+                                ref_des, instrument_stream.stream))
                         self._logger.warning(
                             '{:s}-{:s} time check - Setting request end time to stream endTime'.format(
-                                ref_des, instrument_stream['stream']))
-                        ts1 = instrument_stream['endTime']
+                                ref_des, instrument_stream.stream))
+                        t1 = instrument_stream.end_time
+                        ts1 = instrument_stream.endTime
 
-                    if dt0 < stream_dt0:
+                    if t0 < stream_t0:
                         self._logger.warning(
                             '{:s}-{:s} time check - Start time is earlier than stream beginTime'.format(
-                                ref_des, instrument_stream['stream']))
+                                ref_des, instrument_stream.stream))
                         self._logger.warning(
                             '{:s}-{:s} time check -  Setting request begin time to stream beginTime'.format(
-                                ref_des, instrument_stream['stream']))
-                        ts0 = instrument_stream['beginTime']
+                                ref_des, instrument_stream.stream))
+                        t0 = stream_t0
+                        ts0 = instrument_stream.beginTime
 
-                    # Check that ts0 < ts1
-                    dt0 = parser.parse(ts0)
-                    dt1 = parser.parse(ts1)
-                    if dt0 >= dt1:
+                    # Check that t0 < t1
+                    if t0 >= t1:
                         self._logger.warning(
                             '{:s}-{:s} - Invalid time range specified'.format(
-                                instrument, instrument_stream['stream']))
+                                instrument, instrument_stream.stream))
+                        continue
+
+                # Request only the data that arrived since the last sync if a StreamSync was specified
+                if sync:
+                    ts0 = sync.new_data_begin(instrument,
+                                              instrument_stream.method,
+                                              instrument_stream.stream,
+                                              instrument_stream.endTime,
+                                              ts0,
+                                              end_ts=ts1)
+                    if not ts0:
+                        continue
+
+                # Request only the time windows not already on disk if a catalog was specified
+                if catalog:
+                    windows = catalog.gap_timestamps(instrument,
+                                                     instrument_stream.method,
+                                                     instrument_stream.stream,
+                                                     ts0,
+                                                     ts1)
+                    if not windows:
+                        self._logger.info('{:s}-{:s}: Requested time range already on disk'.format(
+                            instrument, instrument_stream.stream))
                         continue
+                else:
+                    windows = [(ts0, ts1)]
+
+                # One request per deployment, clipped to the request windows and, even if
+                # time_check is False, to the stream times
+                if instrument in instrument_deployments:
+                    windows = [(ms_to_iso(d0), ms_to_iso(d1)) for w0, w1 in windows
+                               for d0, d1, number in deployment_windows(max(to_ms(w0), stream_t0),
+                                                                        min(to_ms(w1), stream_t1),
+                                                                        instrument_deployments[instrument])]
+                    if not windows:
+                        self._logger.info('{:s}-{:s}: No deployments overlap the requested time range'.format(
+                            instrument, instrument_stream.stream))
+                        continue
+
+                for w0, w1 in windows:
+                    yield self.build_stream_query(instrument,
+                                                  instrument_stream.method,
+                                                  instrument_stream.stream,
+                                                  user,
+                                                  w0,
+                                                  w1,
+                                                  exec_dpa=exec_dpa,
+                                                  application_type=application_type,
+                                                  provenance=provenance,
+                                                  limit=limit,
+                                                  email=email,
+                                                  parameters=pd_ids)
+
+    def build_stream_query(self, ref_des, method, stream, user, begin_ts, end_ts, exec_dpa=True,
+                           application_type='netcdf', provenance=True, limit=-1, email=None, parameters=None):
+        """Return the request url for the fully-qualified reference designator, method and stream
+        between the begin_ts and end_ts ISO-8601 formatted request timestamps.  parameters is the
+        list of integer pdIds to request (Default is all parameters).  No validation of the
+        arguments is performed.  See instrument_to_query for a description of the kwargs"""
+
+        r_tokens = ref_des.split('-')
 
-                # Create the url
-                end_point = 'sensor/inv/{:s}/{:s}/{:s}-{:s}/{:s}/{:s}?beginDT={:s}&endDT={:s}&format=application/{:s}&limit={:d}&execDPA={:s}&include_provenance={:s}&user={:s}'.format(
-                    r_tokens[0],
-                    r_tokens[1],
-                    r_tokens[2],
-                    r_tokens[3],
-                    instrument_stream['method'],
-                    instrument_stream['stream'],
-                    ts0,
-                    ts1,
-                    application_type,
-                    limit,
-                    str(exec_dpa).lower(),
-                    str(provenance).lower(),
-                    user)
-
-                if email:
-                    end_point = '{:s}&email={:s}'.format(end_point, email)
-
-                urls.append(self.build_request(12576, end_point))
-
-        return urls
+        end_point = 'sensor/inv/{:s}/{:s}/{:s}-{:s}/{:s}/{:s}?beginDT={:s}&endDT={:s}&format=application/{:s}&limit={:d}&execDPA={:s}&include_provenance={:s}&user={:s}'.format(
+            r_tokens[0],
+            r_tokens[1],
+            r_tokens[2],
+            r_tokens[3],
+            method,
+            stream,
+            begin_ts,
+            end_ts,
+            application_type,
+            limit,
+            str(exec_dpa).lower(),
+            str(provenance).lower(),
+            user)
+
+        if parameters:
+            end_point = '{:s}&parameters={:s}'.format(end_point, ','.join([str(pd) for pd in parameters]))
+
+        if email:
+            end_point = '{:s}&email={:s}'.format(end_point, email)
+
+        return self.build_request(12576, end_point)
 
     def __repr__(self):
         return '<UFrameClient(url={:s}, m2m={:s})>'.format(self.base_url, str(self._is_m2m))
+
+
+def stream_pd_ids(parameters, stream_parameters):
+    """Return the sorted list of integer pdIds of the parameter names (particle keys) or pdIds
+    (i.e.: 'PD7', '7' or 7) in parameters that are contained in the stream, described by the
+    stream_parameters dicts returned by UFrameClient.fetch_instrument_parameters.  Parameters not
+    contained in the stream are skipped"""
+
+    pd_ids = {}
+    for p in stream_parameters:
+        pd_id = _pd_number(p['pdId'])
+        pd_ids[pd_id] = pd_id
+        pd_ids[p.get('particleKey', p.get('particle_key'))] = pd_id
+
+    found = set()
+    for parameter in parameters:
+        pd_id = pd_ids.get(parameter)
+        if pd_id is None and re.match(r'^(PD)?\d+$', str(parameter)):
+            pd_id = pd_ids.get(_pd_number(parameter))
+        if pd_id is not None:
+            found.add(pd_id)
+
+    return sorted(found)
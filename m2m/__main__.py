@@ -0,0 +1,4 @@
+import sys
+from m2m.cli import main
+
+sys.exit(main())
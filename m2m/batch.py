@@ -0,0 +1,163 @@
+import sys
+import csv
+import json
+import itertools
+from m2m.records import stream_records
+
+
+def read_inputs(path):
+    """Return the list of inputs (i.e.: reference designators or stream names), one per line,
+    from the file path or from stdin if path is -.  Blank lines and lines beginning with # are
+    skipped"""
+
+    if path == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(path, 'r') as fid:
+            lines = fid.readlines()
+
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+
+
+def script_inputs(args, name):
+    """Return the list of inputs for a script: the inputs read from args.input, if specified,
+    otherwise the single positional argument name.  Returns [] if neither was specified"""
+
+    if args.input:
+        return read_inputs(args.input)
+
+    value = getattr(args, name)
+    if value is None:
+        return []
+
+    return [value]
+
+
+def bulk_fetch(client, kind, instruments, max_workers=4):
+    """Fetch the streams, parameters, metadata or deployments (kind) of each reference designator
+    in instruments using the client bulk fetch path.  Returns an iterator of (ref_des, response)
+    tuples in the order of instruments.  Clients without a bulk fetch path (i.e.: DaemonClient)
+    fetch each instrument in turn"""
+
+    if hasattr(client, 'fetch_bulk'):
+        return client.fetch_bulk(kind, instruments, max_workers=max_workers)
+
+    fetch = getattr(client, 'fetch_instrument_{:s}'.format(kind))
+
+    return ((ref_des, fetch(ref_des)) for ref_des in instruments)
+
+
+def bulk_stream_records(client, instruments, max_workers=4):
+    """Fetch the streams of each reference designator in instruments and return an iterator of
+    (ref_des, records) tuples in the order of instruments, where records is the list of
+    StreamRecords with the stream times parsed to integer milliseconds ([] if the request failed).
+    Clients without a stream records path (i.e.: DaemonClient) fetch the streams with bulk_fetch
+    and the records are created here"""
+
+    if hasattr(client, 'fetch_stream_records'):
+        return client.fetch_stream_records(instruments, max_workers=max_workers)
+
+    return ((ref_des, stream_records(ref_des, streams or []))
+            for ref_des, streams in bulk_fetch(client, 'streams', instruments, max_workers=max_workers))
+
+
+def fetch_by_input(client, kind, inputs, max_workers=4):
+    """Search the client instruments for each fully or partially-qualified reference designator
+    in inputs and fetch the streams, parameters, metadata or deployments (kind) of all matching
+    instruments with a single bulk request pass.  Yields an (input, responses) tuple for each
+    input, in order, where responses is an iterator of the (ref_des, response) tuples of the
+    matching instruments, yielded as each response arrives.  Each responses iterator must be
+    consumed before advancing to the next input"""
+
+    matches = [client.search_instruments(i) or [] for i in inputs]
+    responses = bulk_fetch(client,
+                           kind,
+                           [ref_des for ref_des_list in matches for ref_des in ref_des_list],
+                           max_workers=max_workers)
+
+    for i, ref_des_list in zip(inputs, matches):
+        yield i, itertools.islice(responses, len(ref_des_list))
+
+
+def write_json_items(items, fid=None):
+    """Write the items to fid (Default is stdout) as a JSON array, one item at a time as each
+    becomes available, so that the results of a batch are emitted per input rather than after
+    the whole batch"""
+
+    fid = fid or sys.stdout
+
+    fid.write('[')
+    for n, item in enumerate(items):
+        if n:
+            fid.write(',')
+        fid.write('\n{:s}'.format(json.dumps(item, sort_keys=True, indent=4)))
+        fid.flush()
+    fid.write('\n]\n')
+
+
+def write_ndjson(records, fid=None):
+    """Write and flush each record to fid (Default is stdout) as a single line of JSON as soon as
+    it is produced.  records may be any iterable, including a generator, so the output never
+    needs to be held in memory.  Returns the number of records written"""
+
+    fid = fid or sys.stdout
+
+    count = 0
+    for record in records:
+        fid.write('{:s}\n'.format(json.dumps(record, sort_keys=True)))
+        fid.flush()
+        count += 1
+
+    return count
+
+
+def write_csv(records, cols=None, header=None, fid=None):
+    """Write and flush each record to fid (Default is stdout) as a csv row as soon as it is
+    produced.  The header row contains cols or, if not specified, the keys of the first record,
+    and is only written if there is at least one record.  Records that are not dicts are written
+    as a single column named header.  Returns the number of records written"""
+
+    fid = fid or sys.stdout
+
+    csv_writer = None
+    count = 0
+    for record in records:
+        if csv_writer is None:
+            csv_writer = csv.writer(fid)
+            if isinstance(record, dict):
+                cols = cols or list(record.keys())
+            csv_writer.writerow(cols or [header or 'value'])
+        if isinstance(record, dict):
+            csv_writer.writerow([record.get(c) for c in cols])
+        else:
+            csv_writer.writerow([record])
+        fid.flush()
+        count += 1
+
+    return count
+
+
+def write_batch(results, csv_output=False, ndjson=False, batch=False, key='results', cols=None, fid=None):
+    """Write the (input, records) results of a script to fid (Default is stdout).  Records are
+    streamed as they are produced when written as csv rows, with cols (or the keys of the first
+    record) as the header, or as NDJSON lines.  Otherwise, if batch, each input and its records
+    are written as a {"input": input, key: records} item of a JSON array as soon as they are
+    available.  Otherwise, all records are written as a single JSON array"""
+
+    fid = fid or sys.stdout
+
+    records = (record for i, input_records in results for record in input_records)
+
+    if csv_output:
+        write_csv(records, cols=cols, header=key, fid=fid)
+        return
+
+    if ndjson:
+        write_ndjson(records, fid=fid)
+        return
+
+    if batch:
+        write_json_items(({'input': i, key: list(input_records)} for i, input_records in results), fid=fid)
+        return
+
+    fid.write('{:s}\n'.format(json.dumps(list(records), sort_keys=True, indent=4)))
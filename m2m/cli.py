@@ -0,0 +1,1179 @@
+"""Unified m2m command line interface.  Each subcommand corresponds to one of the scripts in
+scripts/, which are thin wrappers around the subcommands (see script_main), and all subcommands
+share the same logging, output and client options.  Heavy modules
+(requests, dateutil, pytz and the client itself) are only imported by the subcommands that need
+them, so --help and lookups answered by a running metadata daemon start quickly.
+
+    m2m instruments CE02
+    m2m --timing status CE02SHSM --csv
+"""
+
+import time
+
+_t0 = time.time()
+
+import os
+import sys
+import argparse
+import logging
+import json
+
+# Appended to when --timing is set or M2M_TIMING_LOG is set
+TIMING_LOG_ENV = 'M2M_TIMING_LOG'
+
+
+def main(argv=None):
+
+    # Seconds spent importing the cli, creating the client, running the command and in total
+    timings = {'import': time.time() - _t0}
+
+    arg_parser = _build_parser()
+    args = arg_parser.parse_args(argv)
+
+    # Set up logging
+    log_level = getattr(logging, args.loglevel.upper())
+    log_format = '%(asctime)s:%(module)s:%(levelname)s:%(message)s [line %(lineno)d]'
+    logging.basicConfig(level=log_level, format=log_format)
+
+    if not hasattr(args, 'command'):
+        arg_parser.print_help()
+        return 1
+
+    t0 = time.time()
+    try:
+        status = args.command(args)
+    finally:
+        timings['run'] = time.time() - t0
+        timings['total'] = time.time() - _t0
+        if hasattr(args, 'client_time'):
+            timings['client'] = args.client_time
+        _record_timings(args, timings)
+
+    return status
+
+
+def create_client(args):
+    """Create the client shared by all subcommands from the global options.  If --snapshot is set,
+    the client answers all requests offline from the snapshot.  Otherwise, a running metadata
+    daemon is used, unless --no_daemon is set.  Returns None if no valid UFrame base url is
+    available"""
+
+    if args.snapshot:
+        from m2m.UFrameClient import UFrameClient
+        t0 = time.time()
+        client = UFrameClient(args.base_url, snapshot=args.snapshot)
+        args.client_time = time.time() - t0
+        return client if client.base_url else None
+
+    uframe_base_url = args.base_url or os.getenv('UFRAME_BASE_URL')
+    if not uframe_base_url:
+        logging.error('No base_url set/found')
+        return None
+
+    t0 = time.time()
+    if args.no_daemon:
+        from m2m.UFrameClient import UFrameClient
+        client = UFrameClient(uframe_base_url,
+                              timeout=args.timeout,
+                              m2m=args.direct,
+                              api_username=os.getenv('UFRAME_API_USERNAME'),
+                              api_token=os.getenv('UFRAME_API_TOKEN'),
+                              stream_toc=True)
+    else:
+        from m2m.DaemonClient import connect_client
+        client = connect_client(uframe_base_url,
+                                timeout=args.timeout,
+                                m2m=args.direct,
+                                api_username=os.getenv('UFRAME_API_USERNAME'),
+                                api_token=os.getenv('UFRAME_API_TOKEN'),
+                                socket_path=args.socket)
+    args.client_time = time.time() - t0
+
+    if not client.base_url:
+        return None
+
+    return client
+
+
+def write_records(args, records, cols=None):
+    """Write the records to stdout as valid JSON or, if --csv is set, as csv records with the
+    cols (or the keys of the first record) as the header or, if --ndjson is set, as one line of
+    JSON per record.  Records that are not dicts are written as a single column"""
+
+    from m2m.batch import write_csv, write_ndjson
+
+    # A single dict is a single record
+    if isinstance(records, dict) and (args.csv or args.ndjson):
+        records = [records]
+
+    if args.csv:
+        write_csv(records, cols=cols)
+    elif args.ndjson:
+        write_ndjson(records)
+    else:
+        sys.stdout.write('{:s}\n'.format(json.dumps(records, sort_keys=True, indent=4)))
+
+
+def script_main(args, command, command_argv=None):
+    """Run the subcommand from one of the scripts in scripts/, which are thin wrappers around the
+    cli.  The global options (-b, -t, -l, -d and --socket) and output options (--csv, --ndjson)
+    are taken from the script args, if the script has them, and the command_argv are passed to
+    the subcommand.  Returns the subcommand exit status"""
+
+    argv = []
+    if getattr(args, 'base_url', None):
+        argv += ['-b', args.base_url]
+    if hasattr(args, 'timeout'):
+        argv += ['-t', str(args.timeout)]
+    if hasattr(args, 'loglevel'):
+        argv += ['-l', args.loglevel]
+    if not getattr(args, 'direct', True):
+        argv.append('-d')
+    if getattr(args, 'socket', None):
+        argv += ['--socket', args.socket]
+
+    argv.append(command)
+    if getattr(args, 'csv', False):
+        argv.append('--csv')
+    elif getattr(args, 'ndjson', False):
+        argv.append('--ndjson')
+
+    return main(argv + (command_argv or []))
+
+
+def _instruments(args):
+
+    from m2m.batch import script_inputs, write_batch
+
+    client = create_client(args)
+    if not client:
+        return 1
+
+    inputs = script_inputs(args, 'ref_des')
+    if inputs:
+        results = [(ref_des, client.search_instruments(ref_des)) for ref_des in inputs]
+    else:
+        results = [(None, client.instruments)]
+
+    write_batch(results, csv_output=args.csv, ndjson=args.ndjson, batch=bool(args.input), key='instruments',
+                cols=['reference_designator'])
+
+    return 0
+
+
+def _streams(args):
+
+    from m2m.batch import script_inputs, write_batch
+
+    client = create_client(args)
+    if not client:
+        return 1
+
+    inputs = script_inputs(args, 'stream')
+    if inputs:
+        write_batch([(stream, client.stream_to_instruments(stream)) for stream in inputs],
+                    csv_output=args.csv, ndjson=args.ndjson, batch=bool(args.input), key='instruments',
+                    cols=['instrument', 'stream'])
+    else:
+        write_records(args, client.streams, cols=['stream_name'])
+
+    return 0
+
+
+def _instrument_streams(args):
+
+    return _fetch_by_input(args, 'streams')
+
+
+def _parameters(args):
+
+    return _fetch_by_input(args, 'parameters')
+
+
+def _fetch_by_input(args, kind):
+    """Fetch the streams or parameters (kind) of the instruments matching each input reference
+    designator and write them, tagged with the instrument reference designator, per input"""
+
+    from m2m.batch import script_inputs, fetch_by_input, write_batch
+
+    inputs = script_inputs(args, 'ref_des')
+    if not inputs:
+        logging.error('No reference designator specified')
+        return 1
+
+    client = create_client(args)
+    if not client:
+        return 1
+
+    def tagged(responses):
+        for instrument, response in responses:
+            for r in response or []:
+                r['reference_designator'] = instrument
+                yield r
+
+    results = ((ref_des, tagged(responses))
+               for ref_des, responses in fetch_by_input(client, kind, inputs, max_workers=args.workers))
+
+    write_batch(results, csv_output=args.csv, ndjson=args.ndjson, batch=bool(args.input), key=kind)
+
+    return 0
+
+
+def _subsites(args):
+
+    client = create_client(args)
+    if not client:
+        return 1
+
+    if args.inventory == 'sensor':
+        subsites = client.fetch_subsites()
+    else:
+        subsites = client.fetch_deployment_subsites()
+
+    if args.subsite:
+        subsites = [s for s in subsites if s.find(args.subsite) > -1]
+
+    write_records(args, subsites, cols=['subsite'])
+
+    return 0
+
+
+def _deployments(args):
+
+    from m2m.batch import script_inputs, fetch_by_input, write_batch
+    from m2m.deployments import deployment_records
+
+    client = create_client(args)
+    if not client:
+        return 1
+
+    def filtered(responses):
+        for instrument, deployments in responses:
+            if deployments:
+                for r in deployment_records(deployments, args.status):
+                    yield r.to_dict()
+
+    # All instruments if no reference designator is specified
+    inputs = script_inputs(args, 'ref_des') or ['']
+    results = ((ref_des, filtered(responses))
+               for ref_des, responses in fetch_by_input(client, 'deployments', inputs, max_workers=args.workers))
+
+    write_batch(results, csv_output=args.csv, ndjson=args.ndjson, batch=bool(args.input), key='deployments',
+                cols=['ref_des',
+                      'eventStartTs',
+                      'eventStopTs',
+                      'eventStartTime',
+                      'eventStopTime',
+                      'deploymentNumber',
+                      'active'])
+
+    return 0
+
+
+def _status(args):
+
+    from m2m.batch import read_inputs, write_batch, write_json_items
+    from m2m.deployments import iter_deployment_status
+
+    client = create_client(args)
+    if not client:
+        return 1
+
+    if args.input:
+        results = ((ref_des, iter_deployment_status(client,
+                                                    client.search_instruments(ref_des),
+                                                    status=args.status,
+                                                    telemetry=args.telemetry,
+                                                    max_workers=args.workers))
+                   for ref_des in read_inputs(args.input))
+        if args.csv or args.ndjson:
+            write_batch(results, csv_output=args.csv, ndjson=args.ndjson)
+        else:
+            write_json_items({'input': ref_des, 'uframe': client.base_url, 'deployments': list(statuses)}
+                             for ref_des, statuses in results)
+        return 0
+
+    if args.ref_des:
+        instruments = client.search_instruments(args.ref_des)
+    else:
+        instruments = client.instruments
+
+    statuses = iter_deployment_status(client, instruments, status=args.status, telemetry=args.telemetry,
+                                      max_workers=args.workers)
+
+    # Stream csv and NDJSON records as they are produced
+    if args.csv or args.ndjson:
+        write_records(args, statuses)
+        return 0
+
+    statuses = list(statuses)
+    if not statuses:
+        logging.warning('No valid instrument deployments found')
+        return 0
+
+    write_records(args, {'uframe': client.base_url, 'deployments': statuses})
+
+    return 0
+
+
+def _coverage(args):
+
+    from m2m.CoverageReport import CoverageReport
+
+    client = create_client(args)
+    if not client:
+        return 1
+
+    report = CoverageReport(client, cache_dir=args.cache_dir).report(args.ref_des or '',
+                                                                      status=args.status,
+                                                                      telemetry=args.telemetry,
+                                                                      max_workers=args.workers,
+                                                                      refresh=args.refresh)
+    if not report['coverage']:
+        logging.warning('No valid instrument deployments found')
+
+    if args.csv or args.ndjson:
+        write_records(args, report['coverage'])
+    else:
+        write_records(args, report)
+
+    return 0
+
+
+def _find_params(args):
+
+    from m2m.search import find_parameter_instruments
+
+    client = create_client(args)
+    if not client:
+        return 1
+
+    parameter_instruments = find_parameter_instruments(client.toc,
+                                                       args.parameter_search_terms,
+                                                       ooi_array=args.ooi_array,
+                                                       ref_des_term=args.ref_des_term,
+                                                       telemetry=args.telemetry)
+
+    if args.csv:
+        cols = ['stream', 'method', 'beginTime', 'endTime', 'count']
+        records = []
+        for instrument in parameter_instruments:
+            for stream in instrument['streams']:
+                record = dict([(c, stream[c]) for c in cols])
+                record['reference_designator'] = instrument['reference_designator']
+                records.append(record)
+        write_records(args, records, cols=['reference_designator'] + cols)
+    else:
+        write_records(args, parameter_instruments)
+
+    return 0
+
+
+def _request(args):
+
+    import re
+    from m2m.batch import read_inputs, write_batch
+
+    # (input, ref_des, stream) tuples.  Input lines contain a reference designator, optionally
+    # followed by a stream name separated by whitespace or a comma
+    if args.input:
+        inputs = []
+        for line in read_inputs(args.input):
+            fields = re.split(r'[\s,]+', line)
+            inputs.append((line, fields[0], fields[1] if len(fields) > 1 else args.stream))
+    elif args.ref_des:
+        inputs = [(args.ref_des, args.ref_des, args.stream)]
+    else:
+        logging.error('No reference designator specified')
+        return 1
+
+    if args.outputdir:
+        if not os.path.isdir(args.outputdir):
+            logging.error('Invalid response outputdir specified: {:s}'.format(args.outputdir))
+            return 1
+        args.outputdir = os.path.realpath(args.outputdir)
+
+    # Requests are sent, so the daemon is not used
+    args.no_daemon = True
+    client = create_client(args)
+    if not client:
+        return 1
+
+    catalog = None
+    if args.catalog:
+        from m2m.DataCatalog import DataCatalog
+        catalog = DataCatalog(args.catalog)
+
+    query = client.deployment_to_query if args.by_deployment else client.instrument_to_query
+    input_urls = []
+    for i, ref_des, stream in inputs:
+        urls = query(ref_des,
+                     args.user,
+                     stream=stream,
+                     telemetry=args.telemetry,
+                     time_delta_type=args.time_delta_type,
+                     time_delta_value=args.time_delta_value,
+                     begin_ts=args.start_date,
+                     end_ts=args.end_date,
+                     exec_dpa=args.no_dpa,
+                     provenance=args.no_provenance,
+                     email=args.email,
+                     catalog=catalog,
+                     parameters=args.parameter)
+        if not urls:
+            name = '{:s}-{:s}'.format(ref_des, stream) if stream else ref_des
+            logging.warning('No valid NetCDF requests created for {:s}'.format(name))
+        input_urls.append((i, urls or []))
+
+    urls = [url for i, request_urls in input_urls for url in request_urls]
+    if not urls:
+        return 0
+
+    if args.outputdir:
+        return _send_requests(args, client, urls, catalog)
+
+    if not args.send:
+        if args.input:
+            write_batch(input_urls, csv_output=args.csv, ndjson=args.ndjson, batch=True, key='urls', cols=['url'])
+        else:
+            write_records(args, urls, cols=['url'])
+        return 0
+
+    from m2m.RequestQueue import RequestQueue
+    queue = RequestQueue(args.queue)
+    queue.recover()
+    queue.enqueue(urls)
+    counts = queue.process(client, workers=args.workers)
+    logging.info('Request queue status: {:}'.format(counts))
+
+    # Record the windows of the sent requests as covered
+    if catalog:
+        for request in queue.requests(state='done'):
+            catalog.register_request(request['url'])
+
+    write_records(args, queue.requests())
+
+    if counts['failed']:
+        return 1
+
+    return 0
+
+
+def _send_requests(args, client, urls, catalog=None):
+    """Send each request url directly, writing the url, status_code, reason and response to a
+    JSON response file in args.outputdir, and write the url, status_code and response file of each
+    request.  The windows of the successful requests are registered in the catalog, if specified.
+    Returns 1 if any request could not be sent or its response written"""
+
+    import datetime
+    from m2m.StreamSync import key_from_url
+
+    status = 0
+    sent = []
+    for url in urls:
+        status_code, reason, response = client.get(url)
+        if status_code is None:
+            logging.error('{:s}: {:s}'.format(reason, url))
+            status = 1
+            continue
+
+        # Create a unique response file name, as several requests may be sent for each stream
+        key = key_from_url(url)
+        response_path = '{:s}-{:s}.request.json'.format('-'.join([key[0], key[2]]) if key else 'request',
+                                                        datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S.%fZ'))
+        response_file = os.path.join(args.outputdir, response_path)
+        count = 1
+        while os.path.exists(response_file):
+            response_file = os.path.join(args.outputdir,
+                                         response_path.replace('.request.json', '-{:d}.request.json'.format(count)))
+            count += 1
+
+        request = {'url': url,
+                   'status_code': status_code,
+                   'reason': reason,
+                   'response': response,
+                   'response_file': response_file}
+        try:
+            with open(response_file, 'w') as fid:
+                json.dump(request, fid, indent=4, sort_keys=True)
+        except IOError as e:
+            logging.error('Error writing response file ({:}): {:s}'.format(e, response_file))
+            status = 1
+            continue
+
+        # Record the window of the sent request as covered
+        if catalog and status_code == 200:
+            catalog.register_request(url)
+
+        sent.append(request)
+
+    write_records(args, sent, cols=['url', 'status_code', 'response_file'])
+
+    return status
+
+
+def _preview(args):
+
+    from m2m.PreviewEngine import PreviewEngine, preview_to_dict
+    from m2m.batch import write_csv, write_ndjson
+
+    # Data requests are sent, so the daemon is not used
+    args.no_daemon = True
+    client = create_client(args)
+    if not client:
+        return 1
+
+    engine = PreviewEngine(client, cache_dir=args.cache_dir, limit=args.limit, max_workers=args.workers,
+                           exec_dpa=args.dpa)
+
+    previews = (preview_to_dict(p) for p in engine.preview_instruments(args.ref_des or '',
+                                                                       stream=args.stream,
+                                                                       telemetry=args.telemetry,
+                                                                       begin_ts=args.start_date,
+                                                                       end_ts=args.end_date,
+                                                                       parameters=args.parameter)
+                if p is not None)
+
+    # Write each preview as soon as it is fetched
+    if args.csv:
+        count = write_csv(previews, cols=['reference_designator', 'method', 'stream', 'begin_time', 'end_time',
+                                          'limit', 'count'])
+    elif args.ndjson:
+        count = write_ndjson(previews)
+    else:
+        previews = list(previews)
+        count = len(previews)
+        write_records(args, previews)
+
+    if not count:
+        logging.warning('No previews created')
+
+    return 0
+
+
+def _download(args):
+
+    from m2m.AsyncDownloader import AsyncDownloader
+    from m2m.batch import script_inputs, write_batch
+
+    async_urls = script_inputs(args, 'async_url')
+    if not async_urls:
+        logging.error('No async results url specified')
+        return 1
+
+    args.outputdir = args.outputdir or os.curdir
+    if not os.path.isdir(args.outputdir):
+        logging.error('Invalid outputdir specified: {:s}'.format(args.outputdir))
+        return 1
+    args.outputdir = os.path.realpath(args.outputdir)
+
+    downloader = AsyncDownloader(timeout=args.timeout,
+                                 api_username=os.getenv('UFRAME_API_USERNAME'),
+                                 api_token=os.getenv('UFRAME_API_TOKEN'),
+                                 max_workers=args.workers)
+
+    input_urls = []
+    for async_url in async_urls:
+        if not args.force and not downloader.is_complete(async_url):
+            logging.warning('Request has not completed: {:s}'.format(async_url))
+            if not args.input:
+                return 1
+            continue
+
+        urls = downloader.list_files(async_url, pattern=args.pattern)
+        if not urls:
+            logging.warning('No files found: {:s}'.format(async_url))
+            continue
+
+        input_urls.append((async_url, urls))
+
+    if not input_urls:
+        return 0
+
+    if args.printurl:
+        for async_url, urls in input_urls:
+            for url in urls:
+                sys.stdout.write('{:s}\n'.format(url))
+        return 0
+
+    # Download the files of all requests with a single pool of workers
+    results = downloader.download([url for async_url, urls in input_urls for url in urls], args.outputdir)
+
+    if args.catalog:
+        from m2m.DataCatalog import DataCatalog
+        count = DataCatalog(args.catalog).register_downloads(results)
+        logging.info('Registered {:d} files in catalog {:s}'.format(count, args.catalog))
+
+    url_results = dict([(r['url'], r) for r in results])
+    write_batch([(async_url, [url_results[url] for url in urls]) for async_url, urls in input_urls],
+                csv_output=args.csv, ndjson=args.ndjson, batch=bool(args.input), key='downloads',
+                cols=['url', 'path', 'size', 'md5', 'status'])
+
+    failed = [r for r in results if r['status'] == 'failed']
+    if failed:
+        logging.error('{:d} of {:d} downloads failed'.format(len(failed), len(results)))
+        return 1
+
+    return 0
+
+
+def _daemon(args):
+
+    import signal
+    import threading
+    from m2m.MetadataDaemon import MetadataDaemon
+
+    args.no_daemon = True
+    client = create_client(args)
+    if not client:
+        return 1
+
+    daemon = MetadataDaemon(client,
+                            socket_path=args.socket,
+                            cache_ttl=args.cache_ttl,
+                            refresh_interval=args.refresh_interval)
+
+    # Shut down cleanly, removing the socket, on SIGTERM
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=daemon.stop).start())
+
+    try:
+        if not daemon.serve_forever():
+            return 1
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+def _sync(args):
+
+    from m2m.StreamSync import StreamSync
+    from m2m.batch import script_inputs, write_json_items
+
+    # Requests are sent, so the daemon is not used
+    args.no_daemon = True
+    client = create_client(args)
+    if not client:
+        return 1
+
+    sync = StreamSync(args.state_file)
+
+    # All instruments if no reference designator is specified
+    inputs = script_inputs(args, 'ref_des') or ['']
+
+    input_urls = []
+    for ref_des in inputs:
+        input_urls.append((ref_des, client.instrument_to_query(ref_des,
+                                                               args.user,
+                                                               stream=args.stream,
+                                                               telemetry=args.telemetry,
+                                                               exec_dpa=args.no_dpa,
+                                                               provenance=args.no_provenance,
+                                                               sync=sync) or []))
+    urls = [url for ref_des, ref_des_urls in input_urls for url in ref_des_urls]
+
+    if not urls:
+        logging.info('No new data found')
+        return 0
+
+    if not args.send:
+        if args.input:
+            write_json_items({'input': ref_des, 'urls': ref_des_urls} for ref_des, ref_des_urls in input_urls)
+        else:
+            write_records(args, urls, cols=['url'])
+        if args.commit:
+            sync.commit()
+        return 0
+
+    # Send the requests and only advance the high-water marks for the requests that succeeded
+    responses = []
+    sent_urls = []
+    for url in urls:
+        client.send_request(url)
+        responses.append({'url': url,
+                          'status_code': client.last_status_code,
+                          'response': client.last_response})
+        if client.last_status_code == 200:
+            sent_urls.append(url)
+
+    sync.commit(urls=sent_urls)
+
+    write_records(args, responses, cols=['url', 'status_code'])
+
+    if len(sent_urls) != len(urls):
+        logging.error('{:d} of {:d} requests failed'.format(len(urls) - len(sent_urls), len(urls)))
+        return 1
+
+    return 0
+
+
+def _snapshot(args):
+
+    from m2m.InventorySnapshot import InventorySnapshot
+
+    if args.crawl:
+        from m2m.InventoryCrawler import load_snapshot
+        crawl = load_snapshot(args.crawl)
+        if not crawl:
+            return 1
+
+        snapshot = InventorySnapshot(args.db_path)
+        count = snapshot.write_crawl(crawl)
+        snapshot.set_info(crawl['base_url'])
+        snapshot.close()
+
+        logging.info('Saved {:d} instruments: {:s}'.format(count, args.db_path))
+        return 0
+
+    # The metadata is fetched from UFrame, so the daemon is not used
+    args.no_daemon = True
+    client = create_client(args)
+    if not client:
+        return 1
+
+    count = client.save_snapshot(args.db_path, ref_des=args.ref_des or '', max_workers=args.workers)
+    if count is None:
+        return 1
+
+    logging.info('Saved {:d} instruments: {:s}'.format(count, args.db_path))
+
+    return 0
+
+
+def _crawl(args):
+
+    from m2m.InventoryCrawler import InventoryCrawler
+
+    uframe_base_url = args.base_url or os.getenv('UFRAME_BASE_URL')
+    if not uframe_base_url:
+        logging.error('No base_url set/found')
+        return 1
+
+    crawler = InventoryCrawler(uframe_base_url,
+                               args.work_dir,
+                               m2m=args.direct,
+                               timeout=args.timeout,
+                               api_username=os.getenv('UFRAME_API_USERNAME'),
+                               api_token=os.getenv('UFRAME_API_TOKEN'),
+                               processes=args.processes,
+                               max_workers=args.workers)
+
+    status = crawler.crawl(subsites=args.subsite, force=args.force)
+    if status is None:
+        return 1
+
+    write_records(args, status)
+
+    if status['failed']:
+        logging.error('{:d} subsites failed.  Run again to retry them'.format(len(status['failed'])))
+        return 1
+
+    if not crawler.merge(args.output or os.path.join(args.work_dir, 'snapshot.json')):
+        return 1
+
+    return 0
+
+
+def _diff(args):
+
+    from m2m.InventorySnapshot import InventorySnapshot
+    from m2m.snapshots import diff_snapshots, summarize_changes
+
+    for db_path in [args.old_snapshot, args.new_snapshot]:
+        if not os.path.isfile(db_path):
+            logging.error('Invalid snapshot specified: {:s}'.format(db_path))
+            return 1
+
+    changes = diff_snapshots(InventorySnapshot(args.old_snapshot),
+                             InventorySnapshot(args.new_snapshot),
+                             stalled=not args.no_stalled)
+    if args.event:
+        changes = [c for c in changes if c['event'] in args.event]
+
+    if args.summary:
+        write_records(args, summarize_changes(changes))
+    else:
+        write_records(args, changes, cols=['event', 'reference_designator', 'method', 'stream', 'pdId',
+                                           'deploymentNumber'])
+
+    return 0
+
+
+def _record_timings(args, timings):
+    """Write the startup and command timings, in seconds, to stderr if --timing is set and append
+    them, as a JSON line, to the file named by the M2M_TIMING_LOG environment variable if set"""
+
+    record = {'command': getattr(args, 'command_name', None),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+    record.update(dict([(k, round(v, 4)) for k, v in timings.items()]))
+
+    if args.timing:
+        sys.stderr.write('{:s}\n'.format(json.dumps(record, sort_keys=True)))
+
+    timing_log = os.getenv(TIMING_LOG_ENV)
+    if timing_log:
+        try:
+            with open(timing_log, 'a') as fid:
+                fid.write('{:s}\n'.format(json.dumps(record, sort_keys=True)))
+        except IOError as e:
+            logging.warning('Unable to write timing log {:s} ({:})'.format(timing_log, e))
+
+
+def _build_parser():
+
+    from m2m.MetadataDaemon import DEFAULT_SOCKET
+
+    arg_parser = argparse.ArgumentParser(prog='m2m',
+                                         description='OOI UFrame machine to machine (m2m) API client',
+                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    arg_parser.add_argument('-b', '--baseurl',
+                            dest='base_url',
+                            type=str,
+                            help='UFrame base url beginning with http(s).  Taken from UFRAME_BASE_URL if not specified')
+
+    arg_parser.add_argument('-t', '--timeout',
+                            type=int,
+                            default=30,
+                            help='Request timeout, in seconds')
+
+    arg_parser.add_argument('-l', '--loglevel',
+                            help='Verbosity level',
+                            type=str,
+                            choices=['debug', 'info', 'warning', 'error', 'critical'],
+                            default='warning')
+
+    arg_parser.add_argument('-d', '--direct',
+                            action='store_false',
+                            help='Send requests directly to UFrame, not via m2m (Not recommended)')
+
+    arg_parser.add_argument('--socket',
+                            type=str,
+                            default=DEFAULT_SOCKET,
+                            help='Metadata daemon Unix socket.  Taken from M2M_DAEMON_SOCKET if set')
+
+    arg_parser.add_argument('--no_daemon',
+                            action='store_true',
+                            help='Do not use a running metadata daemon')
+
+    arg_parser.add_argument('--snapshot',
+                            type=str,
+                            help='Answer all requests offline from this inventory snapshot database')
+
+    arg_parser.add_argument('--timing',
+                            action='store_true',
+                            help='Print the import, client and command timings, in seconds, to stderr')
+
+    subparsers = arg_parser.add_subparsers(title='commands')
+
+    def add_batch_options(parser, what):
+        parser.add_argument('-i', '--input',
+                            help='File containing one {:s} per line, or - to read them from stdin.  '
+                                 'Results are printed per input'.format(what))
+        parser.add_argument('-w', '--workers',
+                            type=int,
+                            default=4,
+                            help='Number of concurrent requests')
+
+    def add_command(name, command, help):
+        parser = subparsers.add_parser(name,
+                                       help=help,
+                                       description=help,
+                                       formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+        parser.set_defaults(command=command, command_name=name)
+        output = parser.add_mutually_exclusive_group()
+        output.add_argument('--csv',
+                            action='store_true',
+                            help='Print results as csv records')
+        output.add_argument('--ndjson',
+                            action='store_true',
+                            help='Print each result as a single line of JSON as soon as it is available')
+        return parser
+
+    parser = add_command('instruments', _instruments, 'List instruments as fully-qualified reference designators')
+    parser.add_argument('ref_des',
+                        nargs='?',
+                        help='Fully or partially-qualified reference designator to filter instruments')
+    add_batch_options(parser, 'reference designator')
+
+    parser = add_command('streams', _streams, 'List stream names or the instruments producing a stream')
+    parser.add_argument('stream',
+                        nargs='?',
+                        help='Full or partial stream name.  Lists the instruments producing the stream')
+    add_batch_options(parser, 'stream name')
+
+    parser = add_command('instrument-streams', _instrument_streams, 'Fetch the streams produced by instruments')
+    parser.add_argument('ref_des',
+                        nargs='?',
+                        help='Fully or partially-qualified reference designator')
+    add_batch_options(parser, 'reference designator')
+
+    parser = add_command('parameters', _parameters, 'Fetch the parameters produced by instruments')
+    parser.add_argument('ref_des',
+                        nargs='?',
+                        help='Fully or partially-qualified reference designator')
+    add_batch_options(parser, 'reference designator')
+
+    parser = add_command('subsites', _subsites, 'List sensor or deployment inventory subsites')
+    parser.add_argument('subsite',
+                        nargs='?',
+                        help='Partial subsite name to filter subsites')
+    parser.add_argument('--inventory',
+                        choices=['sensor', 'deployment'],
+                        default='sensor',
+                        help='Inventory to list subsites from')
+
+    parser = add_command('deployments', _deployments, 'Fetch instrument deployment events')
+    parser.add_argument('ref_des',
+                        nargs='?',
+                        help='Fully or partially-qualified reference designator')
+    add_batch_options(parser, 'reference designator')
+    parser.add_argument('-s', '--status',
+                        choices=['active', 'inactive', 'all'],
+                        default='active',
+                        help='Deployment status')
+
+    parser = add_command('status', _status, 'Show the deployment status and stream particle overlap')
+    parser.add_argument('ref_des',
+                        nargs='?',
+                        help='Fully or partially-qualified reference designator')
+    add_batch_options(parser, 'reference designator')
+    parser.add_argument('-s', '--status',
+                        choices=['active', 'inactive', 'all'],
+                        default='active',
+                        help='Deployment status')
+    parser.add_argument('--telemetry',
+                        help='Restrict streams to the specified telemetry type')
+
+    parser = add_command('coverage', _coverage, 'Report the percentage of each deployment covered by each stream')
+    parser.add_argument('ref_des',
+                        nargs='?',
+                        help='Fully or partially-qualified reference designator.  All instruments if not specified')
+    parser.add_argument('-s', '--status',
+                        choices=['active', 'inactive', 'all'],
+                        default='all',
+                        help='Deployment status')
+    parser.add_argument('--telemetry',
+                        help='Restrict streams to the specified telemetry type')
+    parser.add_argument('-w', '--workers',
+                        type=int,
+                        default=4,
+                        help='Number of concurrent requests')
+    parser.add_argument('--cache_dir',
+                        help='Directory in which coverage reports are cached')
+    parser.add_argument('--refresh',
+                        action='store_true',
+                        help='Ignore any cached report')
+
+    parser = add_command('find-params', _find_params, 'Find instrument streams containing parameter names')
+    parser.add_argument('parameter_search_terms',
+                        nargs='+',
+                        help='One or more parameter search terms')
+    parser.add_argument('-a', '--array',
+                        dest='ooi_array',
+                        choices=['ce', 'cp', 'ga', 'gi', 'gp', 'gs', 'rs'],
+                        help='First 2 characters of the OOI array')
+    parser.add_argument('-r', '--ref_des',
+                        dest='ref_des_term',
+                        help='Full or partial reference designator to further refine the search')
+    parser.add_argument('--method',
+                        dest='telemetry',
+                        choices=['telemetered', 'recovered', 'recovered_host', 'streamed'],
+                        help='Telemetry type')
+
+    parser = add_command('request', _request, 'Create, and optionally send, NetCDF requests')
+    parser.add_argument('ref_des',
+                        nargs='?',
+                        help='Fully or partially-qualified reference designator')
+    parser.add_argument('-i', '--input',
+                        help='File containing one reference designator, optionally followed by a stream name separated '
+                             'by whitespace or a comma, per line, or - to read them from stdin.  Urls are printed per '
+                             'input')
+    parser.add_argument('-u', '--user',
+                        default='anonymous',
+                        help='User name for the requests')
+    parser.add_argument('--stream',
+                        help='Restrict urls to the specified stream name')
+    parser.add_argument('--telemetry',
+                        help='Restrict urls to the specified telemetry type')
+    parser.add_argument('-p', '--parameter',
+                        action='append',
+                        help='Only request this parameter name or pdId.  May be specified more than once')
+    parser.add_argument('--by_deployment',
+                        action='store_true',
+                        help='Create one request per deployment, skipping the gaps between deployments')
+    parser.add_argument('-s', '--start_date',
+                        help='ISO-8601 request start time')
+    parser.add_argument('-e', '--end_date',
+                        help='ISO-8601 request end time')
+    parser.add_argument('--time_delta_type',
+                        choices=['minutes', 'hours', 'days', 'weeks'],
+                        help='Time delta type for calculating the request start time')
+    parser.add_argument('--time_delta_value',
+                        type=int,
+                        help='Positive integer value to subtract from the end time to get the request start time')
+    parser.add_argument('--no_dpa',
+                        action='store_false',
+                        help='Do not execute the data product algorithms')
+    parser.add_argument('--no_provenance',
+                        action='store_false',
+                        help='Do not include provenance information in the data sets')
+    parser.add_argument('--email',
+                        help='Email address notified when the request completes')
+    parser.add_argument('--catalog',
+                        help='Local data catalog database.  Only request time windows not already downloaded')
+    send = parser.add_mutually_exclusive_group()
+    send.add_argument('--send',
+                      action='store_true',
+                      help='Send the requests via the durable request queue')
+    send.add_argument('-o', '--outputdir',
+                      help='Send each request directly and write its JSON response to a file in outputdir')
+    parser.add_argument('--queue',
+                        default='m2m_requests.db',
+                        help='Request queue database used with --send')
+    parser.add_argument('-w', '--workers',
+                        type=int,
+                        default=4,
+                        help='Number of concurrent request workers')
+
+    parser = add_command('preview', _preview, 'Fetch decimated quick-look previews of instrument streams')
+    parser.add_argument('ref_des',
+                        nargs='?',
+                        help='Fully or partially-qualified reference designator.  All instruments if not specified')
+    parser.add_argument('--stream',
+                        help='Restrict previews to streams containing this name')
+    parser.add_argument('--telemetry',
+                        help='Restrict previews to the specified telemetry type')
+    parser.add_argument('-s', '--start_date',
+                        help='ISO-8601 preview start time')
+    parser.add_argument('-e', '--end_date',
+                        help='ISO-8601 preview end time')
+    parser.add_argument('-p', '--parameter',
+                        action='append',
+                        help='Only preview this parameter name or pdId.  May be specified more than once')
+    parser.add_argument('-n', '--limit',
+                        type=int,
+                        default=1000,
+                        help='Maximum number of particles in each preview (1 - 10000)')
+    parser.add_argument('--dpa',
+                        action='store_true',
+                        help='Execute the data product algorithms to preview L1/L2 parameters')
+    parser.add_argument('--cache_dir',
+                        help='Directory in which previews are cached')
+    parser.add_argument('-w', '--workers',
+                        type=int,
+                        default=8,
+                        help='Number of concurrent requests')
+
+    parser = add_command('download', _download, 'Download the NetCDF files of completed asynchronous requests')
+    parser.add_argument('async_url',
+                        nargs='?',
+                        help='Asynchronous results url')
+    parser.add_argument('-i', '--input',
+                        help='File containing one asynchronous results url per line, or - to read them from stdin.  '
+                             'Results are printed per input')
+    parser.add_argument('--pattern',
+                        default=r'\.nc$',
+                        help='Download only files matching the regex pattern')
+    parser.add_argument('-p', '--printurl',
+                        action='store_true',
+                        help='Print the file urls, but do not download them')
+    parser.add_argument('-o', '--outputdir',
+                        help='Download destination.  Defaults to the current directory')
+    parser.add_argument('--catalog',
+                        help='Register the downloaded files in the local data catalog database')
+    parser.add_argument('-w', '--workers',
+                        type=int,
+                        default=4,
+                        help='Number of concurrent downloads')
+    parser.add_argument('-f', '--force',
+                        action='store_true',
+                        help='Download available files even if the request has not completed')
+
+    parser = add_command('daemon', _daemon, 'Run the metadata daemon')
+    parser.add_argument('--cache_ttl',
+                        type=int,
+                        default=600,
+                        help='Number of seconds instrument metadata and deployment responses are cached')
+    parser.add_argument('--refresh_interval',
+                        type=int,
+                        help='Refresh the table of contents every refresh_interval seconds')
+
+    parser = add_command('sync', _sync, 'Create NetCDF requests for the data that arrived since the last sync')
+    parser.add_argument('state_file',
+                        help='JSON file containing the end time of the last sync for each stream')
+    parser.add_argument('ref_des',
+                        nargs='?',
+                        help='Fully or partially-qualified reference designator.  All instruments if not specified')
+    parser.add_argument('-i', '--input',
+                        help='File containing one reference designator per line, or - to read them from stdin.  Urls '
+                             'are printed per input')
+    parser.add_argument('-u', '--user',
+                        default='anonymous',
+                        help='User name for the requests')
+    parser.add_argument('--stream',
+                        help='Restrict urls to the specified stream name')
+    parser.add_argument('--telemetry',
+                        help='Restrict urls to the specified telemetry type')
+    parser.add_argument('--send',
+                        action='store_true',
+                        help='Send the requests and only advance the sync state of the requests that succeeded')
+    parser.add_argument('--commit',
+                        action='store_true',
+                        help='Advance the sync state without sending the requests')
+    parser.add_argument('--no_dpa',
+                        action='store_false',
+                        help='Do not execute the data product algorithms')
+    parser.add_argument('--no_provenance',
+                        action='store_false',
+                        help='Do not include provenance information in the data sets')
+
+    parser = add_command('snapshot', _snapshot, 'Save the inventory metadata to a SQLite snapshot database')
+    parser.add_argument('db_path',
+                        help='SQLite snapshot database, which is created if it does not exist')
+    parser.add_argument('ref_des',
+                        nargs='?',
+                        help='Only save the metadata of instruments matching this reference designator')
+    parser.add_argument('-c', '--crawl',
+                        help='Load the snapshot file written by the crawl command instead of fetching the metadata')
+    parser.add_argument('-w', '--workers',
+                        type=int,
+                        default=4,
+                        help='Number of concurrent requests')
+
+    parser = add_command('crawl', _crawl, 'Crawl the full inventory into a snapshot file')
+    parser.add_argument('work_dir',
+                        help='Directory containing the subsite shard files')
+    parser.add_argument('-o', '--output',
+                        help='Snapshot file.  Written to work_dir/snapshot.json if not specified')
+    parser.add_argument('-s', '--subsite',
+                        action='append',
+                        help='Only crawl subsites containing this string.  May be specified more than once')
+    parser.add_argument('-p', '--processes',
+                        type=int,
+                        default=4,
+                        help='Number of crawler processes')
+    parser.add_argument('-w', '--workers',
+                        type=int,
+                        default=4,
+                        help='Number of concurrent requests sent by each process')
+    parser.add_argument('-f', '--force',
+                        action='store_true',
+                        help='Crawl subsites whose shard has already been written')
+
+    parser = add_command('diff', _diff, 'Compare two inventory snapshots')
+    parser.add_argument('old_snapshot',
+                        help='Snapshot database taken first')
+    parser.add_argument('new_snapshot',
+                        help='Snapshot database taken last')
+    parser.add_argument('-e', '--event',
+                        action='append',
+                        help='Only print changes of this event type.  May be specified more than once')
+    parser.add_argument('--summary',
+                        action='store_true',
+                        help='Print the number of changes of each event type')
+    parser.add_argument('--no_stalled',
+                        action='store_true',
+                        help='Do not check for deployed streams that stopped growing')
+
+    return arg_parser
@@ -0,0 +1,151 @@
+import logging
+import time
+from collections import OrderedDict
+from m2m.batch import bulk_fetch, bulk_stream_records
+from m2m.records import DeploymentRecord, deployment_ref_des
+from m2m.timeutils import ms_to_datetime
+
+logger = logging.getLogger(__name__)
+
+
+def annotate_deployments(deployments):
+    """Return the list of deployment events with the ref_des, eventStartTs, eventStopTs and active
+    fields added (see DeploymentRecord.to_dict)"""
+
+    now = int(time.time() * 1000)
+
+    return [DeploymentRecord.from_dict(d, now=now).to_dict() for d in deployments]
+
+
+def deployment_records(deployments, status='all'):
+    """Return the list of DeploymentRecords of the deployment events, filtered by deployment status
+    (all, active or inactive).  The active status of all records is computed at the same time"""
+
+    now = int(time.time() * 1000)
+
+    records = [DeploymentRecord.from_dict(d, now=now) for d in deployments]
+    if status == 'active':
+        return [r for r in records if r.active]
+    elif status == 'inactive':
+        return [r for r in records if not r.active]
+
+    return records
+
+
+def deployment_windows(begin_time, end_time, deployments):
+    """Return the time-sorted list of (begin, end, deployment_number) windows, in milliseconds
+    since 1970-01-01, of the DeploymentRecords that overlap the begin_time - end_time window,
+    clipped to that window.  Deployments without a stop_time are still active and deployments
+    without a start_time are skipped"""
+
+    windows = []
+    for r in deployments:
+        if not r.start_time:
+            continue
+        t0 = max(begin_time, r.start_time)
+        t1 = min(end_time, r.stop_time) if r.stop_time else end_time
+        if t0 < t1:
+            windows.append((t0, t1, r.deployment_number))
+
+    return sorted(windows)
+
+
+def deployment_status(client, instruments, status='active', telemetry=None, max_workers=4):
+    """Return the list of deployment status records created by iter_deployment_status"""
+
+    return list(iter_deployment_status(client,
+                                       instruments,
+                                       status=status,
+                                       telemetry=telemetry,
+                                       max_workers=max_workers))
+
+
+def iter_deployment_status(client, instruments, status='active', telemetry=None, max_workers=4):
+    """Generator yielding the deployment status records, one for each deployment of each stream
+    produced by the instruments, describing whether the deployment is active and whether the
+    stream contains particles from the deployment window.  The deployments and streams of all
+    instruments are fetched with the client bulk fetch path and the records of each instrument
+    are yielded as soon as its streams arrive.
+
+    Arguments:
+        client: UFrameClient instance
+        instruments: list of fully-qualified reference designators
+        status: deployment status (all, active or inactive)
+        telemetry: if specified, only streams whose method contains telemetry are included
+        max_workers: maximum number of concurrent requests
+    """
+
+    if status not in ('all', 'active', 'inactive'):
+        logger.error('Invalid deployment status type specified {:s}'.format(status))
+        return
+
+    deployed = []
+    for instrument, all_deployments in bulk_fetch(client, 'deployments', instruments, max_workers=max_workers):
+
+        # Request failed
+        if all_deployments is None:
+            continue
+
+        if not all_deployments:
+            logger.debug('No deployments found for instrument {:s}'.format(instrument))
+            continue
+
+        # Normalize the deployments once and filter them on deployment status
+        records = deployment_records(all_deployments, status)
+        if not records:
+            logger.debug('No {:s} deployments found for instrument {:s}'.format(status, instrument))
+            continue
+
+        deployed.append((instrument, records))
+
+    instrument_streams = bulk_stream_records(client, [i for i, d in deployed], max_workers=max_workers)
+    for (instrument, all_deployments), (ref_des, streams) in zip(deployed, instrument_streams):
+
+        if not streams:
+            logger.warning('No streams found for deployed instrument')
+            continue
+
+        for d in all_deployments:
+
+            # Deployment event must have a start time
+            if not d.start_time:
+                logger.warning('Deployment event has no eventStartTime')
+                continue
+
+            # Deployment window timestamps
+            deployment_start_time = ms_to_datetime(d.start_time).strftime('%Y-%m-%dT%H:%M:%S.%sZ')
+            deployment_end_time = None
+            if d.stop_time:
+                deployment_end_time = ms_to_datetime(d.stop_time).strftime('%Y-%m-%dT%H:%M:%S.%sZ')
+
+            # Loop through each stream
+            for stream in streams:
+
+                if telemetry and stream.method.find(telemetry) == -1:
+                    continue
+
+                record = OrderedDict()
+                record['reference_designator'] = d.reference_designator
+                record['stream'] = stream.stream
+                record['telemetry'] = stream.method
+                record['deployment_number'] = d.deployment_number
+                record['active'] = False
+                record['deployment_has_particles'] = True
+                record['deployment_start_time'] = None
+                record['deployment_end_time'] = None
+                record['stream_start_time'] = stream.beginTime
+                record['stream_end_time'] = stream.endTime
+                record['stream_particle_count'] = stream.count
+                record['active'] = d.active
+
+                # Check stream endTime to make sure it's not before the deployment began
+                if stream.end_time < d.start_time:
+                    record['deployment_has_particles'] = False
+                elif d.stop_time and stream.begin_time > d.stop_time:
+                    record['deployment_has_particles'] = False
+
+                # Set the request start_date and end_date to the deployment window
+                record['deployment_start_time'] = deployment_start_time
+                record['deployment_end_time'] = deployment_end_time
+
+                yield record
@@ -0,0 +1,154 @@
+import codecs
+import json
+
+# Number of characters consumed from the front of the buffer before it is compacted
+_COMPACT_SIZE = 65536
+
+_whitespace = ' \t\n\r'
+_delimiters = ',]}' + _whitespace
+
+
+class _Reader(object):
+    """Incrementally decodes byte or text chunks into a text buffer"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def read(self):
+        """Append the next chunk to the buffer.  Returns False once the input is exhausted"""
+
+        if self.eof:
+            return False
+
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self.eof = True
+            self.buf += self._decoder.decode(b'', final=True)
+            return False
+
+        if type(chunk) == bytes:
+            chunk = self._decoder.decode(chunk)
+
+        # Drop everything already consumed before growing the buffer
+        if self.pos > _COMPACT_SIZE:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+
+        self.buf += chunk
+
+        return True
+
+    def skip(self, chars=_whitespace):
+        """Advance past chars and return the next character, or None at the end of the input"""
+
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in chars:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.read():
+                return None
+
+    def expect(self, char):
+        c = self.skip()
+        if c != char:
+            raise ValueError('Expected {:s} at position {:d}, found {:}'.format(char, self.pos, c))
+        self.pos += 1
+
+    def fill(self, size):
+        """Read until at least size unconsumed characters are buffered or the input is
+        exhausted"""
+
+        while len(self.buf) - self.pos < size and self.read():
+            pass
+
+    def decode(self, decoder):
+        """Decode and return the next complete JSON value in the buffer.  A value that is not yet
+        complete is only decoded again once the unconsumed buffer has doubled in size, so a
+        large value spanning many chunks is decoded a logarithmic number of times, instead of
+        once for every chunk"""
+
+        self.skip()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+                self.fill(2 * (len(self.buf) - self.pos))
+                continue
+
+            # A number or literal is only complete once it is followed by a delimiter
+            if not isinstance(value, (dict, list)) and self.buf[self.pos] != '"':
+                if (end == len(self.buf) or self.buf[end] not in _delimiters) and self.read():
+                    continue
+
+            self.pos = end
+            return value
+
+
+def iter_array_items(chunks):
+    """Iterate over the items of the top-level JSON array contained in the byte or text chunks
+    (i.e.: requests.Response.iter_content) without decoding the whole document.  Only a single
+    item is held in memory at a time.  Raises ValueError if the document is not a JSON array"""
+
+    reader = _Reader(chunks)
+    decoder = json.JSONDecoder()
+
+    for item in _iter_array(reader, decoder):
+        yield item
+
+
+def iter_object_items(chunks, array_keys):
+    """Iterate over the members of the top-level JSON object contained in the byte or text
+    chunks, yielding (key, value) tuples.  The arrays stored under the keys in array_keys are
+    not decoded as a whole: one (key, item) tuple is yielded for each item instead.  All other
+    members are yielded as fully decoded values.  Raises ValueError if the document is not a
+    JSON object"""
+
+    reader = _Reader(chunks)
+    decoder = json.JSONDecoder()
+
+    reader.expect('{')
+    if reader.skip() == '}':
+        return
+
+    while True:
+        key = reader.decode(decoder)
+        reader.expect(':')
+
+        if key in array_keys and reader.skip() == '[':
+            for item in _iter_array(reader, decoder):
+                yield key, item
+        else:
+            yield key, reader.decode(decoder)
+
+        c = reader.skip()
+        reader.pos += 1
+        if c == '}':
+            return
+        if c != ',':
+            raise ValueError('Expected , or }} at position {:d}, found {:}'.format(reader.pos - 1, c))
+
+
+def _iter_array(reader, decoder):
+
+    reader.expect('[')
+    if reader.skip() == ']':
+        reader.pos += 1
+        return
+
+    while True:
+        yield reader.decode(decoder)
+
+        c = reader.skip()
+        reader.pos += 1
+        if c == ']':
+            return
+        if c != ',':
+            raise ValueError('Expected , or ] at position {:d}, found {:}'.format(reader.pos - 1, c))
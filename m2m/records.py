@@ -0,0 +1,182 @@
+import logging
+import time
+from m2m.timeutils import iso_to_ms, ms_to_uframe_ts, ms_to_datetime
+
+logger = logging.getLogger(__name__)
+
+
+class StreamRecord(object):
+    """Compact record of a stream produced by an instrument, with the stream begin and end times
+    stored as integer milliseconds since 1970-01-01"""
+
+    __slots__ = ('reference_designator', 'method', 'stream', 'count', 'begin_time', 'end_time')
+
+    def __init__(self, reference_designator, method, stream, count, begin_time, end_time):
+        self.reference_designator = reference_designator
+        self.method = method
+        self.stream = stream
+        self.count = count
+        self.begin_time = begin_time
+        self.end_time = end_time
+
+    @classmethod
+    def from_dict(cls, ref_des, s, intern=None):
+        """Create a record from the stream dict s (i.e.: a table of contents stream entry or
+        an item of the metadata/times response) for the fully-qualified reference designator.
+        If specified, all strings are passed through the intern function.  Raises ValueError
+        if the beginTime or endTime cannot be parsed"""
+
+        if intern:
+            return cls(intern(ref_des), intern(s['method']), intern(s['stream']), s['count'],
+                       iso_to_ms(s['beginTime']), iso_to_ms(s['endTime']))
+
+        return cls(ref_des, s['method'], s['stream'], s['count'], iso_to_ms(s['beginTime']), iso_to_ms(s['endTime']))
+
+    @property
+    def key(self):
+        return self.reference_designator, self.method, self.stream
+
+    @property
+    def beginTime(self):
+        return ms_to_uframe_ts(self.begin_time)
+
+    @property
+    def endTime(self):
+        return ms_to_uframe_ts(self.end_time)
+
+    def to_dict(self):
+        """Return the record as a UFrame stream metadata dict"""
+
+        return {'sensor': self.reference_designator,
+                'method': self.method,
+                'stream': self.stream,
+                'count': self.count,
+                'beginTime': self.beginTime,
+                'endTime': self.endTime}
+
+    def __eq__(self, other):
+        return isinstance(other, StreamRecord) and all(
+            [getattr(self, a) == getattr(other, a) for a in self.__slots__])
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return '<StreamRecord({:s}-{:s}-{:s}, count={:}, {:s} - {:s})>'.format(self.reference_designator,
+                                                                             self.method,
+                                                                             self.stream,
+                                                                             self.count,
+                                                                             self.beginTime,
+                                                                             self.endTime)
+
+
+
+def stream_records(ref_des, streams, intern=None):
+    """Return the list of StreamRecords created from the stream dicts (i.e.: the table of contents
+    streams or the metadata/times response) of the fully-qualified reference designator, with the
+    beginTime and endTime of each stream parsed once.  Streams with unparseable times are logged
+    and skipped.  See StreamRecord.from_dict"""
+
+    records = []
+    for s in streams:
+        try:
+            records.append(StreamRecord.from_dict(ref_des, s, intern=intern))
+        except (KeyError, ValueError) as e:
+            logger.warning('{:s}-{:s}: Invalid stream times ({:})'.format(ref_des, s.get('stream'), e))
+
+    return records
+
+class DeploymentRecord(object):
+    """Compact, normalized deployment event.  The reference designator is normalized to a
+    string, the event start and stop times are stored as integer milliseconds since 1970-01-01
+    and the active status is computed once, when the record is created.  The raw event dict is
+    kept as event"""
+
+    __slots__ = ('reference_designator', 'deployment_number', 'start_time', 'stop_time', 'active', 'event')
+
+    def __init__(self, reference_designator, deployment_number, start_time, stop_time, active, event=None):
+        self.reference_designator = reference_designator
+        self.deployment_number = deployment_number
+        self.start_time = start_time
+        self.stop_time = stop_time
+        self.active = active
+        self.event = event
+
+    @classmethod
+    def from_dict(cls, d, now=None):
+        """Create a record from the deployment event dict d returned by the asset management API.
+        The deployment is active if it has no eventStopTime or the eventStopTime is not before now,
+        in milliseconds since 1970-01-01 (Default is the current time)"""
+
+        if now is None:
+            now = int(time.time() * 1000)
+
+        stop_time = d['eventStopTime']
+
+        return cls(deployment_ref_des(d),
+                   d.get('deploymentNumber'),
+                   d['eventStartTime'],
+                   stop_time,
+                   not stop_time or stop_time >= now,
+                   event=d)
+
+    @property
+    def key(self):
+        return self.reference_designator, self.deployment_number
+
+    @property
+    def eventStartTs(self):
+        return _deployment_ts(self.start_time)
+
+    @property
+    def eventStopTs(self):
+        return _deployment_ts(self.stop_time) if self.stop_time else None
+
+    def to_dict(self):
+        """Return the event dict with the ref_des, eventStartTs, eventStopTs and active fields
+        added"""
+
+        d = dict(self.event or {})
+        d['ref_des'] = self.reference_designator
+        d['eventStartTs'] = self.eventStartTs
+        d['eventStopTs'] = self.eventStopTs
+        d['active'] = self.active
+
+        return d
+
+    def __eq__(self, other):
+        return isinstance(other, DeploymentRecord) and all(
+            [getattr(self, a) == getattr(other, a) for a in self.__slots__ if a != 'event'])
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return '<DeploymentRecord({:s}, deployment={:}, {:} - {:}, active={:})>'.format(self.reference_designator,
+                                                                                     self.deployment_number,
+                                                                                     self.eventStartTs,
+                                                                                     self.eventStopTs,
+                                                                                     self.active)
+
+
+def deployment_ref_des(deployment):
+    """Return the fully-qualified reference designator of the deployment event.  Handles the
+    inconsistent nature of the deployment asset management schema, in which the
+    referenceDesignator is either a string or a subsite/node/sensor dict"""
+
+    if type(deployment['referenceDesignator']) == dict:
+        return '-'.join([deployment['referenceDesignator']['subsite'],
+                         deployment['referenceDesignator']['node'],
+                         deployment['referenceDesignator']['sensor']])
+
+    return deployment['referenceDesignator']
+
+
+def _deployment_ts(ms):
+    """Convert milliseconds since 1970-01-01 to the second precision deployment timestamp (i.e.:
+    2015-04-01T00:00:00Z)"""
+
+    if ms is None:
+        return None
+
+    return ms_to_datetime(ms).strftime('%Y-%m-%dT%H:%M:%SZ')
@@ -0,0 +1,75 @@
+import copy
+
+
+def find_parameter_instruments(toc, search_terms, ooi_array=None, ref_des_term=None, telemetry=None):
+    """Search the table of contents for instruments that produce a stream containing a parameter
+    whose name (particle_key) contains one or more of the search_terms.  Returns the list of
+    table of contents instrument entries, each containing only the matching streams.
+
+    Arguments:
+        toc: UFrame table of contents dict
+        search_terms: list of parameter name search terms
+        ooi_array: if specified, only instruments on the array (i.e.: ce) are searched
+        ref_des_term: if specified, only instruments whose reference designator contains
+            ref_des_term are searched
+        telemetry: if specified, only streams with this method are included
+    """
+
+    # Get the particle_key (parameter name)
+    parameters = []
+    for term in search_terms:
+        found_pd_ids = [{'pdId': p['pdId'], 'particle_key': p['particle_key']} for p in toc['parameter_definitions'] if
+                        p['particle_key'].find(term) > -1]
+        if not found_pd_ids:
+            continue
+
+        parameters = parameters + found_pd_ids
+
+    # Unique list of pd ids
+    pd_ids = list(set([p['pdId'] for p in parameters]))
+
+    target_streams = []
+    for pd_id in pd_ids:
+        pd_id_streams = [k for k in toc['parameters_by_stream'] if pd_id in toc['parameters_by_stream'][k]]
+        if not pd_id_streams:
+            continue
+        target_streams = target_streams + pd_id_streams
+
+    # Unique list of streams that have at least one pd id in them
+    target_streams = list(set(target_streams))
+    target_streams.sort()
+
+    # Loop through toc['instruments'] to see if it produces one or more stream
+    parameter_instruments = []
+    found_instruments = []
+    for instrument in toc['instruments']:
+
+        if ooi_array and not instrument['reference_designator'].startswith(ooi_array.upper()):
+            continue
+
+        if ref_des_term and instrument['reference_designator'].find(ref_des_term.upper()) == -1:
+            continue
+
+        instrument_streams = [s['stream'] for s in instrument['streams']]
+        for instrument_stream in instrument_streams:
+            if instrument_stream not in target_streams:
+                continue
+
+            if instrument['reference_designator'] not in found_instruments:
+                instrument_metadata = copy.copy(instrument)
+                instrument_metadata['streams'] = []
+                parameter_instruments.append(instrument_metadata)
+                found_instruments.append(instrument_metadata['reference_designator'])
+
+            instrument_i = found_instruments.index(instrument['reference_designator'])
+
+            if instrument_stream in [s['stream'] for s in parameter_instruments[instrument_i]['streams']]:
+                continue
+
+            stream_i = instrument_streams.index(instrument_stream)
+            if telemetry and instrument['streams'][stream_i]['method'] != telemetry:
+                continue
+
+            parameter_instruments[instrument_i]['streams'].append(instrument['streams'][stream_i])
+
+    return parameter_instruments
@@ -0,0 +1,181 @@
+import logging
+import json
+from m2m.timeutils import iso_to_ms, ms_to_uframe_ts
+
+# Change record events, in the order they are reported for each instrument
+SNAPSHOT_EVENTS = ['instrument_added',
+                   'instrument_removed',
+                   'stream_added',
+                   'stream_removed',
+                   'stream_changed',
+                   'stream_stalled',
+                   'parameter_added',
+                   'parameter_removed',
+                   'deployment_added',
+                   'deployment_removed',
+                   'deployment_closed',
+                   'deployment_changed']
+
+
+def diff_snapshots(old, new, stalled=True):
+    """Compare two InventorySnapshots and return the sorted list of change dicts, each containing
+    the event type (see SNAPSHOT_EVENTS) and the reference_designator.  Stream events use the same
+    change dicts as Inventory.update.  Parameter events contain the stream, pdId and particle_key
+    and deployment events contain the deploymentNumber and the old and/or new deployment event.
+
+    Only the instruments whose streams, parameters or deployments digest differs are read, so
+    unchanged instruments cost a single digest comparison.
+
+    Arguments:
+        old: InventorySnapshot taken first
+        new: InventorySnapshot taken last
+        stalled: if True, a stream_stalled change is reported for each non-recovered stream whose
+            endTime did not advance between the snapshots, although the instrument has a
+            deployment that had not ended when the new snapshot was taken
+    """
+
+    logger = logging.getLogger(__name__)
+
+    old_digests = old.digests()
+    new_digests = new.digests()
+
+    changes = []
+
+    for ref_des in sorted(set(old_digests.keys()) - set(new_digests.keys())):
+        changes.append({'event': 'instrument_removed', 'reference_designator': ref_des})
+    for ref_des in sorted(set(new_digests.keys()) - set(old_digests.keys())):
+        changes.append({'event': 'instrument_added', 'reference_designator': ref_des})
+
+    # Instruments with changed streams, parameters or deployments
+    empty = (None, None, None)
+    changed = [[], [], []]
+    for ref_des in sorted(set(old_digests.keys()) | set(new_digests.keys())):
+        old_digest = old_digests.get(ref_des, empty)
+        new_digest = new_digests.get(ref_des, empty)
+        for i in range(3):
+            if old_digest[i] != new_digest[i]:
+                changed[i].append(ref_des)
+
+    logger.debug('{:d} instruments, {:d} changed streams, {:d} changed parameters, {:d} changed deployments'.format(
+        len(new_digests), len(changed[0]), len(changed[1]), len(changed[2])))
+
+    # Diff the streams with the same inventory update used to refresh the table of contents
+    stream_changes = old.inventory(changed[0]).update(new.inventory(changed[0]))
+    changes.extend([c for c in stream_changes if c['event'].startswith('stream_')])
+
+    for ref_des in changed[1]:
+        changes.extend(_diff_parameters(ref_des,
+                                        old.instrument_parameters(ref_des) or [],
+                                        new.instrument_parameters(ref_des) or []))
+
+    for ref_des in changed[2]:
+        changes.extend(_diff_deployments(ref_des, _deployments(old, ref_des), _deployments(new, ref_des)))
+
+    if stalled:
+        changes.extend(_stalled_streams(old, new))
+
+    changes.sort(key=lambda c: (c['reference_designator'],
+                                SNAPSHOT_EVENTS.index(c['event']),
+                                c.get('method', ''),
+                                c.get('stream', ''),
+                                c.get('pdId', ''),
+                                c.get('deploymentNumber') or 0))
+
+    return changes
+
+
+def summarize_changes(changes):
+    """Return the dict mapping each event type to the number of changes of that type"""
+
+    summary = dict([(event, 0) for event in SNAPSHOT_EVENTS])
+    for change in changes:
+        summary[change['event']] += 1
+
+    return summary
+
+
+def _diff_parameters(ref_des, old_parameters, new_parameters):
+
+    def keyed(parameters):
+        return dict([((p['stream'], p['pdId']), p) for p in parameters])
+
+    old_keyed = keyed(old_parameters)
+    new_keyed = keyed(new_parameters)
+
+    changes = []
+    for event, a, b in (('parameter_added', new_keyed, old_keyed), ('parameter_removed', old_keyed, new_keyed)):
+        for key in sorted(set(a.keys()) - set(b.keys())):
+            changes.append({'event': event,
+                            'reference_designator': ref_des,
+                            'stream': key[0],
+                            'pdId': key[1],
+                            'particle_key': a[key].get('particleKey', a[key].get('particle_key'))})
+
+    return changes
+
+
+def _deployments(snapshot, ref_des):
+    """Return the deployment events of the fully-qualified reference designator only"""
+
+    return [json.loads(r['record']) for r in
+            snapshot.query('SELECT record FROM deployments WHERE ref_des = ? ORDER BY rowid', (ref_des,))]
+
+
+def _diff_deployments(ref_des, old_deployments, new_deployments):
+
+    def keyed(deployments):
+        return dict([(d['deploymentNumber'], d) for d in deployments])
+
+    old_keyed = keyed(old_deployments)
+    new_keyed = keyed(new_deployments)
+
+    changes = []
+    for number in sorted(set(old_keyed.keys()) | set(new_keyed.keys())):
+        old = old_keyed.get(number)
+        new = new_keyed.get(number)
+        if old is None:
+            event = 'deployment_added'
+        elif new is None:
+            event = 'deployment_removed'
+        elif json.dumps(old, sort_keys=True) == json.dumps(new, sort_keys=True):
+            continue
+        elif not old['eventStopTime'] and new['eventStopTime']:
+            event = 'deployment_closed'
+        else:
+            event = 'deployment_changed'
+
+        change = {'event': event,
+                  'reference_designator': ref_des,
+                  'deploymentNumber': number}
+        if old:
+            change['old'] = old
+        if new:
+            change['new'] = new
+        changes.append(change)
+
+    return changes
+
+
+def _stalled_streams(old, new):
+    """Return the stream_stalled changes for the streams of the instruments that are deployed at
+    the time the new snapshot was taken"""
+
+    created = new.info.get('created')
+    deployed = new.active_instruments(iso_to_ms(created) if created else None)
+
+    sql = 'SELECT ref_des, method, stream, end_time FROM streams WHERE method NOT LIKE \'recovered%\''
+    old_end_times = dict([((r['ref_des'], r['method'], r['stream']), r['end_time']) for r in old.query(sql)])
+
+    changes = []
+    for row in new.query(sql):
+        if row['ref_des'] not in deployed:
+            continue
+        if old_end_times.get((row['ref_des'], row['method'], row['stream'])) != row['end_time']:
+            continue
+        changes.append({'event': 'stream_stalled',
+                        'reference_designator': row['ref_des'],
+                        'method': row['method'],
+                        'stream': row['stream'],
+                        'endTime': ms_to_uframe_ts(row['end_time'])})
+
+    return changes
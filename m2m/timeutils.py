@@ -0,0 +1,105 @@
+import calendar
+import numbers
+import datetime
+import pytz
+from dateutil import parser
+
+# Timestamp format used in all UFrame request urls
+ISO_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+# Formats tried, in order, before falling back to dateutil.parser
+_fast_formats = ('%Y-%m-%dT%H:%M:%S.%fZ',
+                 '%Y-%m-%dT%H:%M:%SZ',
+                 '%Y%m%dT%H%M%S.%f',
+                 '%Y%m%dT%H%M%S')
+
+
+def datetime_to_ms(dt):
+    """Convert a datetime to integer milliseconds since 1970-01-01.  Naive datetimes are
+    assumed to be UTC"""
+
+    if dt.tzinfo:
+        dt = dt.astimezone(pytz.UTC)
+
+    return calendar.timegm(dt.timetuple()) * 1000 + dt.microsecond // 1000
+
+
+def ms_to_datetime(ms):
+    """Convert integer milliseconds since 1970-01-01 to a timezone aware UTC datetime"""
+
+    return datetime.datetime(1970, 1, 1, tzinfo=pytz.UTC) + datetime.timedelta(milliseconds=ms)
+
+
+def ms_to_iso(ms):
+    """Convert integer milliseconds since 1970-01-01 to an ISO-8601 UFrame request timestamp"""
+
+    return ms_to_datetime(ms).strftime(ISO_FORMAT)
+
+
+def ms_to_uframe_ts(ms):
+    """Convert integer milliseconds since 1970-01-01 to a millisecond precision ISO-8601
+    timestamp, as reported in the UFrame stream metadata (i.e.: 2015-04-01T00:00:00.000Z)"""
+
+    return '{:s}.{:03d}Z'.format(ms_to_datetime(ms).strftime('%Y-%m-%dT%H:%M:%S'), ms % 1000)
+
+
+def iso_to_ms(ts):
+    """Convert an ISO-8601 timestamp to integer milliseconds since 1970-01-01.  Raises
+    ValueError if the timestamp cannot be parsed"""
+
+    for fmt in _fast_formats:
+        try:
+            return datetime_to_ms(datetime.datetime.strptime(ts, fmt))
+        except ValueError:
+            continue
+
+    return datetime_to_ms(parser.parse(ts))
+
+
+def to_ms(t):
+    """Convert an ISO-8601 timestamp, datetime or number of milliseconds since 1970-01-01 to
+    integer milliseconds since 1970-01-01"""
+
+    if isinstance(t, numbers.Number):
+        return int(t)
+    if isinstance(t, datetime.datetime):
+        return datetime_to_ms(t)
+
+    return iso_to_ms(t)
+
+
+def merge_intervals(intervals):
+    """Merge the list of overlapping or abutting (begin, end) intervals and return the
+    sorted list of disjoint intervals"""
+
+    merged = []
+    for begin, end in sorted(intervals):
+        if merged and begin <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+            continue
+
+        merged.append((begin, end))
+
+    return merged
+
+
+def interval_gaps(intervals, begin, end, tolerance=0):
+    """Return the sorted list of (begin, end) intervals between begin and end that are not
+    covered by intervals.  Gaps no longer than tolerance are ignored"""
+
+    gaps = []
+    t0 = begin
+    for i0, i1 in merge_intervals(intervals):
+        if i1 <= t0:
+            continue
+        if i0 >= end:
+            break
+        if i0 - t0 > tolerance:
+            gaps.append((t0, i0))
+        t0 = max(t0, i1)
+
+    if end - t0 > tolerance:
+        gaps.append((t0, end))
+
+    return gaps
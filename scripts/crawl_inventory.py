@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+import sys
+import argparse
+from m2m.cli import script_main
+
+
+def main(args):
+    """Crawl the full UFrame sensor and deployment inventories with a pool of processes and merge the results into a
+    single inventory snapshot file.  Each subsite is written to its own shard file in work_dir, so an interrupted crawl
+    may be restarted and only crawls the subsites that have not been written"""
+
+    argv = [args.work_dir, '-p', str(args.processes), '-w', str(args.workers)]
+    if args.output:
+        argv += ['-o', args.output]
+    for subsite in args.subsite or []:
+        argv += ['-s', subsite]
+    if args.force:
+        argv.append('-f')
+
+    return script_main(args, 'crawl', argv)
+
+
+if __name__ == '__main__':
+
+    arg_parser = argparse.ArgumentParser(description=main.__doc__,
+                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    arg_parser.add_argument('work_dir',
+                            type=str,
+                            help='Directory containing the subsite shard files')
+
+    arg_parser.add_argument('-o', '--output',
+                            type=str,
+                            help='Snapshot file.  Written to work_dir/snapshot.json if not specified')
+
+    arg_parser.add_argument('-s', '--subsite',
+                            type=str,
+                            action='append',
+                            help='Only crawl subsites containing this string.  May be specified more than once')
+
+    arg_parser.add_argument('-p', '--processes',
+                            type=int,
+                            default=4,
+                            help='Number of crawler processes')
+
+    arg_parser.add_argument('-w', '--workers',
+                            type=int,
+                            default=4,
+                            help='Number of concurrent requests sent by each process')
+
+    arg_parser.add_argument('-f', '--force',
+                            action='store_true',
+                            help='Crawl subsites whose shard has already been written')
+
+    arg_parser.add_argument('-b', '--baseurl',
+                            dest='base_url',
+                            type=str,
+                            help='UFrame base url beginning with http(s).  Taken from UFRAME_BASE_URL if not specified')
+
+    arg_parser.add_argument('-t', '--timeout',
+                            type=int,
+                            default=30,
+                            help='Request timeout, in seconds')
+
+    arg_parser.add_argument('-l', '--loglevel',
+                            help='Verbosity level',
+                            type=str,
+                            choices=['debug', 'info', 'warning', 'error', 'critical'],
+                            default='info')
+
+    arg_parser.add_argument('-d', '--direct',
+                            action='store_false',
+                            help='Send requests directly to UFrame, not via m2m (Not recommended)')
+
+    parsed_args = arg_parser.parse_args()
+
+    sys.exit(main(parsed_args))
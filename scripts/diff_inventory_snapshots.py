@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import sys
+import argparse
+from m2m.cli import script_main
+
+
+def main(args):
+    """Compare two SQLite inventory snapshots, created by save_inventory_snapshot.py, and print the instruments and
+    streams that were added or removed, streams whose times or particle counts changed, deployed streams that stopped
+    growing, parameter changes and deployments that were added, removed, closed or changed"""
+
+    argv = [args.old_snapshot, args.new_snapshot]
+    for event in args.event or []:
+        argv += ['-e', event]
+    if args.summary:
+        argv.append('--summary')
+    if args.no_stalled:
+        argv.append('--no_stalled')
+
+    return script_main(args, 'diff', argv)
+
+
+if __name__ == '__main__':
+
+    arg_parser = argparse.ArgumentParser(description=main.__doc__,
+                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    arg_parser.add_argument('old_snapshot',
+                            type=str,
+                            help='Snapshot database taken first')
+
+    arg_parser.add_argument('new_snapshot',
+                            type=str,
+                            help='Snapshot database taken last')
+
+    arg_parser.add_argument('-e', '--event',
+                            type=str,
+                            action='append',
+                            help='Only print changes of this event type.  May be specified more than once')
+
+    arg_parser.add_argument('--summary',
+                            help='Print the number of changes of each event type',
+                            action='store_true')
+
+    arg_parser.add_argument('--no_stalled',
+                            help='Do not check for deployed streams that stopped growing',
+                            action='store_true')
+
+    arg_parser.add_argument('--csv',
+                            help='Print results as csv records',
+                            action='store_true')
+
+    arg_parser.add_argument('--ndjson',
+                            help='Print each result as a single line of JSON',
+                            action='store_true')
+
+    arg_parser.add_argument('-l', '--loglevel',
+                            help='Verbosity level',
+                            type=str,
+                            choices=['debug', 'info', 'warning', 'error', 'critical'],
+                            default='info')
+
+    parsed_args = arg_parser.parse_args()
+
+    sys.exit(main(parsed_args))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+import sys
+import argparse
+from m2m.cli import script_main
+
+
+def main(args):
+    """Download all NetCDF files written to the async results directory of a completed UFrame request.  Files are
+    downloaded in parallel and interrupted downloads are resumed.  Download results are printed as valid JSON"""
+
+    argv = [args.async_url] if args.async_url else []
+    if args.input:
+        argv += ['-i', args.input]
+    for option in ['outputdir', 'catalog']:
+        if getattr(args, option):
+            argv += ['--{:s}'.format(option), getattr(args, option)]
+    argv += ['--pattern', args.pattern, '-w', str(args.workers)]
+    if args.force:
+        argv.append('-f')
+    if args.printurl:
+        argv.append('-p')
+
+    return script_main(args, 'download', argv)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=main.__doc__,
+                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    arg_parser.add_argument('async_url',
+                            nargs='?',
+                            type=str,
+                            help='Async results directory url returned in the UFrame request response')
+
+    arg_parser.add_argument('-i', '--input',
+                            type=str,
+                            help='File containing one async results directory url per line, or - to read them from stdin.  Results are printed per input')
+
+    arg_parser.add_argument('--outputdir',
+                            type=str,
+                            help='Write downloaded files to outputdir')
+
+    arg_parser.add_argument('--pattern',
+                            type=str,
+                            default=r'\.nc$',
+                            help='Download only files matching the regex pattern')
+
+    arg_parser.add_argument('--catalog',
+                            type=str,
+                            help='Register downloaded files in the local data catalog database')
+
+    arg_parser.add_argument('-w', '--workers',
+                            type=int,
+                            default=4,
+                            help='Maximum number of concurrent downloads')
+
+    arg_parser.add_argument('-f', '--force',
+                            action='store_true',
+                            help='Download files even if the request has not completed')
+
+    arg_parser.add_argument('-p', '--printurl',
+                            action='store_true',
+                            help='Print file urls to STDOUT, but do not download them')
+
+    arg_parser.add_argument('-t', '--timeout',
+                            type=int,
+                            default=30,
+                            help='Request timeout, in seconds')
+
+    arg_parser.add_argument('-l', '--loglevel',
+                            help='Verbosity level',
+                            type=str,
+                            choices=['debug', 'info', 'warning', 'error', 'critical'],
+                            default='info')
+
+    arg_parser.add_argument('--csv',
+                            help='Print results as csv records',
+                            action='store_true')
+
+    arg_parser.add_argument('--ndjson',
+                            help='Print each result as a single line of JSON as soon as it is fetched',
+                            action='store_true')
+
+    parsed_args = arg_parser.parse_args()
+
+    sys.exit(main(parsed_args))
@@ -1,59 +1,25 @@
 #!/usr/bin/env python
 
-import os
 import sys
 import argparse
-import logging
-import json
-import csv
-from m2m.UFrameClient import UFrameClient
+from m2m.cli import script_main
 
 
 def main(args):
     """Fetch all parameters in the streams produced by the partially or fully-qualified reference designator. Results
     printed as valid JSON"""
 
-    # Set up logging
-    log_level = getattr(logging, args.loglevel.upper())
-    log_format = '%(asctime)s:%(module)s:%(levelname)s:%(message)s [line %(lineno)d]'
-    logging.basicConfig(level=log_level, format=log_format)
+    return script_main(args, 'parameters', _ref_des_argv(args))
 
-    # Environment
-    # UFrame instance
-    uframe_base_url = args.base_url or os.getenv('UFRAME_BASE_URL')
-    if not uframe_base_url:
-        logging.error('No base_url set/found')
-        return 1
 
-    client = UFrameClient(uframe_base_url, timeout=args.timeout, m2m=args.direct)
-    instruments = client.search_instruments(args.ref_des)
-    if not instruments:
-        return 0
+def _ref_des_argv(args):
+    """Return the reference designator, input file and workers subcommand arguments"""
 
-    all_parameters = []
-    for instrument in instruments:
-        parameters = client.fetch_instrument_parameters(instrument)
-        if not parameters:
-            continue
-        for p in parameters:
-            p['reference_designator'] = instrument
+    argv = [args.ref_des] if args.ref_des else []
+    if args.input:
+        argv += ['-i', args.input]
 
-        all_parameters = all_parameters + parameters
-
-    if args.csv:
-        if not all_parameters:
-            return 0
-
-        csv_writer = csv.writer(sys.stdout)
-        cols = all_parameters[0].keys()
-        csv_writer.writerow(cols)
-        for parameter in all_parameters:
-            csv_writer.writerow([parameter[c] for c in cols])
-
-    else:
-        sys.stdout.write('{:s}\n'.format(json.dumps(all_parameters, sort_keys=True, indent=4)))
-
-    return 0
+    return argv + ['-w', str(args.workers)]
 
 
 if __name__ == '__main__':
@@ -62,9 +28,19 @@ if __name__ == '__main__':
                                          formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
     arg_parser.add_argument('ref_des',
+                            nargs='?',
                             type=str,
                             help='Fully or partially-qualified instrument reference designator')
 
+    arg_parser.add_argument('-i', '--input',
+                            type=str,
+                            help='File containing one partially or fully-qualified reference designator per line, or - to read them from stdin.  Results are printed per input')
+
+    arg_parser.add_argument('-w', '--workers',
+                            type=int,
+                            default=4,
+                            help='Number of concurrent requests')
+
     arg_parser.add_argument('-b', '--baseurl',
                             dest='base_url',
                             type=str,
@@ -85,6 +61,10 @@ if __name__ == '__main__':
                             help='Print results as csv records',
                             action='store_true')
 
+    arg_parser.add_argument('--ndjson',
+                            help='Print each result as a single line of JSON as soon as it is fetched',
+                            action='store_true')
+
     arg_parser.add_argument('-d', '--direct',
                             action='store_false',
                             help='Send requests directly to UFrame, not via m2m (Not recommended)')
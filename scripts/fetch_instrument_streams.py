@@ -1,59 +1,25 @@
 #!/usr/bin/env python
 
-import os
 import sys
 import argparse
-import logging
-import json
-import csv
-from m2m.UFrameClient import UFrameClient
+from m2m.cli import script_main
 
 
 def main(args):
     """Fetch all streams produced by the paritally or fully-qualified reference designator. Results printed as valid
     JSON"""
 
-    # Set up logging
-    log_level = getattr(logging, args.loglevel.upper())
-    log_format = '%(asctime)s:%(module)s:%(levelname)s:%(message)s [line %(lineno)d]'
-    logging.basicConfig(level=log_level, format=log_format)
+    return script_main(args, 'instrument-streams', _ref_des_argv(args))
 
-    # Environment
-    # UFrame instance
-    uframe_base_url = args.base_url or os.getenv('UFRAME_BASE_URL')
-    if not uframe_base_url:
-        logging.error('No base_url set/found')
-        return 1
 
-    client = UFrameClient(uframe_base_url, timeout=args.timeout, m2m=args.direct)
-    instruments = client.search_instruments(args.ref_des)
-    if not instruments:
-        return 0
+def _ref_des_argv(args):
+    """Return the reference designator, input file and workers subcommand arguments"""
 
-    all_streams = []
-    for instrument in instruments:
-        streams = client.fetch_instrument_streams(instrument)
-        if not streams:
-            continue
-        for s in streams:
-            s['reference_designator'] = instrument
+    argv = [args.ref_des] if args.ref_des else []
+    if args.input:
+        argv += ['-i', args.input]
 
-        all_streams = all_streams + streams
-
-    if args.csv:
-        if not all_streams:
-            return 0
-
-        csv_writer = csv.writer(sys.stdout)
-        cols = all_streams[0].keys()
-        csv_writer.writerow(cols)
-        for stream in all_streams:
-            csv_writer.writerow([stream[c] for c in cols])
-
-    else:
-        sys.stdout.write('{:s}\n'.format(json.dumps(all_streams, sort_keys=True, indent=4)))
-
-    return 0
+    return argv + ['-w', str(args.workers)]
 
 
 if __name__ == '__main__':
@@ -62,9 +28,19 @@ if __name__ == '__main__':
                                          formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
     arg_parser.add_argument('ref_des',
+                            nargs='?',
                             type=str,
                             help='Limit streams to those produced by the fully or partially-qualified instrument reference designator')
 
+    arg_parser.add_argument('-i', '--input',
+                            type=str,
+                            help='File containing one partially or fully-qualified reference designator per line, or - to read them from stdin.  Results are printed per input')
+
+    arg_parser.add_argument('-w', '--workers',
+                            type=int,
+                            default=4,
+                            help='Number of concurrent requests')
+
     arg_parser.add_argument('-b', '--baseurl',
                             dest='base_url',
                             type=str,
@@ -85,6 +61,10 @@ if __name__ == '__main__':
                             help='Print results as csv records',
                             action='store_true')
 
+    arg_parser.add_argument('--ndjson',
+                            help='Print each result as a single line of JSON as soon as it is fetched',
+                            action='store_true')
+
     arg_parser.add_argument('-d', '--direct',
                             action='store_false',
                             help='Send requests directly to UFrame, not via m2m (Not recommended)')
@@ -1,49 +1,19 @@
 #!/usr/bin/env python
 
-import os
 import sys
 import argparse
-import logging
-import json
-import csv
-from m2m.UFrameClient import UFrameClient
+from m2m.cli import script_main
 
 
 def main(args):
     """Return all instruments registered on the UFrame system as fully qualified reference designators. Results are
     printed as valid JSON"""
 
-    # Set up logging
-    log_level = getattr(logging, args.loglevel.upper())
-    log_format = '%(module)s:%(levelname)s:%(message)s [line %(lineno)d]'
-    logging.basicConfig(format=log_format, level=log_level)
+    argv = [args.ref_des] if args.ref_des else []
+    if args.input:
+        argv += ['-i', args.input]
 
-    # Environment
-    # UFrame instance
-    uframe_base_url = args.base_url or os.getenv('UFRAME_BASE_URL')
-    if not uframe_base_url:
-        logging.error('No base_url set/found')
-        return 1
-
-    client = UFrameClient(uframe_base_url, timeout=args.timeout, m2m=args.direct)
-    if args.ref_des:
-        instruments = client.search_instruments(args.ref_des)
-    else:
-        instruments = client.instruments
-
-    if args.csv:
-        if not instruments:
-            return 0
-
-        csv_writer = csv.writer(sys.stdout)
-        csv_writer.writerow(['reference_designator'])
-        for instrument in instruments:
-            csv_writer.writerow([instrument])
-
-    else:
-        sys.stdout.write('{:s}\n'.format(json.dumps(instruments, sort_keys=True, indent=4)))
-
-    return 0
+    return script_main(args, 'instruments', argv)
 
 
 if __name__ == '__main__':
@@ -55,6 +25,10 @@ if __name__ == '__main__':
                             type=str,
                             help='Fully or partially-qualified reference designator to filter instruments')
 
+    arg_parser.add_argument('-i', '--input',
+                            type=str,
+                            help='File containing one partially or fully-qualified reference designator per line, or - to read them from stdin.  Results are printed per input')
+
     arg_parser.add_argument('-b', '--baseurl',
                             dest='base_url',
                             type=str,
@@ -75,6 +49,10 @@ if __name__ == '__main__':
                             help='Print results as csv records',
                             action='store_true')
 
+    arg_parser.add_argument('--ndjson',
+                            help='Print each result as a single line of JSON as soon as it is fetched',
+                            action='store_true')
+
     arg_parser.add_argument('-d', '--direct',
                             action='store_false',
                             help='Send requests directly to UFrame, not via m2m (Not recommended)')
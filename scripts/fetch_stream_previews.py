@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import sys
+import argparse
+from m2m.cli import script_main
+
+
+def main(args):
+    """Fetch decimated quick-look previews of the streams produced by the partially or fully-qualified reference
+    designator (Default is all instruments).  Each preview contains at most --limit particles spread over the stream
+    time range and lists the values of each numeric parameter.  Previews are cached in --cache_dir, if specified.  Use
+    --csv to print only the preview summaries"""
+
+    argv = [args.ref_des] if args.ref_des else []
+    for option in ['stream', 'telemetry', 'start_date', 'end_date', 'cache_dir']:
+        if getattr(args, option):
+            argv += ['--{:s}'.format(option), getattr(args, option)]
+    for parameter in args.parameter or []:
+        argv += ['-p', parameter]
+    if args.dpa:
+        argv.append('--dpa')
+
+    return script_main(args, 'preview', argv + ['-n', str(args.limit), '-w', str(args.workers)])
+
+
+if __name__ == '__main__':
+
+    arg_parser = argparse.ArgumentParser(description=main.__doc__,
+                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    arg_parser.add_argument('ref_des',
+                            nargs='?',
+                            type=str,
+                            help='Partial or fully-qualified reference designator identifying one or more instruments')
+
+    arg_parser.add_argument('--stream',
+                            type=str,
+                            help='Restrict previews to streams containing this name')
+
+    arg_parser.add_argument('--telemetry',
+                            type=str,
+                            help='Restrict previews to the specified telemetry type')
+
+    arg_parser.add_argument('-s', '--start_date',
+                            type=str,
+                            help='ISO-8601 preview start time.  The stream beginTime if not specified')
+
+    arg_parser.add_argument('-e', '--end_date',
+                            type=str,
+                            help='ISO-8601 preview end time.  The stream endTime if not specified')
+
+    arg_parser.add_argument('-p', '--parameter',
+                            type=str,
+                            action='append',
+                            help='Only preview this parameter name or pdId.  May be specified more than once')
+
+    arg_parser.add_argument('-n', '--limit',
+                            type=int,
+                            default=1000,
+                            help='Maximum number of particles in each preview (1 - 10000)')
+
+    arg_parser.add_argument('--dpa',
+                            action='store_true',
+                            help='Execute the data product algorithms to preview L1/L2 parameters')
+
+    arg_parser.add_argument('--cache_dir',
+                            type=str,
+                            help='Directory in which previews are cached')
+
+    arg_parser.add_argument('-w', '--workers',
+                            type=int,
+                            default=8,
+                            help='Number of concurrent requests')
+
+    arg_parser.add_argument('--csv',
+                            help='Print the preview summaries as csv records',
+                            action='store_true')
+
+    arg_parser.add_argument('--ndjson',
+                            help='Print each preview as a single line of JSON as soon as it is fetched',
+                            action='store_true')
+
+    arg_parser.add_argument('-b', '--baseurl',
+                            dest='base_url',
+                            type=str,
+                            help='UFrame base url beginning with http(s).  Taken from UFRAME_BASE_URL if not specified')
+
+    arg_parser.add_argument('-t', '--timeout',
+                            type=int,
+                            default=30,
+                            help='Request timeout, in seconds')
+
+    arg_parser.add_argument('-l', '--loglevel',
+                            help='Verbosity level',
+                            type=str,
+                            choices=['debug', 'info', 'warning', 'error', 'critical'],
+                            default='info')
+
+    arg_parser.add_argument('-d', '--direct',
+                            action='store_false',
+                            help='Send requests directly to UFrame, not via m2m (Not recommended)')
+
+    parsed_args = arg_parser.parse_args()
+
+    sys.exit(main(parsed_args))
@@ -1,45 +1,14 @@
 #!/usr/bin/env python
 
-import os
 import sys
 import argparse
-import logging
-import json
-import csv
-from m2m.UFrameClient import UFrameClient
+from m2m.cli import script_main
 
 
 def main(args):
     """Fetch all streams contained in UFrame"""
 
-    # Set up logging
-    log_level = getattr(logging, args.loglevel.upper())
-    log_format = '%(module)s:%(levelname)s:%(message)s [line %(lineno)d]'
-    logging.basicConfig(format=log_format, level=log_level)
-
-    # Environment
-    # UFrame instance
-    uframe_base_url = args.base_url or os.getenv('UFRAME_BASE_URL')
-    if not uframe_base_url:
-        logging.error('No base_url set/found')
-        return 1
-
-    client = UFrameClient(uframe_base_url, timeout=args.timeout, m2m=args.direct)
-    streams = client.streams
-
-    if args.csv:
-        if not streams:
-            return 0
-
-        csv_writer = csv.writer(sys.stdout)
-        csv_writer.writerow(['stream_name'])
-        for stream in streams:
-            csv_writer.writerow([stream])
-
-    else:
-        sys.stdout.write('{:s}\n'.format(json.dumps(streams, sort_keys=True, indent=4)))
-
-    return 0
+    return script_main(args, 'streams')
 
 
 if __name__ == '__main__':
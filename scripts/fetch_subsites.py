@@ -1,53 +1,18 @@
 #!/usr/bin/env python
 
-import os
 import sys
 import argparse
-import logging
-import json
-import csv
-from m2m.UFrameClient import UFrameClient
-# Disables SSL warnings
-import requests.packages.urllib3
+from m2m.cli import script_main
 
 
 def main(args):
     """Fetch all registered subsites from UFrame and print as valid JSON"""
 
-    # Set up logging
-    log_level = getattr(logging, args.loglevel.upper())
-    log_format = '%(module)s:%(levelname)s:%(message)s [line %(lineno)d]'
-    logging.basicConfig(format=log_format, level=log_level)
-
-    # Environment
-    # UFrame instance
-    uframe_base_url = args.base_url or os.getenv('UFRAME_BASE_URL')
-    if not uframe_base_url:
-        logging.error('No base_url set/found')
-        return 1
-
-    client = UFrameClient(uframe_base_url, timeout=args.timeout, m2m=args.direct)
-    if args.inventory == 'sensor':
-        subsites = client.fetch_subsites()
-    else:
-        subsites = client.fetch_deployment_subsites()
-
+    argv = ['--inventory', args.inventory]
     if args.subsite:
-        subsites = [s for s in subsites if s.find(args.subsite) > -1]
-
-    if args.csv:
-        if not subsites:
-            return 0
-
-        csv_writer = csv.writer(sys.stdout)
-        csv_writer.writerow(['subsite'])
-        for subsite in subsites:
-            csv_writer.writerow([subsite])
-
-    else:
-        sys.stdout.write('{:s}\n'.format(json.dumps(subsites, sort_keys=True, indent=4)))
+        argv.append(args.subsite)
 
-    return 0
+    return script_main(args, 'subsites', argv)
 
 
 if __name__ == '__main__':
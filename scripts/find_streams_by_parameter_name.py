@@ -1,117 +1,23 @@
 #!/usr/bin/env python
 
-import os
 import sys
 import argparse
-import logging
-import json
-import csv
-import copy
-from m2m.UFrameClient import UFrameClient
+from m2m.cli import script_main
 
 
 def main(args):
     """Search for instruments that produce a stream containing the parameter names that contain one or more
     parameter_search_terms"""
 
-    # Translate the logging level string to numeric value
-    log_level = getattr(logging, args.loglevel.upper())
-    log_format = '%(asctime)s:%(module)s:%(levelname)s:%(message)s [line %(lineno)d]'
-    logging.basicConfig(level=log_level, format=log_format)
-
-    uframe_base_url = args.base_url or os.getenv('UFRAME_BASE_URL')
-    m2m = args.direct
-    timeout = args.timeout
-    ooi_array = args.ooi_array
-    ref_des_term = args.ref_des_term
-    search_terms = args.parameter_search_terms
-    telemetry = args.telemetry
-    client = UFrameClient(uframe_base_url, timeout=timeout, m2m=m2m)
-
-    # UFrameClient instance
-    client = UFrameClient(uframe_base_url, timeout=args.timeout, m2m=args.direct)
-    if not client.base_url:
-        return 1
-
-    # Get the table of contents
-    toc = client.toc
-    # Get the particle_key (parameter name)
-    parameters = []
-    for term in search_terms:
-        found_pd_ids = [{'pdId': p['pdId'], 'particle_key': p['particle_key']} for p in toc['parameter_definitions'] if
-                        p['particle_key'].find(term) > -1]
-        if not found_pd_ids:
-            continue
-
-        parameters = parameters + found_pd_ids
-
-    # Unique list of pd ids
-    pd_ids = list(set([p['pdId'] for p in parameters]))
-
-    target_streams = []
-    for pd_id in pd_ids:
-        pd_id_streams = [k for k in toc['parameters_by_stream'] if pd_id in toc['parameters_by_stream'][k]]
-        if not pd_id_streams:
-            continue
-        target_streams = target_streams + pd_id_streams
-
-    # Unique list of streams that have at least one pd id in them
-    target_streams = list(set(target_streams))
-    target_streams.sort()
-
-    # Loop through toc['instruments'] to see if it produces one or more stream
-    parameter_instruments = []
-    found_instruments = []
-    for instrument in toc['instruments']:
-
-        if ooi_array and not instrument['reference_designator'].startswith(ooi_array.upper()):
-            continue
-
-        if ref_des_term and instrument['reference_designator'].find(ref_des_term.upper()) == -1:
-            continue
-
-        instrument_streams = [s['stream'] for s in instrument['streams']]
-        for instrument_stream in instrument_streams:
-            if instrument_stream not in target_streams:
-                continue
-
-            if instrument['reference_designator'] not in found_instruments:
-                instrument_metadata = copy.copy(instrument)
-                instrument_metadata['streams'] = []
-                parameter_instruments.append(instrument_metadata)
-                found_instruments.append(instrument_metadata['reference_designator'])
-
-            instrument_i = found_instruments.index(instrument_metadata['reference_designator'])
-
-            if instrument_stream in [s['stream'] for s in parameter_instruments[instrument_i]['streams']]:
-                continue
-
-            stream_i = instrument_streams.index(instrument_stream)
-            if telemetry and instrument['streams'][stream_i]['method'] != telemetry:
-                continue
-
-            parameter_instruments[instrument_i]['streams'].append(instrument['streams'][stream_i])
-
-    if args.csv:
-        if not parameter_instruments:
-            return 0
-
-        csv_writer = csv.writer(sys.stdout)
-        cols = ['stream',
-                'method',
-                'beginTime',
-                'endTime',
-                'count']
-        csv_writer.writerow(['reference_designator'] + cols)
-        for instrument in parameter_instruments:
-            for stream in instrument['streams']:
-                stream_cols = [instrument['reference_designator']] + [stream[c] for c in cols]
-                csv_writer.writerow(stream_cols)
-
-    else:
-        sys.stdout.write('{:s}\n'.format(json.dumps(parameter_instruments, sort_keys=True, indent=4)))
-
-    return 0
+    argv = list(args.parameter_search_terms)
+    if args.ooi_array:
+        argv += ['-a', args.ooi_array]
+    if args.ref_des_term:
+        argv += ['-r', args.ref_des_term]
+    if args.telemetry:
+        argv += ['--method', args.telemetry]
+
+    return script_main(args, 'find-params', argv)
 
 
 if __name__ == '__main__':
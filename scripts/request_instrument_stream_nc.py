@@ -4,117 +4,45 @@ import os
 import sys
 import argparse
 import logging
-import json
-import csv
-import re
-import datetime
-import requests
-from m2m.UFrameClient import UFrameClient
-import urllib
+from m2m.cli import script_main
 
 
 def main(args):
     """Send a single NetCDF request for the specified stream produced by the specified instrument (ref_des). The request
     response is written to the current working directory as valid JSON"""
 
-    # Set up logging
-    logger = logging.getLogger(__name__)
-    log_level = getattr(logging, args.loglevel.upper())
-    log_format = '%(module)s:%(levelname)s:%(message)s [line %(lineno)d]'
-    logging.basicConfig(format=log_format, level=log_level)
-
-    args.outputdir = args.outputdir or os.curdir
-
-    uframe_base_url = args.base_url or os.getenv('UFRAME_BASE_URL')
-    if not uframe_base_url:
-        logging.error('No base_url set/found')
-        return 1
-
-    user = 'anonymous'
-
-    client = UFrameClient(uframe_base_url, timeout=args.timeout, m2m=args.direct)
-
-    # Make sure the reference designator is valid
-    if args.ref_des not in client.instruments:
-        logger.warning('Reference designator not found: {:s}'.format(args.ref_des))
-        return 1
-
-    # Fetch the streams produced by the instrument
-    stream_metadata = client.fetch_instrument_streams(args.ref_des)
-    if args.stream not in [s['stream'] for s in stream_metadata]:
-        logger.warning('{:s} does not produce the specified stream: {:s}'.format(args.ref_des, args.stream))
+    if args.input:
+        argv = ['-i', args.input]
+    elif args.ref_des and args.stream:
+        argv = [args.ref_des, '--stream', args.stream]
+    else:
+        logging.error('No reference designator and stream specified')
         return 1
 
-    urls = client.instrument_to_query(args.ref_des,
-                                      user,
-                                      stream=args.stream,
-                                      time_delta_type=args.time_delta_type,
-                                      time_delta_value=args.time_delta_value,
-                                      begin_ts=args.start_date,
-                                      end_ts=args.end_date,
-                                      exec_dpa=args.no_dpa,
-                                      provenance=args.no_provenance)
-
-    if not urls:
-        logging.warning('No valid NetCDF requests created for {:s}-{:s}'.format(args.ref_des, args.stream))
-
-    # Dump the GET request only if args.printurl
-    if args.printurl:
-        if not args.raw:
-            urls = [urllib.quote(u) for u in urls]
-        if args.csv:
-            for url in urls:
-                sys.stdout.write('{:s}\n'.format(url))
+    for option in ['start_date', 'end_date', 'time_delta_type', 'email', 'catalog']:
+        if getattr(args, option):
+            argv += ['--{:s}'.format(option), getattr(args, option)]
+    if args.time_delta_value is not None:
+        argv += ['--time_delta_value', str(args.time_delta_value)]
+    for parameter in args.parameter or []:
+        argv += ['-p', parameter]
+    if args.by_deployment:
+        argv.append('--by_deployment')
+    if not args.no_dpa:
+        argv.append('--no_dpa')
+    if not args.no_provenance:
+        argv.append('--no_provenance')
+    argv += ['-w', str(args.workers)]
+
+    # Unless only the urls are printed, send the requests via the request queue or directly,
+    # writing the responses to outputdir
+    if not args.printurl:
+        if args.queue:
+            argv += ['--send', '--queue', args.queue]
         else:
-            sys.stdout.write('{:s}\n'.format(json.dumps(urls)))
-        return 0
+            argv += ['-o', args.outputdir or os.curdir]
 
-    url = urls[0]
-    req = {u'url': url,
-           u'status_code': None,
-           u'response': None,
-           u'response_file': None}
-
-    if not os.path.isdir(args.outputdir):
-        logger.warning('Invalid response outputdir specified: {:s}'.format(args.outputdir))
-        return 1
-    args.outputdir = os.path.realpath(args.outputdir)
-
-    # Create the request response file name
-    response_path = '{:s}-{:s}-{:s}.request.json'.format(args.ref_des, args.stream,
-                                                         datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S.%sZ'))
-    req['response_file'] = os.path.join(args.outputdir, response_path)
-
-    # Send the request
-    logging.debug('Sending GET request: {:s}'.format(url))
-    try:
-        logging.debug('Sending request: {:s}'.format(url))
-        r = requests.get(url, verify=False)
-    except (requests.exceptions.MissingSchema, requests.exceptions.ConnectionError) as e:
-        logging.error('{:}: {:s}'.format(e, url))
-        return 1
-
-    req['status_code'] = r.status_code
-
-    if r.status_code != 200:
-        logging.error('Request {:s} failed ({:})'.format(url, r.reason))
-        req['response'] = r.text
-
-    try:
-        req['response'] = r.json()
-    except ValueError as e:
-        logging.warning('{:} ({:s})'.format(e, url))
-        req['response'] = r.text
-
-    try:
-        with open(req['response_file'], 'w') as fid:
-            json.dump(req, fid, indent=4, sort_keys=True)
-            sys.stdout.write('{:s}\n'.format(req['response_file']))
-    except IOError as e:
-        logging.error('Error writing response file ({:}): {:s}'.format(e, req['response_file']))
-        return 1
-
-    return 0
+    return script_main(args, 'request', argv)
 
 
 if __name__ == '__main__':
@@ -122,13 +50,19 @@ if __name__ == '__main__':
                                          formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
     arg_parser.add_argument('ref_des',
+                            nargs='?',
                             type=str,
                             help='Fully-qualified reference designator identifying an instrument')
 
     arg_parser.add_argument('stream',
+                            nargs='?',
                             type=str,
                             help='Stream name')
 
+    arg_parser.add_argument('-i', '--input',
+                            type=str,
+                            help='File containing one fully-qualified reference designator and stream name, separated by whitespace or a comma, per line, or - to read them from stdin')
+
     arg_parser.add_argument('--outputdir',
                             type=str,
                             help='Write the UFrame JSON response to outputdir')
@@ -139,7 +73,7 @@ if __name__ == '__main__':
 
     arg_parser.add_argument('-r', '--raw',
                             action='store_true',
-                            help='Request urls are escaped by default, preventing shell interference when sending them from the command line.  This option disables this behavior')
+                            help='Ignored.  Request urls are printed unescaped')
 
     arg_parser.add_argument('--csv',
                             help='Print results as csv records',
@@ -174,6 +108,28 @@ if __name__ == '__main__':
                             default=True,
                             help='Include provenance information in the data sets')
 
+    arg_parser.add_argument('--parameter',
+                            type=str,
+                            action='append',
+                            help='Only request this parameter name or pdId.  May be specified more than once')
+
+    arg_parser.add_argument('--by_deployment',
+                            action='store_true',
+                            help='Create one request per deployment, skipping the gaps between deployments')
+
+    arg_parser.add_argument('--catalog',
+                            type=str,
+                            help='Local data catalog database.  Only request time windows not already downloaded')
+
+    arg_parser.add_argument('--queue',
+                            type=str,
+                            help='Send the requests via the durable request queue database, resuming any interrupted batch')
+
+    arg_parser.add_argument('-w', '--workers',
+                            type=int,
+                            default=4,
+                            help='Number of concurrent queue workers')
+
     arg_parser.add_argument('-b', '--baseurl',
                             dest='base_url',
                             type=str,
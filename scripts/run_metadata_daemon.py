@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import sys
+import argparse
+from m2m.cli import script_main
+from m2m.MetadataDaemon import DEFAULT_SOCKET
+
+
+def main(args):
+    """Run a local daemon holding a warm UFrame client, table of contents inventory and response caches.  Scripts
+    connect to the daemon over the Unix socket when it is running and create their own client otherwise"""
+
+    argv = ['--cache_ttl', str(args.cache_ttl)]
+    if args.refresh_interval:
+        argv += ['--refresh_interval', str(args.refresh_interval)]
+
+    return script_main(args, 'daemon', argv)
+
+
+if __name__ == '__main__':
+
+    arg_parser = argparse.ArgumentParser(description=main.__doc__,
+                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    arg_parser.add_argument('-s', '--socket',
+                            type=str,
+                            default=DEFAULT_SOCKET,
+                            help='Unix socket path.  Taken from M2M_DAEMON_SOCKET if set')
+
+    arg_parser.add_argument('--cache_ttl',
+                            type=int,
+                            default=600,
+                            help='Number of seconds instrument metadata and deployment responses are cached')
+
+    arg_parser.add_argument('--refresh_interval',
+                            type=int,
+                            help='Refresh the table of contents every refresh_interval seconds')
+
+    arg_parser.add_argument('-b', '--baseurl',
+                            dest='base_url',
+                            type=str,
+                            help='UFrame base url beginning with http(s).  Taken from UFRAME_BASE_URL if not specified')
+
+    arg_parser.add_argument('-t', '--timeout',
+                            type=int,
+                            default=30,
+                            help='Request timeout, in seconds')
+
+    arg_parser.add_argument('-l', '--loglevel',
+                            help='Verbosity level',
+                            type=str,
+                            choices=['debug', 'info', 'warning', 'error', 'critical'],
+                            default='info')
+
+    arg_parser.add_argument('-d', '--direct',
+                            action='store_false',
+                            help='Send requests directly to UFrame, not via m2m (Not recommended)')
+
+    parsed_args = arg_parser.parse_args()
+
+    sys.exit(main(parsed_args))
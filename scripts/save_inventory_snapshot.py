@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import sys
+import argparse
+from m2m.cli import script_main
+
+
+def main(args):
+    """Save the UFrame table of contents and the stream times, parameters and deployment events of all instruments to a
+    SQLite inventory snapshot, which may be queried with SQL or used to answer metadata requests offline.  Use --crawl to
+    load a snapshot file created by crawl_inventory.py instead of fetching the metadata"""
+
+    argv = [args.db_path]
+    if args.ref_des:
+        argv.append(args.ref_des)
+    if args.crawl:
+        argv += ['-c', args.crawl]
+
+    return script_main(args, 'snapshot', argv + ['-w', str(args.workers)])
+
+
+if __name__ == '__main__':
+
+    arg_parser = argparse.ArgumentParser(description=main.__doc__,
+                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    arg_parser.add_argument('db_path',
+                            type=str,
+                            help='SQLite snapshot database, which is created if it does not exist')
+
+    arg_parser.add_argument('ref_des',
+                            nargs='?',
+                            type=str,
+                            default='',
+                            help='Only save the metadata of instruments matching this partial or fully-qualified reference designator')
+
+    arg_parser.add_argument('-c', '--crawl',
+                            type=str,
+                            help='Load the snapshot file created by crawl_inventory.py instead of fetching the metadata')
+
+    arg_parser.add_argument('-w', '--workers',
+                            type=int,
+                            default=4,
+                            help='Number of concurrent requests')
+
+    arg_parser.add_argument('-b', '--baseurl',
+                            dest='base_url',
+                            type=str,
+                            help='UFrame base url beginning with http(s).  Taken from UFRAME_BASE_URL if not specified')
+
+    arg_parser.add_argument('-t', '--timeout',
+                            type=int,
+                            default=30,
+                            help='Request timeout, in seconds')
+
+    arg_parser.add_argument('-l', '--loglevel',
+                            help='Verbosity level',
+                            type=str,
+                            choices=['debug', 'info', 'warning', 'error', 'critical'],
+                            default='info')
+
+    arg_parser.add_argument('-d', '--direct',
+                            action='store_false',
+                            help='Send requests directly to UFrame, not via m2m (Not recommended)')
+
+    parsed_args = arg_parser.parse_args()
+
+    sys.exit(main(parsed_args))
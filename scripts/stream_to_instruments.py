@@ -1,49 +1,23 @@
 #!/usr/bin/env python
 
-import os
 import sys
 import argparse
 import logging
-import json
-import csv
-from m2m.UFrameClient import UFrameClient
-# Disables SSL warnings
-import requests.packages.urllib3
-
-requests.packages.urllib3.disable_warnings()
+from m2m.cli import script_main
 
 
 def main(args):
     """Return all instruments producing the specified full or partial stream name and print as valid JSON"""
 
-    # Set up logging
-    log_level = getattr(logging, args.loglevel.upper())
-    log_format = '%(module)s:%(levelname)s:%(message)s [line %(lineno)d]'
-    logging.basicConfig(format=log_format, level=log_level)
-
-    # Environment
-    # UFrame instance
-    uframe_base_url = args.base_url or os.getenv('UFRAME_BASE_URL')
-    if not uframe_base_url:
-        logging.error('No base_url set/found')
+    if not args.stream and not args.input:
+        logging.error('No stream specified')
         return 1
 
-    client = UFrameClient(uframe_base_url, timeout=args.timeout, m2m=args.direct)
-    instruments = client.stream_to_instruments(args.stream)
-
-    if args.csv:
-        if not instruments:
-            return 0
-
-        csv_writer = csv.writer(sys.stdout)
-        csv_writer.writerow(['reference_designator', 'stream'])
-        for instrument in instruments:
-            csv_writer.writerow([instrument['instrument'], instrument['stream']])
-
-    else:
-        sys.stdout.write('{:s}\n'.format(json.dumps(instruments, sort_keys=True, indent=4)))
+    argv = [args.stream] if args.stream else []
+    if args.input:
+        argv += ['-i', args.input]
 
-    return 0
+    return script_main(args, 'streams', argv)
 
 
 if __name__ == '__main__':
@@ -52,9 +26,14 @@ if __name__ == '__main__':
                                          formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
     arg_parser.add_argument('stream',
+                            nargs='?',
                             type=str,
                             help='full or partial stream name')
 
+    arg_parser.add_argument('-i', '--input',
+                            type=str,
+                            help='File containing one full or partial stream name per line, or - to read them from stdin.  Results are printed per input')
+
     arg_parser.add_argument('-b', '--baseurl',
                             dest='base_url',
                             type=str,
@@ -75,6 +54,10 @@ if __name__ == '__main__':
                             help='Print results as csv records',
                             action='store_true')
 
+    arg_parser.add_argument('--ndjson',
+                            help='Print each result as a single line of JSON as soon as it is fetched',
+                            action='store_true')
+
     arg_parser.add_argument('-d', '--direct',
                             action='store_false',
                             help='Send requests directly to UFrame, not via m2m (Not recommended)')
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import sys
+import argparse
+from m2m.cli import script_main
+
+
+def main(args):
+    """Create NetCDF requests for the data that arrived in each stream produced by the partially or fully-qualified
+    reference designator since the last sync.  The end time of the last sync for each stream is stored in the state
+    file.  Request urls are printed as valid JSON"""
+
+    argv = [args.state_file]
+    if args.ref_des:
+        argv.append(args.ref_des)
+    if args.input:
+        argv += ['-i', args.input]
+    argv += ['-u', args.user]
+    if args.stream:
+        argv += ['--stream', args.stream]
+    if args.telemetry:
+        argv += ['--telemetry', args.telemetry]
+    for option in ['send', 'commit']:
+        if getattr(args, option):
+            argv.append('--{:s}'.format(option))
+    if not args.no_dpa:
+        argv.append('--no_dpa')
+    if not args.no_provenance:
+        argv.append('--no_provenance')
+
+    return script_main(args, 'sync', argv)
+
+
+if __name__ == '__main__':
+
+    arg_parser = argparse.ArgumentParser(description=main.__doc__,
+                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    arg_parser.add_argument('state_file',
+                            type=str,
+                            help='JSON file containing the end time of the last sync for each stream')
+
+    arg_parser.add_argument('ref_des',
+                            nargs='?',
+                            type=str,
+                            help='Fully or partially-qualified reference designator.  All instruments if not specified')
+
+    arg_parser.add_argument('-i', '--input',
+                            type=str,
+                            help='File containing one partially or fully-qualified reference designator per line, or - to read them from stdin.  Urls are printed per input')
+
+    arg_parser.add_argument('-u', '--user',
+                            type=str,
+                            default='anonymous',
+                            help='User name for the requests')
+
+    arg_parser.add_argument('--stream',
+                            type=str,
+                            help='Restrict urls to the specified stream name, if it is produced by the instrument')
+
+    arg_parser.add_argument('--telemetry',
+                            type=str,
+                            help='Restrict urls to the specified telemetry type')
+
+    arg_parser.add_argument('--send',
+                            action='store_true',
+                            help='Send the requests and advance the sync state for each successful request')
+
+    arg_parser.add_argument('--commit',
+                            action='store_true',
+                            help='Advance the sync state without sending the requests')
+
+    arg_parser.add_argument('--no_dpa',
+                            action='store_false',
+                            default=True,
+                            help='Execute all data product algorithms to return L1/L2 parameters')
+
+    arg_parser.add_argument('--no_provenance',
+                            action='store_false',
+                            default=True,
+                            help='Include provenance information in the data sets')
+
+    arg_parser.add_argument('-b', '--baseurl',
+                            dest='base_url',
+                            type=str,
+                            help='UFrame base url beginning with http(s).  Taken from UFRAME_BASE_URL if not specified')
+
+    arg_parser.add_argument('-t', '--timeout',
+                            type=int,
+                            default=30,
+                            help='Request timeout, in seconds')
+
+    arg_parser.add_argument('-l', '--loglevel',
+                            help='Verbosity level',
+                            type=str,
+                            choices=['debug', 'info', 'warning', 'error', 'critical'],
+                            default='info')
+
+    arg_parser.add_argument('-d', '--direct',
+                            action='store_false',
+                            help='Send requests directly to UFrame, not via m2m (Not recommended)')
+
+    parsed_args = arg_parser.parse_args()
+
+    sys.exit(main(parsed_args))
@@ -0,0 +1,107 @@
+import os
+import io
+import json
+import argparse
+from m2m.batch import read_inputs, script_inputs, fetch_by_input, write_ndjson, write_csv, write_batch
+
+INSTRUMENTS = ['CE02SHSM-RID26-07-NUTNRB000', 'CE02SHSM-RID27-03-CTDBPC000', 'GA01SUMO-RII11-02-CTDMOQ011']
+
+
+class FakeClient(object):
+    """Client without a bulk fetch path, which fetches each instrument in turn"""
+
+    def __init__(self):
+        self.fetched = []
+
+    def search_instruments(self, ref_des):
+        return [i for i in INSTRUMENTS if i.find(ref_des) > -1]
+
+    def fetch_instrument_streams(self, ref_des):
+        self.fetched.append(ref_des)
+        return [{'sensor': ref_des, 'stream': 'stream'}]
+
+
+def _input_file(tmpdir, lines):
+
+    path = os.path.join(str(tmpdir), 'inputs.txt')
+    with open(path, 'w') as fid:
+        fid.write('\n'.join(lines))
+
+    return path
+
+
+def test_read_inputs_skips_blank_lines_and_comments(tmpdir):
+
+    path = _input_file(tmpdir, ['# Endurance array', 'CE02SHSM', '', '   ', '  GA01SUMO  ', '#GA01'])
+
+    assert read_inputs(path) == ['CE02SHSM', 'GA01SUMO']
+
+
+def test_script_inputs(tmpdir):
+
+    path = _input_file(tmpdir, ['CE02SHSM', 'GA01SUMO'])
+
+    assert script_inputs(argparse.Namespace(input=path, ref_des='CP01'), 'ref_des') == ['CE02SHSM', 'GA01SUMO']
+    assert script_inputs(argparse.Namespace(input=None, ref_des='CP01'), 'ref_des') == ['CP01']
+    assert script_inputs(argparse.Namespace(input=None, ref_des=None), 'ref_des') == []
+
+
+def test_fetch_by_input():
+
+    client = FakeClient()
+
+    results = [(i, [ref_des for ref_des, streams in responses])
+               for i, responses in fetch_by_input(client, 'streams', ['CE02SHSM', 'CP01', 'CTD'])]
+
+    assert results == [('CE02SHSM', INSTRUMENTS[:2]), ('CP01', []), ('CTD', INSTRUMENTS[1:])]
+    assert client.fetched == INSTRUMENTS[:2] + INSTRUMENTS[1:]
+
+
+RESULTS = [('CE02SHSM', [{'reference_designator': INSTRUMENTS[0], 'stream': 'nutnr_b_dcl_conc_instrument'},
+                         {'reference_designator': INSTRUMENTS[1], 'stream': 'ctdbp_cdef_dcl_instrument'}]),
+           ('CP01', []),
+           ('GA01', [{'reference_designator': INSTRUMENTS[2], 'stream': 'ctdmo_ghqr_instrument_recovered'}])]
+
+
+def test_write_ndjson_from_generator():
+
+    fid = io.StringIO()
+
+    assert write_ndjson((r for i, records in RESULTS for r in records), fid=fid) == 3
+    assert [json.loads(line) for line in fid.getvalue().splitlines()] == RESULTS[0][1] + RESULTS[2][1]
+
+
+def test_write_csv():
+
+    fid = io.StringIO()
+
+    assert write_csv(iter(RESULTS[0][1]), cols=['stream', 'reference_designator'], fid=fid) == 2
+    assert fid.getvalue().splitlines() == ['stream,reference_designator',
+                                           'nutnr_b_dcl_conc_instrument,{:s}'.format(INSTRUMENTS[0]),
+                                           'ctdbp_cdef_dcl_instrument,{:s}'.format(INSTRUMENTS[1])]
+
+
+def test_write_csv_values_and_no_records():
+
+    fid = io.StringIO()
+    assert write_csv(iter(INSTRUMENTS[:2]), header='instruments', fid=fid) == 2
+    assert fid.getvalue().splitlines() == ['instruments'] + INSTRUMENTS[:2]
+
+    fid = io.StringIO()
+    assert write_csv(iter([]), fid=fid) == 0
+    assert fid.getvalue() == ''
+
+
+def test_write_batch():
+
+    fid = io.StringIO()
+    write_batch(iter(RESULTS), batch=True, key='streams', fid=fid)
+    assert json.loads(fid.getvalue()) == [{'input': i, 'streams': records} for i, records in RESULTS]
+
+    fid = io.StringIO()
+    write_batch(iter(RESULTS), ndjson=True, fid=fid)
+    assert len(fid.getvalue().splitlines()) == 3
+
+    fid = io.StringIO()
+    write_batch(iter(RESULTS), fid=fid)
+    assert json.loads(fid.getvalue()) == RESULTS[0][1] + RESULTS[2][1]
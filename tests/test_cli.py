@@ -0,0 +1,44 @@
+import os
+import json
+import argparse
+from m2m import cli
+
+URL = ('https://ooinet.oceanobservatories.org/api/m2m/12576/sensor/inv/CE02SHSM/RID27/03-CTDBPC000/'
+       'telemetered/ctdbp_cdef_dcl_instrument?beginDT=2017-05-31T00:00:00.000Z&endDT=2017-06-01T00:00:00.000Z')
+
+
+class FakeClient(object):
+
+    def get(self, url):
+        return 200, 'OK', {'requestUUID': 'uuid'}
+
+
+def test_script_main_argv(monkeypatch):
+
+    monkeypatch.setattr(cli, 'main', lambda argv: argv)
+    args = argparse.Namespace(base_url='https://ooinet.oceanobservatories.org', timeout=30, loglevel='info',
+                              direct=False, csv=False, ndjson=True, ref_des='CE02')
+
+    assert cli.script_main(args, 'instruments', ['CE02']) == ['-b', 'https://ooinet.oceanobservatories.org',
+                                                              '-t', '30', '-l', 'info', '-d',
+                                                              'instruments', '--ndjson', 'CE02']
+    assert cli.script_main(argparse.Namespace(loglevel='info'), 'diff', ['a.db', 'b.db']) == \
+        ['-l', 'info', 'diff', 'a.db', 'b.db']
+
+
+def test_send_requests_writes_unique_response_files(tmpdir, capsys):
+
+    args = argparse.Namespace(outputdir=str(tmpdir), csv=True, ndjson=False)
+
+    assert cli._send_requests(args, FakeClient(), [URL, URL]) == 0
+
+    response_files = sorted(os.listdir(str(tmpdir)))
+    assert len(response_files) == 2
+    assert response_files[0].startswith('CE02SHSM-RID27-03-CTDBPC000-ctdbp_cdef_dcl_instrument-')
+    with open(os.path.join(str(tmpdir), response_files[0]), 'r') as fid:
+        request = json.load(fid)
+    assert request['url'] == URL
+    assert request['status_code'] == 200
+    assert request['response'] == {'requestUUID': 'uuid'}
+
+    assert capsys.readouterr().out.splitlines()[0] == 'url,status_code,response_file'
@@ -0,0 +1,44 @@
+from m2m.CoverageReport import instrument_coverage, sweep_overlaps
+from m2m.records import DeploymentRecord, StreamRecord
+
+DAY = 86400000
+NOW = 100 * DAY
+
+
+def test_sweep_overlaps():
+
+    overlaps = sweep_overlaps([(0, 10), (20, 30)], [(5, 25), (30, 40)])
+
+    assert overlaps == {(0, 0): 5, (1, 0): 5}
+
+
+def test_sweep_overlaps_skips_empty_and_reversed_intervals():
+
+    overlaps = sweep_overlaps([(0, 10), (8, 4)], [(5, 5), (2, 6), (9, 3)])
+
+    assert overlaps == {(0, 1): 4}
+
+
+def test_single_particle_stream():
+
+    deployments = [DeploymentRecord('CE02SHSM-RID27-03-CTDBPC000', 1, 10 * DAY, 20 * DAY, False)]
+    streams = [StreamRecord('CE02SHSM-RID27-03-CTDBPC000', 'telemetered', 'ctdbp', 1, 15 * DAY, 15 * DAY)]
+
+    records = instrument_coverage('CE02SHSM-RID27-03-CTDBPC000', deployments, streams, NOW)
+
+    assert len(records) == 1
+    assert records[0]['covered_ms'] == 0
+    assert records[0]['deployment_has_particles']
+
+
+def test_future_deployment():
+
+    deployments = [DeploymentRecord('CE02SHSM-RID27-03-CTDBPC000', 2, NOW + DAY, None, True)]
+    streams = [StreamRecord('CE02SHSM-RID27-03-CTDBPC000', 'telemetered', 'ctdbp', 10, 0, NOW)]
+
+    records = instrument_coverage('CE02SHSM-RID27-03-CTDBPC000', deployments, streams, NOW)
+
+    assert len(records) == 1
+    assert records[0]['covered_ms'] == 0
+    assert records[0]['coverage_percent'] == 0.0
+    assert not records[0]['deployment_has_particles']
@@ -0,0 +1,72 @@
+import os
+from m2m.DataCatalog import DataCatalog
+from m2m.timeutils import iso_to_ms
+
+REF_DES = 'CE02SHSM-RID27-03-CTDBPC000'
+METHOD = 'telemetered'
+STREAM = 'ctdbp_cdef_dcl_instrument'
+PREFIX = '{:s}-{:s}-{:s}'.format(REF_DES, METHOD, STREAM)
+
+# 15 minute sample interval: each file begins 15 minutes after the last particle of the previous file
+JAN = 'deployment0001_{:s}_20170101T000000-20170131T234500.nc'.format(PREFIX)
+FEB = 'deployment0001_{:s}_20170201T000000-20170228T234500.nc'.format(PREFIX)
+MAR = 'deployment0001_{:s}_20170301T000000-20170331T234500.nc'.format(PREFIX)
+
+
+def _catalog(tmpdir, names):
+
+    catalog = DataCatalog(os.path.join(str(tmpdir), 'catalog.db'))
+    for name in names:
+        path = os.path.join(str(tmpdir), name)
+        open(path, 'w').close()
+        assert catalog.register_file(path)
+
+    return catalog
+
+
+def _gaps(catalog, begin_ts, end_ts):
+
+    return catalog.gaps(REF_DES, METHOD, STREAM, begin_ts, end_ts)
+
+
+def test_gap_inside_deployment(tmpdir):
+
+    catalog = _catalog(tmpdir, [JAN, MAR])
+
+    gaps = _gaps(catalog, '2017-01-01T00:00:00Z', '2017-03-31T23:45:00Z')
+
+    assert gaps == [(iso_to_ms('2017-01-31T23:45:00Z'), iso_to_ms('2017-03-01T00:00:00Z'))]
+
+
+def test_file_spacing_within_stream_tolerance(tmpdir):
+
+    catalog = _catalog(tmpdir, [JAN, FEB])
+
+    assert _gaps(catalog, '2017-01-01T00:00:00Z', '2017-02-28T23:45:00Z') == \
+        [(iso_to_ms('2017-01-31T23:45:00Z'), iso_to_ms('2017-02-01T00:00:00Z'))]
+
+    catalog.set_tolerance(REF_DES, METHOD, STREAM, 900000)
+
+    assert _gaps(catalog, '2017-01-01T00:00:00Z', '2017-02-28T23:45:00Z') == []
+
+
+def test_requested_windows_cover_file_spacing(tmpdir):
+
+    catalog = _catalog(tmpdir, [JAN, FEB])
+    url = 'https://ooinet.oceanobservatories.org/api/m2m/12576/sensor/inv/CE02SHSM/RID27/03-CTDBPC000/telemetered/' \
+          'ctdbp_cdef_dcl_instrument?beginDT=2017-01-01T00:00:00.000000Z&endDT=2017-03-01T00:00:00.000000Z' \
+          '&format=application/netcdf'
+
+    assert catalog.register_request(url)
+
+    assert _gaps(catalog, '2017-01-01T00:00:00Z', '2017-03-31T00:00:00Z') == \
+        [(iso_to_ms('2017-03-01T00:00:00Z'), iso_to_ms('2017-03-31T00:00:00Z'))]
+
+
+def test_gap_between_deployments(tmpdir):
+
+    catalog = _catalog(tmpdir, [JAN, MAR.replace('deployment0001', 'deployment0002')])
+
+    gaps = _gaps(catalog, '2017-01-01T00:00:00Z', '2017-03-31T23:45:00Z')
+
+    assert gaps == [(iso_to_ms('2017-01-31T23:45:00Z'), iso_to_ms('2017-03-01T00:00:00Z'))]
@@ -0,0 +1,84 @@
+from m2m.UFrameClient import UFrameClient
+from m2m.deployments import deployment_windows
+from m2m.records import DeploymentRecord, StreamRecord
+from m2m.timeutils import iso_to_ms
+
+REF_DES = 'CE02SHSM-RID27-03-CTDBPC000'
+DAY = 86400000
+
+
+def _deployment(number, start_time, stop_time):
+    return DeploymentRecord(REF_DES, number, start_time, stop_time, not stop_time)
+
+
+def _event(number, start_time, stop_time):
+    return {'referenceDesignator': REF_DES,
+            'deploymentNumber': number,
+            'eventStartTime': start_time,
+            'eventStopTime': stop_time}
+
+
+def test_deployment_windows_are_clipped():
+
+    deployments = [_deployment(2, 20 * DAY, 30 * DAY), _deployment(1, DAY, 10 * DAY)]
+
+    assert deployment_windows(5 * DAY, 25 * DAY, deployments) == [(5 * DAY, 10 * DAY, 1), (20 * DAY, 25 * DAY, 2)]
+
+
+def test_deployment_windows_open_ended():
+
+    deployments = [_deployment(1, DAY, 10 * DAY), _deployment(2, 20 * DAY, None)]
+
+    assert deployment_windows(15 * DAY, 40 * DAY, deployments) == [(20 * DAY, 40 * DAY, 2)]
+
+
+def test_deployment_windows_skip_unknown_start_and_gaps():
+
+    deployments = [_deployment(1, None, 10 * DAY), _deployment(2, 20 * DAY, 30 * DAY)]
+
+    assert deployment_windows(0, 20 * DAY, deployments) == []
+    assert deployment_windows(12 * DAY, 18 * DAY, deployments) == []
+
+
+def _client(monkeypatch, deployments):
+
+    # No requests are sent
+    monkeypatch.setattr(UFrameClient, 'fetch_subsites', lambda self: [])
+    client = UFrameClient('https://ooinet.oceanobservatories.org')
+    streams = [StreamRecord(REF_DES, 'telemetered', 'ctdbp', 10, 0, 40 * DAY)]
+
+    monkeypatch.setattr(client, 'search_instruments', lambda ref_des: [REF_DES])
+    monkeypatch.setattr(client, 'fetch_bulk', lambda kind, instruments, **kwargs: [(REF_DES, deployments)])
+    monkeypatch.setattr(client, 'fetch_stream_records', lambda instruments, **kwargs: [(REF_DES, streams)])
+    monkeypatch.setattr(client, 'build_request', lambda port, end_point: end_point)
+
+    return client
+
+
+def _windows(urls):
+
+    windows = []
+    for url in urls:
+        query = dict([p.split('=', 1) for p in url.split('?', 1)[1].split('&')])
+        windows.append((iso_to_ms(query['beginDT']), iso_to_ms(query['endDT'])))
+
+    return windows
+
+
+def test_query_urls_split_by_deployment(monkeypatch):
+
+    deployments = [_event(1, DAY, 10 * DAY), _event(2, 20 * DAY, None)]
+    client = _client(monkeypatch, deployments)
+
+    urls = client.deployment_to_query(REF_DES, 'anonymous')
+
+    assert _windows(urls) == [(DAY, 10 * DAY), (20 * DAY, 40 * DAY + 1000)]
+
+
+def test_query_urls_not_split_if_deployments_request_fails(monkeypatch):
+
+    client = _client(monkeypatch, None)
+
+    urls = client.deployment_to_query(REF_DES, 'anonymous')
+
+    assert _windows(urls) == [(0, 40 * DAY + 1000)]
@@ -0,0 +1,95 @@
+from m2m.Inventory import Inventory
+
+REF_DES = 'CE02SHSM-RID27-03-CTDBPC000'
+
+
+def _stream(ref_des, method, stream, count=10, begin='2015-04-01T00:00:00.000Z', end='2016-10-01T00:00:00.000Z'):
+    return {'sensor': ref_des, 'method': method, 'stream': stream, 'count': count, 'beginTime': begin, 'endTime': end}
+
+
+def _toc(instruments):
+
+    return {'instruments': [{'reference_designator': ref_des,
+                             'platform_code': ref_des.split('-')[0],
+                             'mooring_code': ref_des.split('-')[1],
+                             'instrument_code': '-'.join(ref_des.split('-')[2:]),
+                             'streams': streams} for ref_des, streams in instruments],
+            'parameters_by_stream': {'ctdbp_cdef_dcl_instrument': ['PD7', 'PD193']},
+            'parameter_definitions': [{'pdId': 'PD7', 'particle_key': 'time'}]}
+
+
+def _inventory(toc):
+
+    inventory = Inventory()
+    for instrument in toc['instruments']:
+        inventory.add_instrument(instrument)
+    inventory.set_parameters(toc['parameters_by_stream'], toc['parameter_definitions'])
+
+    return inventory
+
+
+NUTNR = 'CE02SHSM-RID26-07-NUTNRB000'
+
+TOC = _toc([(REF_DES, [_stream(REF_DES, 'telemetered', 'ctdbp_cdef_dcl_instrument'),
+                       _stream(REF_DES, 'recovered_host', 'ctdbp_cdef_dcl_instrument_recovered')]),
+            (NUTNR, [_stream(NUTNR, 'telemetered', 'nutnr_b_dcl_conc_instrument')])])
+
+
+def test_to_toc_round_trip():
+
+    inventory = _inventory(TOC)
+    toc = inventory.to_toc()
+
+    assert sorted(toc['instruments'], key=lambda i: i['reference_designator']) == \
+        sorted(TOC['instruments'], key=lambda i: i['reference_designator'])
+    assert toc['parameters_by_stream'] == TOC['parameters_by_stream']
+    assert toc['parameter_definitions'] == TOC['parameter_definitions']
+    assert _inventory(toc).version == inventory.version
+
+
+def test_to_toc_is_cached_until_the_inventory_changes():
+
+    inventory = _inventory(TOC)
+    toc = inventory.to_toc()
+
+    assert inventory.to_toc() is toc
+
+    inventory.set_instrument_streams(NUTNR, [])
+
+    assert inventory.to_toc() is not toc
+    assert [i['reference_designator'] for i in inventory.to_toc()['instruments']] == [REF_DES]
+
+
+def test_update_applies_changes():
+
+    inventory = _inventory(TOC)
+    latest = _inventory(_toc([(REF_DES, [_stream(REF_DES, 'telemetered', 'ctdbp_cdef_dcl_instrument', count=20,
+                                                 end='2017-06-01T12:00:00.500Z'),
+                                         _stream(REF_DES, 'streamed', 'ctdbp_cdef_sample')])]))
+
+    changes = inventory.update(latest)
+
+    assert sorted([(c['event'], c['reference_designator'], c.get('stream')) for c in changes]) == [
+        ('instrument_removed', NUTNR, None),
+        ('stream_added', REF_DES, 'ctdbp_cdef_sample'),
+        ('stream_changed', REF_DES, 'ctdbp_cdef_dcl_instrument'),
+        ('stream_removed', NUTNR, 'nutnr_b_dcl_conc_instrument'),
+        ('stream_removed', REF_DES, 'ctdbp_cdef_dcl_instrument_recovered')]
+    changed = [c for c in changes if c['event'] == 'stream_changed'][0]
+    assert changed['old']['count'] == 10
+    assert changed['new'] == {'beginTime': '2015-04-01T00:00:00.000Z',
+                              'endTime': '2017-06-01T12:00:00.500Z',
+                              'count': 20}
+
+    assert inventory.instruments == [REF_DES]
+    assert inventory.version == latest.version
+    assert inventory.to_toc()['instruments'] == latest.to_toc()['instruments']
+
+
+def test_update_without_changes():
+
+    inventory = _inventory(TOC)
+    version = inventory.version
+
+    assert inventory.update(_inventory(TOC)) == []
+    assert inventory.version == version
@@ -0,0 +1,68 @@
+import json
+from m2m.jsonstream import _Reader, iter_array_items, iter_object_items
+from m2m.ParticleColumns import NTP_EPOCH_OFFSET, ParticleColumns
+
+PARTICLES = [{'time': NTP_EPOCH_OFFSET + 1.5, 'pressure': 12345, 'label': u'café', 'pk': {'deployment': 1}},
+             {'time': NTP_EPOCH_OFFSET + 2.5, 'pressure': -0.25e-3, 'label': None},
+             {'time': NTP_EPOCH_OFFSET + 3.5, 'label': u'☃', 'flag': True}]
+
+
+def _chunks(text, size):
+    """Split the utf-8 encoded text into chunks of size bytes, splitting multi-byte characters"""
+
+    data = text.encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_array_items_across_chunk_boundaries():
+
+    text = json.dumps(PARTICLES, ensure_ascii=False)
+
+    for size in range(1, len(text) + 1):
+        assert list(iter_array_items(_chunks(text, size))) == PARTICLES
+
+
+def test_numbers_split_across_chunks():
+
+    assert list(iter_array_items([b'[12', b'34, 5', b'.', b'25e', b'1, tr', b'ue]'])) == [1234, 52.5, True]
+
+
+def test_object_items_across_chunk_boundaries():
+
+    doc = {'instruments': PARTICLES, 'count': 3, 'name': u'café'}
+    text = json.dumps(doc, ensure_ascii=False)
+
+    for size in range(1, len(text) + 1):
+        items = list(iter_object_items(_chunks(text, size), ['instruments']))
+        assert [value for key, value in items if key == 'instruments'] == PARTICLES
+        assert dict([(key, value) for key, value in items if key != 'instruments']) == {'count': 3, 'name': u'café'}
+
+
+def test_large_value_is_not_decoded_for_every_chunk():
+
+    class CountingDecoder(json.JSONDecoder):
+        calls = 0
+
+        def raw_decode(self, s, idx=0):
+            CountingDecoder.calls += 1
+            return json.JSONDecoder.raw_decode(self, s, idx)
+
+    value = dict([('parameter{:d}'.format(i), i) for i in range(10000)])
+    chunks = _chunks(json.dumps(value), 64)
+
+    reader = _Reader(chunks)
+    assert reader.decode(CountingDecoder()) == value
+    assert len(chunks) > 2000
+    assert CountingDecoder.calls < 20
+
+
+def test_particle_columns_from_chunks():
+
+    columns = ParticleColumns().extend(iter_array_items(_chunks(json.dumps(PARTICLES), 7)))
+
+    assert len(columns) == 3
+    assert columns.parameters == ['flag', 'label', 'pressure', 'time']
+    assert list(columns.arrays()['time']) == [1.5, 2.5, 3.5]
+    assert list(columns.arrays()['pressure'])[:2] == [12345, -0.25e-3]
+    assert columns.arrays()['pressure'][2] != columns.arrays()['pressure'][2]
+    assert list(columns['label']) == [u'café', None, u'☃']
@@ -0,0 +1,73 @@
+import os
+import pytest
+from m2m.ParticleStore import ParticleStore
+
+np = pytest.importorskip('numpy')
+
+KEY = ('CE02SHSM-RID27-03-CTDBPC000', 'telemetered', 'ctdbp_cdef_dcl_instrument')
+
+
+def _write(store, times, begin_time, end_time, **columns):
+
+    particles = dict(columns)
+    particles['time'] = times
+
+    return store.write(*KEY, particles=particles, begin_time=begin_time, end_time=end_time)
+
+
+def test_append_later_particles(tmpdir):
+
+    store = ParticleStore(str(tmpdir))
+
+    assert _write(store, [1., 2.], 1000, 2001, temp=[10., 20.]) == 2
+    assert _write(store, [3., 4.], 2001, 4001, temp=[30., 40.], pressure=[3., 4.]) == 2
+
+    particles = store.read(*KEY)
+    assert store.count(*KEY) == 4
+    assert list(particles['time']) == [1., 2., 3., 4.]
+    assert list(particles['temp']) == [10., 20., 30., 40.]
+    assert np.isnan(particles['pressure'][:2]).all()
+    assert list(particles['pressure'][2:]) == [3., 4.]
+    assert store.coverage(*KEY) == [(1000, 4001)]
+
+
+def test_merge_overlapping_windows(tmpdir):
+
+    store = ParticleStore(str(tmpdir))
+
+    _write(store, [1., 3., 5.], 1000, 5000, temp=[10., 30., 50.])
+    _write(store, [2., 4., 6.], 2000, 6000, temp=[20., 40., 60.])
+
+    particles = store.read(*KEY)
+    assert list(particles['time']) == [1., 2., 3., 4., 5., 6.]
+    assert list(particles['temp']) == [10., 20., 30., 40., 50., 60.]
+    assert store.coverage(*KEY) == [(1000, 6000)]
+    assert list(store.read(*KEY, begin_time=2000, end_time=5000)['time']) == [2., 3., 4.]
+
+    # Only the current generation of column files is kept
+    stream_dir = os.path.join(str(tmpdir), *KEY)
+    assert sorted(os.listdir(stream_dir)) == ['meta.json', 'temp.1.f8', 'time.1.f8']
+
+
+def test_merge_drops_duplicate_boundary_particles(tmpdir):
+
+    store = ParticleStore(str(tmpdir))
+
+    _write(store, [1., 2., 3.], 1000, 3000, temp=[10., 20., 30.])
+    _write(store, [3., 4.], 3000, 4000, temp=[31., 40.])
+
+    particles = store.read(*KEY)
+    assert store.count(*KEY) == 4
+    assert list(particles['time']) == [1., 2., 3., 4.]
+    assert list(particles['temp']) == [10., 20., 31., 40.]
+
+
+def test_multidimensional_columns_are_skipped(tmpdir):
+
+    store = ParticleStore(str(tmpdir))
+
+    assert _write(store, [1., 2.], 1000, 2001, temp=[10., 20.], spectrum=[[1., 2., 3.], [4., 5., 6.]]) == 2
+
+    particles = store.read(*KEY)
+    assert sorted(particles.keys()) == ['temp', 'time']
+    assert list(particles['temp']) == [10., 20.]
@@ -0,0 +1,75 @@
+from m2m.UFrameClient import UFrameClient, stream_pd_ids
+
+REF_DES = 'CE02SHSM-RID27-03-CTDBPC000'
+
+PARAMETERS = [{'pdId': 'PD7', 'particleKey': 'time', 'stream': 'ctdbp_cdef_dcl_instrument'},
+              {'pdId': 'PD193', 'particleKey': 'pressure', 'stream': 'ctdbp_cdef_dcl_instrument'},
+              {'pdId': 'PD1959', 'particle_key': 'ctdbp_seawater_temperature', 'stream': 'ctdbp_cdef_dcl_instrument'},
+              {'pdId': 'PD7', 'particleKey': 'time', 'stream': 'ctdbp_cdef_dcl_instrument_recovered'}]
+
+STREAMS = [{'sensor': REF_DES, 'method': 'telemetered', 'stream': 'ctdbp_cdef_dcl_instrument', 'count': 10,
+            'beginTime': '2015-04-01T00:00:00.000Z', 'endTime': '2016-10-01T00:00:00.000Z'},
+           {'sensor': REF_DES, 'method': 'recovered_host', 'stream': 'ctdbp_cdef_dcl_instrument_recovered', 'count': 10,
+            'beginTime': '2015-04-01T00:00:00.000Z', 'endTime': '2016-10-01T00:00:00.000Z'}]
+
+
+def _client(monkeypatch):
+
+    # No requests are sent
+    monkeypatch.setattr(UFrameClient, 'fetch_subsites', lambda self: [])
+    client = UFrameClient('https://ooinet.oceanobservatories.org')
+
+    monkeypatch.setattr(client, 'search_instruments', lambda ref_des: [REF_DES])
+    monkeypatch.setattr(client, 'fetch_metadata_bundles',
+                        lambda instruments, **kwargs: [(REF_DES, {'times': STREAMS, 'parameters': PARAMETERS})])
+    monkeypatch.setattr(client, 'build_request', lambda port, end_point: end_point)
+
+    return client
+
+
+def test_stream_pd_ids_by_name_and_pd_id():
+
+    assert stream_pd_ids(['pressure', 'PD7', '1959', 7], PARAMETERS[:3]) == [7, 193, 1959]
+
+
+def test_stream_pd_ids_skips_unknown_parameters():
+
+    assert stream_pd_ids(['salinity', 'PD8', 'PDX'], PARAMETERS[:3]) == []
+    assert stream_pd_ids(['pressure', 'time'], PARAMETERS[3:]) == [7]
+
+
+def test_build_stream_query_parameters(monkeypatch):
+
+    client = _client(monkeypatch)
+
+    url = client.build_stream_query(REF_DES, 'telemetered', 'ctdbp_cdef_dcl_instrument', 'anonymous',
+                                    '2015-04-01T00:00:00.000Z', '2016-10-01T00:00:00.000Z',
+                                    parameters=[7, 193], email='user@example.com')
+
+    assert url.endswith('&user=anonymous&parameters=7,193&email=user@example.com')
+    assert '&parameters=' not in client.build_stream_query(REF_DES, 'telemetered', 'ctdbp_cdef_dcl_instrument',
+                                                           'anonymous', '2015-04-01T00:00:00.000Z',
+                                                           '2016-10-01T00:00:00.000Z')
+
+
+def test_query_urls_request_stream_parameters(monkeypatch):
+
+    client = _client(monkeypatch)
+
+    urls = client.instrument_to_query(REF_DES, 'anonymous', parameters=['pressure', 'time'])
+
+    assert len(urls) == 2
+    assert '/telemetered/ctdbp_cdef_dcl_instrument?' in urls[0]
+    assert urls[0].endswith('&parameters=7,193')
+    assert '/recovered_host/ctdbp_cdef_dcl_instrument_recovered?' in urls[1]
+    assert urls[1].endswith('&parameters=7')
+
+
+def test_query_urls_skip_streams_without_parameters(monkeypatch):
+
+    client = _client(monkeypatch)
+
+    urls = client.instrument_to_query(REF_DES, 'anonymous', parameters=['ctdbp_seawater_temperature'])
+
+    assert len(urls) == 1
+    assert urls[0].endswith('&parameters=1959')
@@ -0,0 +1,96 @@
+import os
+from m2m.RequestQueue import RequestQueue, request_key
+
+URLS = ['https://ooinet.oceanobservatories.org/api/m2m/12576/sensor/inv/CE02SHSM/RID27/03-CTDBPC000/'
+        'telemetered/ctdbp_cdef_dcl_instrument?beginDT={:d}'.format(i) for i in range(3)]
+
+
+class FakeClient(object):
+
+    def __init__(self, status_codes):
+        self.status_codes = status_codes
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        status_code = self.status_codes.get(url, 200)
+        return status_code, 'reason', {'status_code': status_code}
+
+
+def _queue(tmpdir, **kwargs):
+    return RequestQueue(os.path.join(str(tmpdir), 'queue.db'), **kwargs)
+
+
+def test_enqueue_is_idempotent(tmpdir):
+
+    queue = _queue(tmpdir)
+
+    assert queue.enqueue(URLS) == 3
+    assert queue.enqueue(URLS[:2]) == 0
+    assert queue.counts()['queued'] == 3
+
+
+def test_lease_and_complete(tmpdir):
+
+    queue = _queue(tmpdir)
+    queue.enqueue(URLS)
+
+    assert queue.lease('w0') == (request_key(URLS[0]), URLS[0])
+    assert queue.lease('w1') == (request_key(URLS[1]), URLS[1])
+    assert queue.complete(request_key(URLS[0]), 'w0', 200, 'OK', [])
+    assert queue.counts() == {'queued': 1, 'in_flight': 1, 'done': 1, 'failed': 0}
+
+
+def test_expired_lease_is_leased_again(tmpdir):
+
+    queue = _queue(tmpdir, lease_seconds=-1)
+    queue.enqueue(URLS[:1])
+
+    key = request_key(URLS[0])
+    assert queue.lease('w0') == (key, URLS[0])
+    assert queue.lease('w1') == (key, URLS[0])
+
+    # The first worker lost its lease and can not finish the request
+    assert not queue.complete(key, 'w0', 200, 'OK', [])
+    assert queue.complete(key, 'w1', 200, 'OK', [])
+    assert queue.requests(state='done')[0]['attempts'] == 2
+
+
+def test_expired_lease_fails_after_max_attempts(tmpdir):
+
+    queue = _queue(tmpdir, lease_seconds=-1, max_attempts=2)
+    queue.enqueue(URLS[:1])
+
+    assert queue.lease('w0')
+    assert queue.lease('w1')
+    assert queue.lease('w2') is None
+
+    requests = queue.requests()
+    assert requests[0]['state'] == 'failed'
+    assert requests[0]['attempts'] == 2
+
+
+def test_recover(tmpdir):
+
+    queue = _queue(tmpdir)
+    queue.enqueue(URLS)
+    queue.lease('w0')
+    queue.lease('w1')
+
+    assert queue.recover() == 2
+    assert queue.counts()['queued'] == 3
+    assert queue.lease('w0') == (request_key(URLS[0]), URLS[0])
+
+
+def test_process_retries_transient_errors_only(tmpdir):
+
+    queue = _queue(tmpdir, max_attempts=3)
+    queue.enqueue(URLS)
+    client = FakeClient({URLS[1]: 404, URLS[2]: 503})
+
+    counts = queue.process(client, workers=1)
+
+    assert counts == {'queued': 0, 'in_flight': 0, 'done': 1, 'failed': 2}
+    assert client.urls.count(URLS[1]) == 1
+    assert client.urls.count(URLS[2]) == 3
+    assert [r['status_code'] for r in queue.requests(state='failed')] == [404, 503]
@@ -0,0 +1,84 @@
+import os
+from m2m.InventorySnapshot import InventorySnapshot
+from m2m.snapshots import diff_snapshots, summarize_changes
+
+REF_DES = 'CE02SHSM-RID27-03-CTDBPC000'
+NUTNR = 'CE02SHSM-RID26-07-NUTNRB000'
+PHSEN = 'CE02SHSM-RID26-06-PHSEND000'
+
+
+def _stream(ref_des, method, stream, end='2017-06-01T00:00:00.000Z'):
+    return {'sensor': ref_des, 'method': method, 'stream': stream, 'count': 10,
+            'beginTime': '2015-04-01T00:00:00.000Z', 'endTime': end}
+
+
+def _parameter(pd_id, particle_key):
+    return {'pdId': pd_id, 'particleKey': particle_key, 'stream': 'ctdbp_cdef_dcl_instrument'}
+
+
+def _deployment(number, stop_time):
+    return {'referenceDesignator': REF_DES,
+            'deploymentNumber': number,
+            'eventStartTime': 1427846400000,
+            'eventStopTime': stop_time}
+
+
+def _snapshot(tmpdir, name, streams, parameters, deployments):
+
+    snapshot = InventorySnapshot(os.path.join(str(tmpdir), name))
+    snapshot.set_info('https://ooinet.oceanobservatories.org')
+    for ref_des, instrument_streams in streams.items():
+        snapshot.write_instrument_streams(ref_des, instrument_streams)
+    snapshot.write_instrument_parameters(REF_DES, parameters)
+    snapshot.write_deployments(deployments, ref_des=REF_DES)
+
+    return snapshot
+
+
+def test_diff_snapshots(tmpdir):
+
+    old = _snapshot(tmpdir, 'old.db',
+                    {REF_DES: [_stream(REF_DES, 'telemetered', 'ctdbp_cdef_dcl_instrument'),
+                               _stream(REF_DES, 'recovered_host', 'ctdbp_cdef_dcl_instrument_recovered')],
+                     NUTNR: [_stream(NUTNR, 'telemetered', 'nutnr_b_dcl_conc_instrument')]},
+                    [_parameter('PD7', 'time')],
+                    [_deployment(1, None)])
+    new = _snapshot(tmpdir, 'new.db',
+                    {REF_DES: [_stream(REF_DES, 'telemetered', 'ctdbp_cdef_dcl_instrument'),
+                               _stream(REF_DES, 'recovered_host', 'ctdbp_cdef_dcl_instrument_recovered',
+                                       end='2017-07-01T00:00:00.000Z')],
+                     PHSEN: [_stream(PHSEN, 'telemetered', 'phsen_abcdef_dcl_instrument')]},
+                    [_parameter('PD7', 'time'), _parameter('PD193', 'pressure')],
+                    [_deployment(1, 1496275200000), _deployment(2, None)])
+
+    changes = diff_snapshots(old, new)
+
+    assert [(c['event'], c['reference_designator']) for c in changes] == [
+        ('instrument_added', PHSEN),
+        ('stream_added', PHSEN),
+        ('instrument_removed', NUTNR),
+        ('stream_removed', NUTNR),
+        ('stream_changed', REF_DES),
+        ('stream_stalled', REF_DES),
+        ('parameter_added', REF_DES),
+        ('deployment_added', REF_DES),
+        ('deployment_closed', REF_DES)]
+
+    assert changes[4]['stream'] == 'ctdbp_cdef_dcl_instrument_recovered'
+    assert changes[5]['stream'] == 'ctdbp_cdef_dcl_instrument'
+    assert changes[6]['pdId'] == 'PD193' and changes[6]['particle_key'] == 'pressure'
+    assert changes[7]['deploymentNumber'] == 2
+    assert changes[8]['deploymentNumber'] == 1
+
+    summary = summarize_changes(changes)
+    assert summary['stream_removed'] == 1
+    assert summary['parameter_removed'] == 0
+
+
+def test_diff_identical_snapshots(tmpdir):
+
+    streams = {REF_DES: [_stream(REF_DES, 'recovered_host', 'ctdbp_cdef_dcl_instrument_recovered')]}
+    old = _snapshot(tmpdir, 'old.db', streams, [_parameter('PD7', 'time')], [_deployment(1, None)])
+    new = _snapshot(tmpdir, 'new.db', streams, [_parameter('PD7', 'time')], [_deployment(1, None)])
+
+    assert diff_snapshots(old, new) == []
@@ -0,0 +1,48 @@
+import os
+from m2m.StreamSync import StreamSync
+from m2m.timeutils import iso_to_ms
+
+KEY = ('CE02SHSM-RID27-03-CTDBPC000', 'telemetered', 'ctdbp_cdef_dcl_instrument')
+
+
+def _sync(tmpdir, end_ts):
+
+    sync = StreamSync(os.path.join(str(tmpdir), 'sync.json'))
+    sync.marks[KEY] = iso_to_ms(end_ts)
+
+    return sync
+
+
+def test_mark_is_limited_to_requested_end(tmpdir):
+
+    sync = _sync(tmpdir, '2017-01-01T00:00:00.000000Z')
+
+    begin_ts = sync.new_data_begin(*KEY,
+                                   end_time='2017-06-01T00:00:00.000Z',
+                                   begin_ts='2016-01-01T00:00:00.000000Z',
+                                   end_ts='2017-03-01T00:00:00.000000Z')
+
+    assert begin_ts == '2017-01-01T00:00:00.001000Z'
+    assert sync.pending[KEY] == iso_to_ms('2017-03-01T00:00:00Z')
+
+
+def test_mark_after_requested_end(tmpdir):
+
+    sync = _sync(tmpdir, '2017-03-01T00:00:00.000000Z')
+
+    begin_ts = sync.new_data_begin(*KEY,
+                                   end_time='2017-06-01T00:00:00.000Z',
+                                   begin_ts='2016-01-01T00:00:00.000000Z',
+                                   end_ts='2017-02-01T00:00:00.000000Z')
+
+    assert begin_ts is None
+    assert KEY not in sync.pending
+
+
+def test_stream_not_grown(tmpdir):
+
+    sync = _sync(tmpdir, '2017-06-01T00:00:00.000000Z')
+
+    assert sync.new_data_begin(*KEY,
+                               end_time='2017-06-01T00:00:00.000Z',
+                               begin_ts='2016-01-01T00:00:00.000000Z') is None